@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+
+'''
+Gera cadastros sintéticos de remédios, clientes e usuários, no formato dos arquivos do TinyDB,
+  para os testes de carga (ver benchmarks/loadtest.py).
+
+A geração é determinística: a mesma semente produz os mesmos cadastros, inclusive os IDs.
+
+* medicines.json : N remédios, cada um com o registro diário de vendas dos últimos anos até 31/12/2019.
+                   A popularidade de cada remédio segue uma distribuição log-normal, de forma que poucos
+                   remédios concentram a maior parte das vendas
+* clients.json   : M clientes, cada um com alguns remédios associados
+* users.json     : U usuários ativos, todos com a senha PASSWORD. O primeiro usuário é administrador
+
+O hash das senhas utiliza o custo configurado em GESTOR_PASSWORD_ITERATIONS. Utilize o mesmo valor ao executar
+  os testes de carga, caso contrário o primeiro login de cada usuário recalcula e grava o hash da senha.
+
+Uso (a partir da raiz do repositório):
+
+python benchmarks/dataset.py OUTPUT_DIR [--medicines N] [--clients M] [--users U] [--years Y] [--seed S]
+'''
+
+import os
+import sys
+import json
+import uuid
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+
+from werkzeug.security import generate_password_hash
+
+
+# Senha de todos os usuários gerados
+PASSWORD = 'benchmark'
+
+# Último dia dos registros de vendas gerados
+LAST_SALES_DAY = datetime.date(2019, 12, 31)
+
+TYPES = ['Comprimido', 'Cápsula', 'Xarope', 'Pomada', 'Gotas', 'Injetável']
+DOSAGE_UNITS = ['mg', 'ml', 'g']
+
+
+def make_id(rng):
+	'''
+	Retorna um UUID versão 4 obtido do gerador de números aleatórios passado.
+	'''
+	return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def sales_days(years):
+	'''
+	Retorna as datas, no formato 'aaaammdd', dos dias com registro de vendas.
+	'''
+	first_day = LAST_SALES_DAY - datetime.timedelta(days=int(365 * years) - 1)
+
+	return [(first_day + datetime.timedelta(days=i)).strftime('%Y%m%d') for i in range((LAST_SALES_DAY - first_day).days + 1)]
+
+
+def make_medicines(rng, count, years):
+	'''
+	Gera os remédios, com o registro de vendas de cada dia.
+	'''
+	days = sales_days(years)
+	manufacturers = [f'Fabricante {i:02d}' for i in range(max(1, count // 20))]
+
+	medicines = []
+	for i in range(count):
+		# Média de unidades vendidas por dia e probabilidade de haver venda em um dia
+		rate = rng.lognormvariate(0, 1.2)
+		probability = min(1.0, 0.2 + rate / 4)
+
+		sales = {}
+		for day in days:
+			if rng.random() < probability:
+				sales[day] = 1 + int(rng.expovariate(1 / rate))
+
+		medicines.append({
+			'id'			: make_id(rng),
+			'name'			: f'Remédio {i:05d}',
+			'type'			: rng.choice(TYPES),
+			'dosage'		: f'{rng.choice([5, 10, 20, 50, 100, 250, 500])}{rng.choice(DOSAGE_UNITS)}',
+			'price'			: round(rng.uniform(2, 300), 2),
+			'manufacturer'	: rng.choice(manufacturers),
+			'sales'			: sales
+		})
+
+	return medicines
+
+
+def make_clients(rng, count, medicine_ids):
+	'''
+	Gera os clientes, cada um com até 5 remédios associados.
+	'''
+	clients = []
+	for i in range(count):
+		clients.append({
+			'id'			: make_id(rng),
+			'name'			: f'Cliente {i:06d}',
+			'phonenumber'	: ''.join(rng.choice('0123456789') for _ in range(11)),
+			'medicines'		: rng.sample(medicine_ids, min(len(medicine_ids), rng.randint(0, 5)))
+		})
+
+	return clients
+
+
+def make_users(rng, count):
+	'''
+	Gera os usuários. Todos compartilham o mesmo hash de senha, calculado uma única vez.
+	'''
+	from passwords import PASSWORD_METHOD
+
+	pwhash = generate_password_hash(PASSWORD, method=PASSWORD_METHOD)
+
+	users = []
+	for i in range(count):
+		users.append({
+			'id'		: make_id(rng),
+			'username'	: f'usuario{i:05d}',
+			'password'	: pwhash,
+			'status'	: 'active',
+			'admin'		: i == 0
+		})
+
+	return users
+
+
+def write_table(path, documents):
+	'''
+	Grava os documentos no formato do TinyDB, com doc_ids sequenciais.
+	'''
+	with open(path, 'w', encoding='utf-8') as f:
+		json.dump({'_default': {str(doc_id): document for doc_id, document in enumerate(documents, 1)}}, f)
+
+
+def generate(output_dir, medicines=1000, clients=5000, users=200, years=2, seed=0):
+	'''
+	Gera os cadastros no diretório passado, substituindo os arquivos existentes.
+
+	Retorna um dicionário com os parâmetros da geração, também gravado em dataset.json no diretório.
+	'''
+	os.makedirs(output_dir, exist_ok=True)
+
+	rng = random.Random(seed)
+	medicine_docs = make_medicines(rng, medicines, years)
+	client_docs = make_clients(rng, clients, [medicine['id'] for medicine in medicine_docs])
+	user_docs = make_users(rng, users)
+
+	write_table(os.path.join(output_dir, 'medicines.json'), medicine_docs)
+	write_table(os.path.join(output_dir, 'clients.json'), client_docs)
+	write_table(os.path.join(output_dir, 'users.json'), user_docs)
+
+	manifest = {
+		'medicines'		: medicines,
+		'clients'		: clients,
+		'users'			: users,
+		'years'			: years,
+		'seed'			: seed,
+		'sales'			: sum(len(medicine['sales']) for medicine in medicine_docs),
+		'first_day'		: sales_days(years)[0],
+		'last_day'		: LAST_SALES_DAY.strftime('%Y%m%d'),
+		'password'		: PASSWORD
+	}
+	with open(os.path.join(output_dir, 'dataset.json'), 'w', encoding='utf-8') as f:
+		json.dump(manifest, f, indent=4)
+
+	return manifest
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Gerador de cadastros sintéticos para os testes de carga')
+	parser.add_argument('output', help='diretório onde os cadastros são gravados')
+	parser.add_argument('--medicines', type=int, default=1000, help='número de remédios')
+	parser.add_argument('--clients', type=int, default=5000, help='número de clientes')
+	parser.add_argument('--users', type=int, default=200, help='número de usuários')
+	parser.add_argument('--years', type=float, default=2, help='anos de registro diário de vendas de cada remédio')
+	parser.add_argument('--seed', type=int, default=0, help='semente do gerador de números aleatórios')
+	args = parser.parse_args()
+
+	manifest = generate(args.output, args.medicines, args.clients, args.users, args.years, args.seed)
+
+	print(f'{manifest["medicines"]} remédios ({manifest["sales"]} registros de vendas), {manifest["clients"]} clientes '
+		f'e {manifest["users"]} usuários gravados em {args.output}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,281 @@
+# -*- coding:utf-8 -*-
+
+'''
+Micro-benchmark das operações da classe DBInterface (ver services/dbinterface.py), com cadastros de vários tamanhos.
+
+Para cada tamanho, um cadastro sintético é gravado em um diretório temporário e carregado com o modo de armazenamento
+  escolhido. São medidas, nesta ordem:
+
+* create       : create_element
+* get_by_id    : get_element pelo ID
+* get_by_field : get_element por um campo indexado (manufacturer)
+* scan_by_field: get_element por um campo sem índice (name), que percorre o cadastro. Cada chamada consulta um
+                 valor diferente, para que nenhum cache de consultas seja medido
+* update       : update_element pelo ID
+* get_all      : get_all_elements
+* delete       : delete_element pelo ID
+
+O resultado de cada operação é a mediana e a média, em microssegundos, do tempo de cada chamada. Com --save, o
+  resultado é gravado em JSON e pode ser utilizado como referência; com --baseline, cada operação é comparada à
+  referência e o script termina com código 1 caso alguma fique mais lenta que o limite de --threshold.
+
+O módulo também pode ser importado (ex.: from benchmarks.dbinterface_ops import run_benchmarks, find_regressions).
+
+Uso (a partir da raiz do repositório):
+
+python benchmarks/dbinterface_ops.py [--sizes 1000,10000,100000] [--ops N] [--storage-mode MODE] [--multiprocess]
+	[--dir DIR] [--seed S] [--label LABEL] [--save FILE] [--baseline FILE] [--threshold PCT]
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+sys.path.insert(0, SERVICES_DIR)
+
+import utils
+import migrate
+from dbinterface import DBInterface
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+OPERATIONS = ['create', 'get_by_id', 'get_by_field', 'scan_by_field', 'update', 'get_all', 'delete']
+
+# Nome e campos do cadastro utilizado nas medidas
+DBNAME = 'benchmark'
+FIELDS = ['name', 'type', 'dosage', 'price', 'manufacturer']
+INDEXES = ['manufacturer']
+
+TYPES = ['Comprimido', 'Cápsula', 'Xarope', 'Pomada', 'Gotas', 'Injetável']
+
+
+def make_element(rng, i):
+	'''
+	Retorna um elemento sintético do cadastro, sem ID.
+	'''
+	return {
+		'name'			: f'Remédio {i:06d}',
+		'type'			: rng.choice(TYPES),
+		'dosage'		: f'{rng.choice([5, 10, 20, 50, 100, 250, 500])}mg',
+		'price'			: round(rng.uniform(2, 300), 2),
+		'manufacturer'	: f'Fabricante {rng.randrange(100):02d}'
+	}
+
+
+def write_table(path, rng, size):
+	'''
+	Grava um cadastro com size elementos no formato do TinyDB e retorna os IDs dos elementos.
+	'''
+	ids = [f'{i:08x}-0000-4000-8000-{rng.getrandbits(48):012x}' for i in range(size)]
+	table = {str(doc_id): {'id': element_id, **make_element(rng, doc_id)} for doc_id, element_id in enumerate(ids, 1)}
+
+	with open(path, 'w', encoding='utf-8') as f:
+		json.dump({'_default': table}, f)
+
+	return ids
+
+
+def timed(func, args_list):
+	'''
+	Executa a função com cada tupla de argumentos passada e retorna o tempo, em segundos, de cada chamada.
+
+	Uma chamada que retorna -1 indica erro da DBInterface e interrompe a medida.
+	'''
+	elapsed = []
+	for args in args_list:
+		start = time.perf_counter()
+		result = func(*args)
+		elapsed.append(time.perf_counter() - start)
+
+		if isinstance(result, int) and result == -1:
+			raise RuntimeError(f'{func.__name__}{args} failed')
+
+	return elapsed
+
+
+def benchmark_size(directory, size, ops, storage_mode, multiprocess, seed):
+	'''
+	Mede as operações em um cadastro com size elementos, gravado no diretório passado.
+
+	Retorna um dicionário operação -> estatísticas, com os tempos em microssegundos.
+	'''
+	rng = random.Random(f'{seed}-{size}')
+	ids = write_table(os.path.join(directory, f'{DBNAME}.json'), rng, size)
+
+	if storage_mode == 'sqlite':
+		migrate.migrate(DBNAME)
+
+	db = DBInterface(DBNAME, FIELDS, indexes=INDEXES, storage_mode=storage_mode, multiprocess=multiprocess)
+
+	# get_all copia o cadastro inteiro e é medido menos vezes
+	get_all_ops = max(1, ops // 20)
+	deleted = rng.sample(ids, min(ops, size))
+
+	# Nomes distintos dos elementos gravados, um por consulta de scan_by_field
+	scanned = rng.sample(range(1, size + 1), min(ops, size))
+
+	try:
+		elapsed = {
+			'create'		: timed(db.create_element, [(make_element(rng, size + i),) for i in range(ops)]),
+			'get_by_id'		: timed(db.get_element, [('id', rng.choice(ids)) for _ in range(ops)]),
+			'get_by_field'	: timed(db.get_element, [('manufacturer', f'Fabricante {rng.randrange(100):02d}') for _ in range(ops)]),
+			'scan_by_field'	: timed(db.get_element, [('name', f'Remédio {i:06d}') for i in scanned]),
+			'update'		: timed(db.update_element, [({'price': round(rng.uniform(2, 300), 2)}, 'id', rng.choice(ids)) for _ in range(ops)]),
+			'get_all'		: timed(db.get_all_elements, [() for _ in range(get_all_ops)]),
+			'delete'		: timed(db.delete_element, [('id', element_id) for element_id in deleted])
+		}
+
+	finally:
+		db.close()
+
+	return {
+		operation: {
+			'ops'		: len(values),
+			'median_us'	: 1e6 * statistics.median(values),
+			'mean_us'	: 1e6 * statistics.fmean(values)
+		}
+		for operation, values in elapsed.items()
+	}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, ops=100, storage_mode=None, multiprocess=False, directory=None, seed=0):
+	'''
+	Mede as operações da DBInterface com cadastros de cada tamanho passado.
+
+	* sizes        : números de elementos dos cadastros
+	* ops          : número de chamadas medidas de cada operação (get_all é medida ops // 20 vezes)
+	* storage_mode : modo de armazenamento. Caso não seja passado, utiliza DB_STORAGE_MODE
+	* multiprocess : se verdadeiro, utiliza o modo multiprocesso da DBInterface
+	* directory    : diretório onde os cadastros temporários são criados. Caso não seja passado, utiliza o diretório temporário do sistema
+	* seed         : semente dos cadastros e das consultas sorteadas
+
+	Retorna um dicionário tamanho (str) -> operação -> estatísticas, com os tempos em microssegundos.
+	'''
+	storage_mode = storage_mode or utils.DB_STORAGE_MODE
+
+	results = {}
+	for size in sizes:
+		work_dir = tempfile.mkdtemp(prefix='gestor-dbbench-', dir=directory)
+
+		# A DBInterface e a migração obtêm o diretório dos cadastros a cada chamada
+		db_dir = utils.DB_DIR
+		utils.DB_DIR = work_dir
+		try:
+			results[str(size)] = benchmark_size(work_dir, size, ops, storage_mode, multiprocess, seed)
+
+		finally:
+			utils.DB_DIR = db_dir
+			shutil.rmtree(work_dir, ignore_errors=True)
+
+	return results
+
+
+def find_regressions(baseline, results, threshold):
+	'''
+	Compara os resultados com uma referência e retorna as operações cuja mediana piorou mais que threshold por cento,
+	  como uma lista de tuplas (tamanho, operação, mediana da referência, mediana atual, variação percentual).
+
+	Tamanhos e operações ausentes em um dos resultados são ignorados.
+	'''
+	regressions = []
+	for size, operations in results.items():
+		for operation, result in operations.items():
+			old = baseline.get(size, {}).get(operation)
+			if not old or not old['median_us']:
+				continue
+
+			change = 100 * (result['median_us'] - old['median_us']) / old['median_us']
+			if change > threshold:
+				regressions.append((size, operation, old['median_us'], result['median_us'], change))
+
+	return regressions
+
+
+def print_report(results, baseline=None):
+	print(f'{"tamanho":>9}  {"operação":<14}{"chamadas":>9}{"mediana":>12}{"média":>12}   (µs)' + ('   variação' if baseline else ''))
+	for size, operations in results.items():
+		for operation, result in operations.items():
+			line = f'{size:>9}  {operation:<14}{result["ops"]:>9}{result["median_us"]:>12.1f}{result["mean_us"]:>12.1f}'
+
+			old = (baseline or {}).get(size, {}).get(operation)
+			if old and old['median_us']:
+				line += f'{100 * (result["median_us"] - old["median_us"]) / old["median_us"]:>+15.1f}%'
+
+			print(line)
+
+
+def git_revision():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICES_DIR, capture_output=True, text=True).stdout.strip() or None
+
+	except OSError:
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Micro-benchmark das operações da DBInterface')
+	parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='números de elementos dos cadastros, separados por vírgula')
+	parser.add_argument('--ops', type=int, default=100, help='número de chamadas medidas de cada operação')
+	parser.add_argument('--storage-mode', default=utils.DB_STORAGE_MODE, help='modo de armazenamento (padrão: GESTOR_DB_STORAGE_MODE)')
+	parser.add_argument('--multiprocess', action='store_true', help='utiliza o modo multiprocesso da DBInterface')
+	parser.add_argument('--dir', default=utils.DB_DIR, help='diretório onde os cadastros temporários são criados (padrão: GESTOR_DB_DIR ou o diretório temporário do sistema)')
+	parser.add_argument('--seed', type=int, default=0, help='semente dos cadastros e das consultas sorteadas')
+	parser.add_argument('--label', help='identificação da execução no resultado gravado')
+	parser.add_argument('--save', help='arquivo JSON onde o resultado é gravado, para uso como referência')
+	parser.add_argument('--baseline', help='arquivo JSON de referência a ser comparado')
+	parser.add_argument('--threshold', type=float, default=25, help='piora percentual máxima da mediana em relação à referência (padrão: 25)')
+	args = parser.parse_args()
+
+	sizes = [int(size) for size in args.sizes.split(',')]
+
+	baseline = None
+	if args.baseline:
+		with open(args.baseline, 'r', encoding='utf-8') as f:
+			baseline = json.load(f)
+
+	print(f'armazenamento {args.storage_mode}{" multiprocesso" if args.multiprocess else ""}, {args.ops} chamadas por operação\n')
+
+	results = run_benchmarks(sizes, args.ops, args.storage_mode, args.multiprocess, args.dir, args.seed)
+	print_report(results, baseline['results'] if baseline else None)
+
+	if args.save:
+		meta = {
+			'label'			: args.label,
+			'timestamp'		: time.strftime('%Y-%m-%dT%H:%M:%S'),
+			'revision'		: git_revision(),
+			'python'		: platform.python_version(),
+			'storage_mode'	: args.storage_mode,
+			'multiprocess'	: args.multiprocess,
+			'durability'	: utils.DB_DURABILITY,
+			'json_provider'	: utils.json_provider.name,
+			'ops'			: args.ops,
+			'seed'			: args.seed
+		}
+		with open(args.save, 'w', encoding='utf-8') as f:
+			json.dump({'meta': meta, 'results': results}, f, indent=4)
+
+	if baseline:
+		regressions = find_regressions(baseline['results'], results, args.threshold)
+		if regressions:
+			print(f'\n{len(regressions)} operações pioraram mais de {args.threshold:g}% em relação a {baseline["meta"].get("label") or baseline["meta"]["timestamp"]}:')
+			for size, operation, old, new, change in regressions:
+				print(f'  {operation} com {size} elementos: {old:.1f} µs -> {new:.1f} µs ({change:+.1f}%)')
+
+			sys.exit(1)
+
+		print(f'\nnenhuma operação piorou mais de {args.threshold:g}%')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+
+'''
+Compara o desempenho dos provedores de serialização JSON disponíveis (ver services/jsonprovider.py)
+  com cadastros de remédios sintéticos.
+
+São medidas as operações realizadas pela API:
+
+* response : serialização da listagem de remédios, como nas respostas da API
+* storage  : serialização do cadastro no formato do TinyDB, com doc_ids inteiros como chaves
+* load     : leitura do arquivo do cadastro
+
+Uso (a partir da raiz do repositório):
+
+python benchmarks/json_providers.py [--medicines N] [--sales N] [--repeat N]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+
+from jsonprovider import make_provider
+
+
+def make_medicines(count, sales_days, seed=0):
+	'''
+	Gera remédios sintéticos no formato retornado pela API, cada um com sales_days dias de vendas.
+	'''
+	rng = random.Random(seed)
+	medicines = []
+	for i in range(count):
+		medicines.append({
+			'uri'			: f'http://localhost:5001/gestor/medicines/{i:08d}-0000-4000-8000-000000000000',
+			'name'			: f'Remédio {i}',
+			'type'			: rng.choice(['Comprimido', 'Xarope', 'Pomada']),
+			'dosage'		: f'{rng.randint(1, 1000)}mg',
+			'price'			: round(rng.uniform(1, 200), 2),
+			'manufacturer'	: f'Fabricante {rng.randint(1, 50)}',
+			'sales'			: {f'2020{(day // 28) % 12 + 1:02d}{day % 28 + 1:02d}': rng.randint(1, 100) for day in range(sales_days)}
+		})
+
+	return medicines
+
+
+def measure(func, repeat):
+	'''
+	Retorna o menor tempo, em segundos, entre repeat execuções da função.
+	'''
+	best = float('inf')
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		best = min(best, time.perf_counter() - start)
+
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark dos provedores de serialização JSON')
+	parser.add_argument('--medicines', type=int, default=2000, help='número de remédios do cadastro')
+	parser.add_argument('--sales', type=int, default=300, help='número de dias de vendas de cada remédio')
+	parser.add_argument('--repeat', type=int, default=5, help='número de repetições de cada medida')
+	args = parser.parse_args()
+
+	medicines = make_medicines(args.medicines, args.sales)
+	table = {'_default': {doc_id: medicine for doc_id, medicine in enumerate(medicines, 1)}}
+
+	providers = []
+	for name in ('stdlib', 'orjson'):
+		try:
+			providers.append(make_provider(name))
+
+		except ValueError:
+			print(f'{name}: não instalado, ignorado')
+
+	print(f'{args.medicines} remédios, {args.sales} dias de vendas cada, melhor de {args.repeat} execuções\n')
+	print(f'{"provedor":<10}{"response (s)":>14}{"storage (s)":>14}{"load (s)":>14}{"MB":>8}')
+
+	results = {}
+	for provider in providers:
+		serialized = provider.dumps(table)
+		results[provider.name] = (
+			measure(lambda: provider.dumps({'medicines': medicines}, sort_keys=True), args.repeat),
+			measure(lambda: provider.dumps(table), args.repeat),
+			measure(lambda: provider.loads(serialized), args.repeat)
+		)
+		print(f'{provider.name:<10}' + ''.join(f'{value:>14.4f}' for value in results[provider.name]) + f'{len(serialized) / 1e6:>8.1f}')
+
+	if len(results) == 2:
+		speedups = [stdlib / fast for stdlib, fast in zip(results['stdlib'], results['orjson'])]
+		print(f'\n{"ganho":<10}' + ''.join(f'{speedup:>13.1f}x' for speedup in speedups))
+
+
+if __name__ == '__main__':
+	main()
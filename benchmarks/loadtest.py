@@ -0,0 +1,368 @@
+# -*- coding:utf-8 -*-
+
+'''
+Teste de carga dos serviços da API, executado através dos clientes de teste do Flask, sem servidor HTTP.
+
+Os serviços são carregados sobre uma cópia temporária dos cadastros gerados por benchmarks/dataset.py,
+  de forma que o diretório do conjunto de dados não é alterado e todas as execuções partem do mesmo estado.
+As configurações dos serviços (modo de armazenamento, provedor JSON etc.) são lidas das variáveis de ambiente
+  GESTOR_* normalmente.
+
+Cada thread executa requisições sorteadas de acordo com a mistura passada em --mix, no formato operação=peso:
+
+* login        : POST /gestor/login com um usuário aleatório
+* get          : GET de um remédio (70%) ou de um cliente (30%) pelo ID
+* list         : GET /gestor/medicines paginado, a partir de um remédio aleatório
+* sales        : PUT /gestor/medicines/<id>/sales com as vendas de um dia
+* csv          : POST /gestor/medicines/sales com um arquivo CSV de 20 remédios e 3 dias
+* mostconsumed : GET /gestor/medicines/mostconsumed em um intervalo aleatório de 30 dias
+
+O relatório apresenta, para cada operação, a vazão e as latências p50, p95 e p99. Com --output, o resultado é
+  gravado em JSON; com --compare, é comparado a um resultado gravado anteriormente.
+
+Uso (a partir da raiz do repositório):
+
+python benchmarks/dataset.py /tmp/gestor-dataset
+python benchmarks/loadtest.py /tmp/gestor-dataset [--threads N] [--requests N | --duration S] [--mix MIX]
+	[--warmup N] [--seed S] [--output FILE] [--compare FILE]
+'''
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import base64
+import random
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+
+SERVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services')
+
+sys.path.insert(0, SERVICES_DIR)
+
+
+DEFAULT_MIX = 'login=2,get=40,list=15,sales=20,csv=3,mostconsumed=20'
+
+OPERATIONS = ['login', 'get', 'list', 'sales', 'csv', 'mostconsumed']
+
+PERCENTILES = [50, 95, 99]
+
+
+def parse_mix(mix):
+	'''
+	Converte a mistura de requisições do formato 'operação=peso,...' em um dicionário operação -> peso.
+	'''
+	weights = {}
+	for item in mix.split(','):
+		operation, _, weight = item.partition('=')
+		if operation not in OPERATIONS:
+			raise ValueError(f'Invalid operation: {operation}')
+
+		weights[operation] = float(weight)
+
+	return weights
+
+
+def percentile(values, p):
+	'''
+	Retorna o percentil p (método nearest-rank) dos valores passados, já ordenados.
+	'''
+	if not values:
+		return 0.0
+
+	return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def basic_auth(username, password):
+	'''
+	Retorna o cabeçalho de autenticação Basic para o usuário passado.
+	'''
+	credentials = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
+
+	return {'Authorization': f'Basic {credentials}'}
+
+
+def load_ids(dataset_dir, dbname, field='id'):
+	'''
+	Retorna os valores do campo passado de todos os elementos do cadastro.
+	'''
+	with open(os.path.join(dataset_dir, f'{dbname}.json'), 'r', encoding='utf-8') as f:
+		return [document[field] for document in json.load(f)['_default'].values()]
+
+
+class Workload():
+	'''
+	Requisições do teste de carga. Cada thread utiliza seus próprios clientes de teste e gerador de números aleatórios.
+	'''
+
+	def __init__(self, services, dataset_dir, manifest):
+		self.users, self.medicines, self.clients = services
+		self.password = manifest['password']
+
+		self.usernames = load_ids(dataset_dir, 'users', 'username')
+		self.medicine_ids = sorted(load_ids(dataset_dir, 'medicines'))
+		self.client_ids = load_ids(dataset_dir, 'clients')
+
+		first_day = datetime.datetime.strptime(manifest['first_day'], '%Y%m%d').date()
+		last_day = datetime.datetime.strptime(manifest['last_day'], '%Y%m%d').date()
+		self.days = [(first_day + datetime.timedelta(days=i)).strftime('%Y%m%d') for i in range((last_day - first_day).days + 1)]
+
+		# Token de um administrador, utilizado nas requisições autenticadas
+		response = self.users.api.test_client().post('/gestor/login', headers=basic_auth(self.usernames[0], self.password))
+		if response.status_code != 200:
+			raise RuntimeError(f'Login failed with status {response.status_code}')
+
+		self.headers = {'x-access-token': response.get_json()['token']}
+
+
+	def clients_for_thread(self):
+		return self.users.api.test_client(), self.medicines.api.test_client(), self.clients.api.test_client()
+
+
+	def run(self, operation, test_clients, rng):
+		'''
+		Executa uma requisição da operação passada e retorna o código de status da resposta.
+		'''
+		users_client, medicines_client, clients_client = test_clients
+
+		if operation == 'login':
+			response = users_client.post('/gestor/login', headers=basic_auth(rng.choice(self.usernames), self.password))
+
+		elif operation == 'get':
+			if rng.random() < 0.7:
+				response = medicines_client.get(f'/gestor/medicines/{rng.choice(self.medicine_ids)}', headers=self.headers)
+
+			else:
+				response = clients_client.get(f'/gestor/clients/{rng.choice(self.client_ids)}', headers=self.headers)
+
+		elif operation == 'list':
+			cursor = rng.choice(self.medicine_ids)
+			response = medicines_client.get(f'/gestor/medicines?limit=50&cursor={cursor}', headers=self.headers)
+
+		elif operation == 'sales':
+			sales = {rng.choice(self.days): rng.randint(0, 50)}
+			response = medicines_client.put(f'/gestor/medicines/{rng.choice(self.medicine_ids)}/sales', json=sales, headers=self.headers)
+
+		elif operation == 'csv':
+			days = rng.sample(self.days, 3)
+			rows = ['id,' + ','.join(days)]
+			for medicine_id in rng.sample(self.medicine_ids, min(20, len(self.medicine_ids))):
+				rows.append(medicine_id + ',' + ','.join(str(rng.randint(0, 50)) for _ in days))
+
+			data = {'file': (io.BytesIO('\n'.join(rows).encode('utf-8')), 'sales.csv')}
+			response = medicines_client.post('/gestor/medicines/sales', data=data, headers=self.headers, content_type='multipart/form-data')
+
+		elif operation == 'mostconsumed':
+			begin = rng.randrange(max(1, len(self.days) - 30))
+			query = {'most': 10, 'begin': self.days[begin], 'end': self.days[min(begin + 29, len(self.days) - 1)]}
+			response = medicines_client.get('/gestor/medicines/mostconsumed', json=query)
+
+		return response.status_code
+
+
+def run_load(workload, weights, threads, requests, duration, warmup, seed):
+	'''
+	Executa o aquecimento e o teste de carga. Retorna as latências, em segundos, e o número de erros de cada operação,
+	  e a duração, em segundos, do teste.
+	'''
+	operations = list(weights)
+	operation_weights = [weights[operation] for operation in operations]
+
+	latencies = {operation: [] for operation in operations}
+	errors = {operation: 0 for operation in operations}
+	lock = threading.Lock()
+
+	def run_phase(phase, count, deadline, record):
+		remaining = [count]
+
+		def worker(index):
+			rng = random.Random(f'{seed}-{phase}-{index}')
+			test_clients = workload.clients_for_thread()
+
+			while True:
+				if count is not None:
+					with lock:
+						if remaining[0] <= 0:
+							return
+
+						remaining[0] -= 1
+
+				elif time.perf_counter() >= deadline:
+					return
+
+				operation = rng.choices(operations, operation_weights)[0]
+
+				start = time.perf_counter()
+				status = workload.run(operation, test_clients, rng)
+				elapsed = time.perf_counter() - start
+
+				if record:
+					with lock:
+						latencies[operation].append(elapsed)
+						if status >= 400:
+							errors[operation] += 1
+
+		workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+		for thread in workers:
+			thread.start()
+
+		for thread in workers:
+			thread.join()
+
+	if warmup:
+		run_phase('warmup', warmup, None, False)
+
+	start = time.perf_counter()
+	if requests:
+		run_phase('run', requests, None, True)
+
+	else:
+		run_phase('run', None, start + duration, True)
+
+	return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+	'''
+	Calcula as estatísticas de cada operação e do total, com as latências em milissegundos.
+	'''
+	def stats(values, error_count):
+		values = sorted(values)
+		result = {
+			'requests'		: len(values),
+			'errors'		: error_count,
+			'throughput'	: len(values) / elapsed if elapsed else 0.0,
+			'mean_ms'		: 1000 * sum(values) / len(values) if values else 0.0,
+			'max_ms'		: 1000 * values[-1] if values else 0.0
+		}
+		for p in PERCENTILES:
+			result[f'p{p}_ms'] = 1000 * percentile(values, p)
+
+		return result
+
+	results = {operation: stats(values, errors[operation]) for operation, values in latencies.items()}
+	results['total'] = stats([value for values in latencies.values() for value in values], sum(errors.values()))
+
+	return results
+
+
+def print_report(results):
+	print(f'{"operação":<14}{"req":>8}{"erros":>7}{"req/s":>10}{"média":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"máx":>10}   (ms)')
+	for operation, result in results.items():
+		print(f'{operation:<14}{result["requests"]:>8}{result["errors"]:>7}{result["throughput"]:>10.1f}{result["mean_ms"]:>10.2f}'
+			+ ''.join(f'{result[f"p{p}_ms"]:>10.2f}' for p in PERCENTILES) + f'{result["max_ms"]:>10.2f}')
+
+
+def print_comparison(baseline, results):
+	'''
+	Apresenta a variação percentual da vazão e das latências em relação a um resultado anterior.
+	Valores positivos nas latências indicam piora; na vazão, melhora.
+	'''
+	print(f'\ncomparação com {baseline["meta"].get("label") or baseline["meta"]["timestamp"]}')
+	print(f'{"operação":<14}{"req/s":>10}' + ''.join(f'{f"p{p}":>10}' for p in PERCENTILES))
+
+	for operation, result in results.items():
+		old = baseline['results'].get(operation)
+		if old is None:
+			continue
+
+		def delta(key):
+			return f'{100 * (result[key] - old[key]) / old[key]:>+9.1f}%' if old[key] else f'{"-":>10}'
+
+		print(f'{operation:<14}{delta("throughput")}' + ''.join(delta(f'p{p}_ms') for p in PERCENTILES))
+
+
+def git_revision():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICES_DIR, capture_output=True, text=True).stdout.strip() or None
+
+	except OSError:
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Teste de carga dos serviços da API')
+	parser.add_argument('dataset', help='diretório dos cadastros gerados por benchmarks/dataset.py')
+	parser.add_argument('--threads', type=int, default=8, help='número de threads executando requisições')
+	parser.add_argument('--requests', type=int, default=2000, help='número de requisições medidas. 0 utiliza --duration')
+	parser.add_argument('--duration', type=float, default=30, help='duração, em segundos, quando --requests é 0')
+	parser.add_argument('--warmup', type=int, default=100, help='número de requisições de aquecimento, não medidas')
+	parser.add_argument('--mix', default=DEFAULT_MIX, help=f'pesos de cada operação (padrão: {DEFAULT_MIX})')
+	parser.add_argument('--seed', type=int, default=0, help='semente das requisições sorteadas')
+	parser.add_argument('--label', help='identificação da execução no resultado gravado')
+	parser.add_argument('--output', help='arquivo JSON onde o resultado é gravado')
+	parser.add_argument('--compare', help='arquivo JSON de um resultado anterior a ser comparado')
+	args = parser.parse_args()
+
+	weights = parse_mix(args.mix)
+
+	with open(os.path.join(args.dataset, 'dataset.json'), 'r', encoding='utf-8') as f:
+		manifest = json.load(f)
+
+	work_dir = tempfile.mkdtemp(prefix='gestor-loadtest-')
+	for dbname in ('medicines', 'clients', 'users'):
+		shutil.copy(os.path.join(args.dataset, f'{dbname}.json'), work_dir)
+
+	# Os serviços leem a configuração ao serem importados
+	os.environ['GESTOR_DB_DIR'] = work_dir
+
+	import utils
+
+	if utils.DB_STORAGE_MODE == 'sqlite':
+		import migrate
+		for dbname in migrate.DBNAMES:
+			migrate.migrate(dbname)
+
+	import users, medicines, clients
+
+	try:
+		workload = Workload((users, medicines, clients), args.dataset, manifest)
+		latencies, errors, elapsed = run_load(workload, weights, args.threads, args.requests, args.duration, args.warmup, args.seed)
+
+	finally:
+		for db in (users.users, medicines.medicines, clients.clients):
+			db.close()
+
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	results = summarize(latencies, errors, elapsed)
+
+	meta = {
+		'label'			: args.label,
+		'timestamp'		: time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'revision'		: git_revision(),
+		'python'		: platform.python_version(),
+		'storage_mode'	: utils.DB_STORAGE_MODE,
+		'json_provider'	: utils.json_provider.name,
+		'threads'		: args.threads,
+		'requests'		: args.requests,
+		'duration'		: args.duration if not args.requests else None,
+		'warmup'		: args.warmup,
+		'mix'			: weights,
+		'seed'			: args.seed,
+		'dataset'		: manifest,
+		'elapsed'		: elapsed
+	}
+
+	print(f'{manifest["medicines"]} remédios, {manifest["clients"]} clientes, {manifest["users"]} usuários; '
+		f'armazenamento {meta["storage_mode"]}, {args.threads} threads, {elapsed:.1f} s\n')
+	print_report(results)
+
+	if args.compare:
+		with open(args.compare, 'r', encoding='utf-8') as f:
+			print_comparison(json.load(f), results)
+
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump({'meta': meta, 'results': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,328 @@
+# -*- coding:utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from processes import FileLock
+
+
+class LRUCache():
+	'''
+	Cache em memória de tamanho limitado, que descarta os elementos menos utilizados recentemente.
+
+	Cada elemento pode ser armazenado junto a uma variante (ex.: o host da requisição). Uma consulta
+	  com variante diferente da armazenada é contabilizada como falha.
+
+	Para evitar que um valor lido do banco antes de uma alteração seja armazenado depois que o elemento
+	  foi invalidado, deve-se obter um token com token() antes de ler o banco e passá-lo para put().
+	'''
+
+	def __init__(self, maxsize):
+		'''
+		Construtor da classe
+
+		* maxsize : número máximo de elementos no cache
+		'''
+		self.__maxsize = maxsize
+		self.__entries = OrderedDict()
+		self.__lock = threading.Lock()
+
+		# Contador de invalidações e últimas invalidações de cada chave, utilizados para validar os tokens
+		self.__counter = 0
+		self.__invalidations = OrderedDict()
+		self.__horizon = 0
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def token(self):
+		'''
+		Retorna o token a ser passado para put() com o valor lido do banco a partir deste momento.
+		'''
+		return self.__counter
+
+
+	def get(self, key, variant=None):
+		'''
+		Retorna o valor armazenado para a chave, ou None caso ele não exista.
+
+		* key     : chave do elemento
+		* variant : variante desejada do elemento
+		'''
+		with self.__lock:
+			entry = self.__entries.get(key)
+			if entry is None or entry[0] != variant:
+				self.misses += 1
+				return None
+
+			self.__entries.move_to_end(key)
+			self.hits += 1
+
+			return entry[1]
+
+
+	def put(self, key, value, token, variant=None):
+		'''
+		Armazena o valor para a chave, caso a chave não tenha sido invalidada depois da obtenção do token.
+
+		* key     : chave do elemento
+		* value   : valor a ser armazenado
+		* token   : token obtido com token() antes da leitura do valor
+		* variant : variante do valor
+		'''
+		with self.__lock:
+			if token < self.__horizon or self.__invalidations.get(key, -1) > token:
+				return
+
+			self.__entries[key] = (variant, value)
+			self.__entries.move_to_end(key)
+
+			if len(self.__entries) > self.__maxsize:
+				self.__entries.popitem(last=False)
+				self.evictions += 1
+
+
+	def invalidate(self, keys):
+		'''
+		Remove do cache os elementos com as chaves passadas.
+
+		* keys : chaves dos elementos
+		'''
+		with self.__lock:
+			for key in keys:
+				self.__entries.pop(key, None)
+
+				self.__counter += 1
+				self.__invalidations[key] = self.__counter
+				self.__invalidations.move_to_end(key)
+
+				# Apenas as invalidações mais recentes são mantidas. Tokens anteriores à mais antiga
+				#   delas são recusados
+				if len(self.__invalidations) > self.__maxsize:
+					forgotten, counter = self.__invalidations.popitem(last=False)
+					self.__horizon = counter
+
+
+	def clear(self):
+		'''
+		Remove todos os elementos do cache.
+		'''
+		with self.__lock:
+			self.__entries.clear()
+			self.__counter += 1
+			self.__invalidations.clear()
+			self.__horizon = self.__counter
+
+
+	def stats(self):
+		'''
+		Retorna os contadores do cache.
+		'''
+		with self.__lock:
+			return {
+				'size'		: len(self.__entries),
+				'maxsize'	: self.__maxsize,
+				'hits'		: self.hits,
+				'misses'	: self.misses,
+				'evictions'	: self.evictions
+			}
+
+
+class TokenCache():
+	'''
+	Cache dos tokens JWT já verificados, evitando a verificação da assinatura a cada requisição com o mesmo token.
+
+	Os tokens são armazenados pelo seu hash SHA-256, junto aos dados decodificados, e descartados ao expirarem.
+
+	Os tokens de um usuário podem ser revogados com revoke(). Os tokens emitidos até o momento da revogação
+	  são recusados até o fim do seu tempo de vida.
+
+	Caso path seja passado, as revogações são gravadas neste arquivo, compartilhado entre os serviços e processos.
+	  A cada consulta, o cache verifica se o arquivo foi alterado e aplica as revogações feitas pelos demais, de forma
+	  que o token de um usuário desativado no serviço de usuários deixa de ser aceito também pelos outros serviços.
+	'''
+
+	def __init__(self, maxsize, lifetime, path=None):
+		'''
+		Construtor da classe
+
+		* maxsize  : número máximo de tokens no cache
+		* lifetime : tempo de vida, em segundos, dos tokens emitidos pela API
+		* path     : caminho do arquivo das revogações compartilhado entre os serviços. Caso não seja passado,
+		             as revogações valem apenas para o processo corrente
+		'''
+		self.__maxsize = maxsize
+		self.__lifetime = lifetime
+		self.__entries = OrderedDict()
+		self.__revoked = {}
+		self.__lock = threading.Lock()
+
+		self.__path = path
+		self.__file_lock = None
+		self.__stamp = None
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def get(self, token):
+		'''
+		Retorna os dados do token já verificado, ou None caso ele não esteja no cache ou tenha expirado.
+
+		* token : token JWT recebido na requisição
+		'''
+		digest = hashlib.sha256(token.encode('utf-8')).digest()
+
+		with self.__lock:
+			self.__sync()
+
+			entry = self.__entries.get(digest)
+			if entry is None or entry[0] <= time.time():
+				self.__entries.pop(digest, None)
+				self.misses += 1
+				return None
+
+			self.__entries.move_to_end(digest)
+			self.hits += 1
+
+			return entry[1]
+
+
+	def put(self, token, data):
+		'''
+		Armazena os dados do token verificado.
+
+		Retorna False caso o token tenha sido revogado, e True caso contrário. Tokens sem data de expiração não são armazenados.
+
+		* token : token JWT recebido na requisição
+		* data  : dados decodificados do token, contendo os campos 'id' e 'exp', e opcionalmente 'iat'
+		'''
+		digest = hashlib.sha256(token.encode('utf-8')).digest()
+
+		with self.__lock:
+			self.__sync()
+
+			revoked_at = self.__revoked.get(data['id'])
+			if revoked_at is not None and data.get('iat', 0) <= revoked_at:
+				return False
+
+			if 'exp' not in data:
+				return True
+
+			self.__entries[digest] = (data['exp'], data)
+			self.__entries.move_to_end(digest)
+
+			if len(self.__entries) > self.__maxsize:
+				self.__entries.popitem(last=False)
+				self.evictions += 1
+
+			return True
+
+
+	def revoke(self, user_id):
+		'''
+		Revoga todos os tokens do usuário emitidos até o momento, também nos demais serviços caso o arquivo das revogações seja utilizado.
+
+		* user_id : ID do usuário
+		'''
+		now = time.time()
+
+		with self.__lock:
+			self.__revoke(user_id, now)
+
+		if self.__path is None:
+			return
+
+		# A trava do arquivo só é criada na primeira revogação, já que a maioria dos processos apenas lê o arquivo
+		if self.__file_lock is None:
+			self.__file_lock = FileLock(self.__path + '.lock')
+
+		with self.__file_lock:
+			revoked = self.__read()
+			revoked[user_id] = max(now, revoked.get(user_id, 0))
+
+			# Revogações mais antigas que o tempo de vida dos tokens não são mais necessárias
+			revoked = {revoked_id: revoked_at for revoked_id, revoked_at in revoked.items() if revoked_at >= now - self.__lifetime}
+
+			# O arquivo é substituído, e não alterado, para que os outros processos nunca leiam um arquivo incompleto
+			tmp_path = self.__path + '.tmp'
+			with open(tmp_path, 'w') as f:
+				json.dump(revoked, f)
+
+			os.replace(tmp_path, self.__path)
+
+
+	def __revoke(self, user_id, revoked_at):
+		'''
+		Descarta os tokens do usuário do cache e registra a revogação. Deve ser chamado com a trava do cache adquirida.
+		'''
+		for digest, (exp, data) in list(self.__entries.items()):
+			if data['id'] == user_id:
+				del self.__entries[digest]
+
+		self.__revoked[user_id] = max(revoked_at, self.__revoked.get(user_id, 0))
+
+		# Revogações mais antigas que o tempo de vida dos tokens não são mais necessárias
+		now = time.time()
+		for revoked_id, revoked_at in list(self.__revoked.items()):
+			if revoked_at < now - self.__lifetime:
+				del self.__revoked[revoked_id]
+
+
+	def __read(self):
+		'''
+		Retorna as revogações gravadas no arquivo, como um dicionário ID do usuário -> momento da revogação.
+		'''
+		try:
+			with open(self.__path) as f:
+				return json.load(f)
+
+		except (FileNotFoundError, ValueError):
+			return {}
+
+
+	def __sync(self):
+		'''
+		Aplica as revogações gravadas no arquivo pelos demais processos desde a última verificação.
+		Deve ser chamado com a trava do cache adquirida.
+
+		Como o arquivo é sempre substituído, e não alterado, basta comparar o inode e a data de alteração para saber se ele mudou.
+		'''
+		if self.__path is None:
+			return
+
+		try:
+			stat = os.stat(self.__path)
+
+		except FileNotFoundError:
+			return
+
+		stamp = (stat.st_ino, stat.st_mtime_ns)
+		if stamp == self.__stamp:
+			return
+
+		self.__stamp = stamp
+		for user_id, revoked_at in self.__read().items():
+			if revoked_at > self.__revoked.get(user_id, 0):
+				self.__revoke(user_id, revoked_at)
+
+
+	def stats(self):
+		'''
+		Retorna os contadores do cache.
+		'''
+		with self.__lock:
+			return {
+				'size'		: len(self.__entries),
+				'maxsize'	: self.__maxsize,
+				'hits'		: self.hits,
+				'misses'	: self.misses,
+				'evictions'	: self.evictions,
+				'revoked'	: len(self.__revoked)
+			}
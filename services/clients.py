@@ -1,8 +1,12 @@
 # -*- coding:utf-8 -*-
 
-from flask import Flask, jsonify, url_for, make_response, abort, request
+from flask import Flask, make_response, abort, request
 from dbinterface import DBInterface
-from utils import API_CLIENTS_ROUTE, API_CLIENTS_PORT, token_required
+from cache import LRUCache
+from server import serve
+from profiler import enable_profiling
+from metrics import instrument, cache_collector
+from utils import API_CLIENTS_ROUTE, API_CLIENTS_PORT, CACHE_SIZE, token_cache, token_required, jsonify, uri_builder, get_list_args, not_modified, stream_export
 
 
 api = Flask(__name__)
@@ -11,10 +15,24 @@ clients = DBInterface('clients', [
 	'name',
 	'phonenumber',
 	'medicines'
-])
+], indexes=['name'])
+
+# Cache das respostas das consultas por ID, invalidado a cada alteração dos clientes
+client_cache = LRUCache(CACHE_SIZE)
+clients.subscribe(client_cache.invalidate)
+
+# Métricas das requisições e das operações no cadastro, disponíveis em GET /gestor/metrics
+instrument(api, cache_collector({'clients': client_cache, 'tokens': token_cache}), databases=[clients])
+
+# Profiling das requisições solicitado por administradores ou por amostragem, disponível em GET /gestor/profiles
+enable_profiling(api, 'clients')
 
 # Funções auxiliares
 
+# Monta a URI externa de um cliente a partir do seu ID
+client_uri = uri_builder('get_client', 'client_id')
+
+
 def make_public_client(client):
 	'''
 	Altera a forma de exibição de um elemento do cadastro.
@@ -24,7 +42,7 @@ def make_public_client(client):
 	new_client = {}
 	for field in client:
 		if field == 'id':
-			new_client['uri'] = url_for('get_client', client_id=client['id'], _external=True)
+			new_client['uri'] = client_uri(client['id'])
 
 		else:
 			new_client[field] = client[field]
@@ -148,15 +166,91 @@ def get_all_clients(current_user):
 	'''
 	Retorna todos os clientes cadastrados.
 
+	A listagem pode ser paginada e restrita a alguns campos através dos argumentos da query string:
+
+	* limit  : número máximo de clientes na resposta. Quando passado, a resposta contém o campo 'next'.
+	* cursor : valor do campo 'next' da página anterior, para obter a página seguinte. 'next' é nulo na última página.
+	* fields : campos a serem retornados, separados por vírgula. A URI do cliente é sempre retornada.
+
 	Exemplo de requisição:
 
 	curl -i -X GET http://localhost:5002/gestor/clients
+	curl -i -X GET 'http://localhost:5002/gestor/clients?limit=50&fields=name'
 	'''
 	global clients
 
-	public_clients = [make_public_client(client) for client in clients.get_all_elements()]
+	limit, cursor, fields = get_list_args(['name', 'phonenumber', 'medicines'])
+
+	etag = clients.get_version()
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	if limit is None and cursor is None and fields is None:
+		page, next_cursor = clients.get_all_elements(), None
+
+	else:
+		page = clients.get_page(limit, cursor, fields)
+		if page == -1:
+			abort(500)
+
+		page, next_cursor = page
+
+	public_clients = [make_public_client(client) for client in page]
+
+	if limit is None:
+		response = jsonify({'clients': public_clients})
 
-	return jsonify({'clients': public_clients})
+	else:
+		response = jsonify({'clients': public_clients, 'next': next_cursor})
+
+	response.set_etag(etag)
+
+	return response
+
+
+@api.route(API_CLIENTS_ROUTE + '/export', methods=['GET'])
+@token_required
+def export_clients(current_user):
+	'''
+	Exporta todos os clientes cadastrados.
+
+	Os clientes são lidos do banco e enviados um a um, mantendo o uso de memória limitado mesmo para cadastros grandes.
+
+	* format : argumento da query string. 'json' (padrão) retorna o mesmo formato da listagem; 'ndjson' retorna um cliente JSON por linha.
+
+	Exemplo de requisição:
+
+	curl -i -X GET 'http://localhost:5002/gestor/clients/export?format=ndjson'
+	'''
+	global clients
+
+	etag = clients.get_version()
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	response = stream_export('clients', clients.iter_elements(), make_public_client)
+	response.set_etag(etag)
+
+	return response
+
+
+@api.route(API_CLIENTS_ROUTE + '/cache', methods=['GET'])
+@token_required
+def get_client_cache_stats(current_user):
+	'''
+	Retorna os contadores do cache das consultas de clientes por ID ('cache') e do cache de tokens verificados do serviço ('tokens'):
+	  número de elementos, tamanho máximo, acertos, falhas e descartes.
+
+	Exemplo de requisição:
+
+	curl -i -X GET http://localhost:5002/gestor/clients/cache
+	'''
+	if not current_user['admin']:
+		abort(403)
+
+	return jsonify({'cache': client_cache.stats(), 'tokens': token_cache.stats()})
 
 
 @api.route(API_CLIENTS_ROUTE + '/<client_id>', methods=['GET'])
@@ -173,6 +267,23 @@ def get_client(current_user, client_id):
 	'''
 	global clients
 
+	etag = clients.get_version(client_id)
+	if etag is None:
+		abort(404)
+
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	# A resposta depende do host da requisição, devido às uris dos clientes
+	cached = client_cache.get(client_id, variant=request.host_url)
+	if cached is not None:
+		response = api.response_class(cached, mimetype='application/json')
+		response.set_etag(etag)
+
+		return response
+
+	token = client_cache.token()
 	client = clients.get_element('id', client_id)
 
 	if client == []:
@@ -181,7 +292,11 @@ def get_client(current_user, client_id):
 	if client == -1:
 		abort(500)
 
-	return jsonify({'client': make_public_client(client[0])})
+	response = jsonify({'client': make_public_client(client[0])})
+	client_cache.put(client_id, response.get_data(), token, variant=request.host_url)
+	response.set_etag(etag)
+
+	return response
 
 
 @api.route(API_CLIENTS_ROUTE + '/<client_id>', methods=['PUT'])
@@ -238,16 +353,16 @@ def update_client(current_user, client_id):
 				elif type(medicine['uri']) != str or type(medicine['quantity']) != int:
 					abort(400)
 
-	if clients.update_element(request_json, 'id', client_id) == -1:
-		abort(500)
-
-	client = clients.get_element('id', client_id)
+	client = clients.update_element(request_json, 'id', client_id)
 	if client == -1:
 		abort(500)
 
+	if client == []:
+		abort(404)
+
 	return jsonify({'client': make_public_client(client[0])})
 
 
 if __name__ == '__main__':
-	api.run(port=API_CLIENTS_PORT, debug=True)
+	serve(api, 'clients', API_CLIENTS_PORT)
 
@@ -1,8 +1,35 @@
 # -*- coding:utf-8 -*-
 
+import time
 import uuid
-from tinydb import TinyDB, Query
-from utils import root_dir
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager, nullcontext
+from engines import TinyDBEngine, JournalEngine, SQLiteEngine
+from storages import make_storage
+from processes import FileLock, ChangeLog
+from utils import db_dir, DB_STORAGE_MODE, DB_DURABILITY, DB_FLUSH_INTERVAL, DB_FLUSH_THRESHOLD, DB_COMPACT_THRESHOLD, DB_MULTIPROCESS, DB_SLOW_OPERATION, json_provider
+
+
+# Valor retornado quando uma operação violaria um índice único
+DUPLICATE_ERROR = -2
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hashable(value):
+	'''
+	Indica se o valor pode ser utilizado como chave de um índice.
+	'''
+	try:
+		hash(value)
+
+	except TypeError:
+		return False
+
+	return True
 
 
 class DBInterface():
@@ -11,12 +38,20 @@ class DBInterface():
 	Utilzada para abstrair o banco utilizado e armazenar os cadastros da forma desejada
 	'''
 
-	def __init__(self, dbname, fields):
+	def __init__(self, dbname, fields, indexes=None, unique=None, storage_mode=None, multiprocess=None, slow_operation=None):
 		'''
 		Construtor da classe
 
-		* dbname : nome do banco a ser criado/carregado
-		* fields : campos do cadastro inseridos em forma de lista
+		* dbname       : nome do banco a ser criado/carregado
+		* fields       : campos do cadastro inseridos em forma de lista
+		* indexes      : campos do cadastro que devem possuir índice em memória para as consultas
+		* unique       : campos do cadastro cujos valores não podem se repetir. Estes campos também são indexados
+		* storage_mode : modo de armazenamento ('direct', 'writebehind', 'journal' ou 'sqlite'). Caso não seja passado, utiliza DB_STORAGE_MODE
+		* multiprocess : se verdadeiro, o cadastro pode ser utilizado ao mesmo tempo por vários processos. Caso não seja passado, utiliza DB_MULTIPROCESS
+		* slow_operation : duração, em segundos, a partir da qual uma operação é registrada no log. 0 desativa o registro. Caso não seja passado, utiliza DB_SLOW_OPERATION
+
+		No modo multiprocesso, as escritas são feitas com uma trava entre processos (database/<dbname>.lock) e registradas
+		  em database/<dbname>.changes. Antes de cada operação, os elementos alterados pelos outros processos são recarregados.
 		'''
 		self.__dbname = dbname
 		self.__fields = fields
@@ -26,7 +61,414 @@ class DBInterface():
 		#   adicional com um "nome" diferente para diferenciação
 		self.__idfield = 'id' if 'id' not in fields else '_id'
 
-		self.__db = TinyDB(f'{root_dir()}/database/{dbname}.json')
+		self.__unique = set(unique or [])
+		self.__lock = threading.RLock()
+
+		# Funções chamadas com os IDs dos elementos a cada criação, atualização ou remoção
+		self.__subscribers = []
+
+		# Funções chamadas com os elementos alterados, com as travas de escrita adquiridas
+		self.__element_subscribers = []
+
+		# Funções chamadas com a duração de cada operação, e duração a partir da qual uma operação é registrada no log
+		self.__operation_subscribers = []
+		self.__slow_operation = DB_SLOW_OPERATION if slow_operation is None else slow_operation
+
+		# Versões do cadastro e de cada elemento, incrementadas a cada alteração e utilizadas como ETag
+		# A geração diferencia as versões de cada execução, já que os contadores são mantidos apenas em memória
+		self.__generation = uuid.uuid4().hex[:12]
+		self.__version = 0
+		self.__versions = {}
+
+		storage_mode = storage_mode or DB_STORAGE_MODE
+		multiprocess = DB_MULTIPROCESS if multiprocess is None else multiprocess
+		path = f'{db_dir()}/{dbname}.json'
+
+		# Trava entre processos e registro das alterações, utilizados apenas no modo multiprocesso
+		self.__process_lock = FileLock(f'{db_dir()}/{dbname}.lock') if multiprocess else nullcontext()
+		self.__changes = None
+
+		# Funções chamadas com os elementos alterados por outros processos
+		self.__external_subscribers = []
+
+		# No modo 'writebehind', as alterações precisam ser gravadas antes de serem registradas para os outros processos
+		self.__flush_writes = multiprocess and storage_mode == 'writebehind'
+
+		with self.__process_lock:
+			if storage_mode == 'journal':
+				self.__db = JournalEngine(
+					path,
+					durability=DB_DURABILITY,
+					compact_threshold=DB_COMPACT_THRESHOLD,
+					json_provider=json_provider,
+					process_lock=self.__process_lock if multiprocess else None
+				)
+
+			elif storage_mode == 'sqlite':
+				self.__db = SQLiteEngine(
+					f'{db_dir()}/{dbname}.sqlite3',
+					dbname,
+					[self.__idfield] + fields,
+					indexes=list(indexes or []),
+					unique=[self.__idfield] + list(unique or []),
+					durability=DB_DURABILITY,
+					json_provider=json_provider
+				)
+
+			else:
+				storage = make_storage(
+					storage_mode,
+					durability=DB_DURABILITY,
+					flush_interval=DB_FLUSH_INTERVAL,
+					flush_threshold=DB_FLUSH_THRESHOLD,
+					json_provider=json_provider,
+					multiprocess=multiprocess
+				)
+				self.__db = TinyDBEngine(path, storage)
+
+				# O TinyDB cria a tabela ao abrir um arquivo vazio, e essa escrita não pode ficar pendente
+				#   até depois da liberação da trava
+				if self.__flush_writes:
+					self.__db.flush()
+
+			if multiprocess:
+				self.__changes = ChangeLog(f'{db_dir()}/{dbname}.changes')
+
+			# Campos com índices secundários em memória
+			self.__indexed_fields = list(indexes or []) + list(self.__unique)
+
+			self.__build_indexes(self.__db.all())
+
+
+	def __build_indexes(self, documents):
+		'''
+		Cria os índices em memória a partir dos documentos passados.
+		'''
+		# Índice em memória ID do cadastro -> doc_id do motor de armazenamento
+		# Evita que consultas, atualizações e remoções pelo ID percorram todo o banco
+		self.__ids = {}
+
+		# Índices secundários em memória: campo -> valor -> conjunto de doc_ids
+		self.__indexes = {field: {} for field in self.__indexed_fields}
+
+		# Valores indexados de cada documento (doc_id -> campo -> valor), utilizados para removê-lo dos índices
+		self.__indexed_values = {}
+
+		for document in documents:
+			self.__ids[document[self.__idfield]] = document.doc_id
+			self.__index_document(document.doc_id, document)
+
+		# IDs do cadastro ordenados, utilizados na paginação das listagens
+		self.__ordered_ids = sorted(self.__ids)
+
+
+	def subscribe(self, callback):
+		'''
+		Registra uma função a ser chamada sempre que elementos do banco forem criados, atualizados ou removidos.
+		Utilizado, por exemplo, para invalidar caches dos elementos.
+
+		* callback : função que recebe a lista de IDs dos elementos alterados
+		'''
+		self.__subscribers.append(callback)
+
+
+	def subscribe_elements(self, callback):
+		'''
+		Registra uma função a ser chamada com os elementos criados, atualizados ou removidos, por este ou, no modo
+		  multiprocesso, por outros processos. A função é chamada antes da liberação das travas de escrita, então as
+		  estruturas mantidas em memória a partir dos elementos são atualizadas na mesma ordem das alterações.
+
+		* callback : função que recebe um dicionário ID do elemento -> elemento atual, ou None caso o elemento tenha sido removido
+		'''
+		self.__element_subscribers.append(callback)
+
+
+	def subscribe_external(self, callback):
+		'''
+		Registra uma função a ser chamada quando elementos do banco forem alterados por outros processos, no modo multiprocesso.
+		Utilizado para atualizar estruturas mantidas em memória a partir dos elementos.
+
+		* callback : função que recebe um dicionário ID do elemento -> elemento atual, ou None caso o elemento tenha sido removido
+		'''
+		self.__external_subscribers.append(callback)
+
+
+	def subscribe_operations(self, callback):
+		'''
+		Registra uma função a ser chamada ao final de cada operação de criação, consulta, atualização ou remoção.
+		Utilizado para medir o tempo gasto com o banco (ex.: métricas dos serviços).
+
+		* callback : função que recebe um dicionário com o nome do cadastro ('table'), o nome do método ('operation'),
+		             o campo da consulta ('field', ou None), o número de elementos encontrados ('matched'), se a operação
+		             percorreu o cadastro inteiro ('scan') e a duração da operação, em segundos ('seconds')
+		'''
+		self.__operation_subscribers.append(callback)
+
+
+	def __emit(self, operation, field_name, matched, scan, started):
+		'''
+		Avisa as funções registradas com subscribe_operations() do fim de uma operação, e registra no log as operações lentas.
+
+		* started : valor de time.perf_counter() no início da operação
+		'''
+		seconds = time.perf_counter() - started
+		slow = 0 < self.__slow_operation <= seconds
+
+		if not self.__operation_subscribers and not slow:
+			return
+
+		event = {
+			'table'		: self.__dbname,
+			'operation'	: operation,
+			'field'		: field_name,
+			'matched'	: matched,
+			'scan'		: scan,
+			'seconds'	: seconds
+		}
+
+		if slow:
+			logger.warning('Slow %s on %s (field %s, %d matched%s): %.1f ms',
+				operation, self.__dbname, field_name, matched, ', full scan' if scan else '', 1000 * seconds)
+
+		self.__call_subscribers(self.__operation_subscribers, event)
+
+
+	def __call_subscribers(self, callbacks, argument):
+		'''
+		Chama as funções registradas com o argumento passado.
+
+		As funções são chamadas depois que a alteração foi gravada, então uma função que lança uma exceção é registrada
+		  no log e não impede que as demais sejam chamadas, nem altera o resultado da operação.
+		'''
+		for callback in callbacks:
+			try:
+				callback(argument)
+
+			except Exception:
+				logger.exception('Subscriber %r of %s failed', callback, self.__dbname)
+
+
+	def __scans(self, field_name, field_value):
+		'''
+		Indica se a consulta pelo campo e valor passados percorre o cadastro inteiro, por não poder utilizar os índices.
+		'''
+		return not _hashable(field_value) or (field_name != self.__idfield and field_name not in self.__indexes)
+
+
+	@contextmanager
+	def __writing(self):
+		'''
+		Adquire as travas necessárias para alterar o banco.
+		No modo multiprocesso, adquire também a trava entre processos e recarrega as alterações dos outros processos.
+		'''
+		with self.__lock, self.__process_lock:
+			self.__refresh()
+
+			yield
+
+
+	def __refresh(self):
+		'''
+		No modo multiprocesso, recarrega os elementos alterados por outros processos desde a última operação.
+		'''
+		if self.__changes is None:
+			return
+
+		with self.__lock:
+			changes = self.__changes.read()
+			if changes == {}:
+				return
+
+			self.__db.refresh()
+
+			if changes is None:
+				# O registro de alterações foi reiniciado, então todo o cadastro é recarregado
+				documents = self.__db.all()
+				removed = set(self.__ids) - {document[self.__idfield] for document in documents}
+
+				self.__build_indexes(documents)
+
+				elements = {element_id: None for element_id in removed}
+				elements.update({document[self.__idfield]: document for document in documents})
+
+			else:
+				fetched = {document.doc_id: document for document in self.__db.get_many([doc_id for doc_id in changes.values() if doc_id is not None])}
+
+				elements = {}
+				for element_id, doc_id in changes.items():
+					old_doc_id = self.__ids.pop(element_id, None)
+					if old_doc_id is not None:
+						self.__unindex_document(old_doc_id)
+
+					document = fetched.get(doc_id)
+					if document is None or document[self.__idfield] != element_id:
+						# Elemento removido, possivelmente depois de ter sido alterado
+						if old_doc_id is not None:
+							self.__remove_ordered(element_id)
+
+						elements[element_id] = None
+						continue
+
+					if old_doc_id is None:
+						insort(self.__ordered_ids, element_id)
+
+					self.__ids[element_id] = doc_id
+					self.__index_document(doc_id, document)
+					elements[element_id] = document
+
+			for element_id, document in elements.items():
+				if document is None:
+					self.__versions.pop(element_id, None)
+
+			self.__notify(list(elements))
+
+			self.__call_subscribers(self.__element_subscribers + self.__external_subscribers, elements)
+
+
+	def __changed(self, elements):
+		'''
+		Registra as alterações feitas pelo processo corrente, para os outros processos, e avisa as funções registradas.
+		Deve ser chamado com as travas de __writing adquiridas.
+
+		* elements : dicionário ID do elemento -> documento atual, ou None para elementos removidos
+		'''
+		if not elements:
+			return
+
+		if self.__changes is not None:
+			if self.__flush_writes:
+				self.__db.flush()
+
+			self.__changes.append({element_id: document.doc_id if document is not None else None
+				for element_id, document in elements.items()})
+
+		self.__notify(list(elements))
+		self.__call_subscribers(self.__element_subscribers, elements)
+
+
+	def __remove_ordered(self, element_id):
+		'''
+		Remove o ID da lista ordenada de IDs.
+		'''
+		position = bisect_left(self.__ordered_ids, element_id)
+		if position < len(self.__ordered_ids) and self.__ordered_ids[position] == element_id:
+			del self.__ordered_ids[position]
+
+
+	def __notify(self, element_ids):
+		'''
+		Incrementa as versões dos elementos passados e do cadastro, e avisa as funções registradas que os elementos foram alterados.
+		'''
+		if not element_ids:
+			return
+
+		self.__version += 1
+		for element_id in element_ids:
+			if element_id in self.__ids:
+				self.__versions[element_id] = self.__version
+
+		self.__call_subscribers(self.__subscribers, element_ids)
+
+
+	def __index_document(self, doc_id, document):
+		'''
+		Adiciona o documento nos índices secundários.
+		'''
+		values = {}
+		for field, index in self.__indexes.items():
+			value = document.get(field)
+			if _hashable(value):
+				index.setdefault(value, set()).add(doc_id)
+				values[field] = value
+
+		if values:
+			self.__indexed_values[doc_id] = values
+
+
+	def __unindex_document(self, doc_id):
+		'''
+		Remove o documento dos índices secundários e retorna os valores indexados que ele possuía.
+		'''
+		values = self.__indexed_values.pop(doc_id, {})
+		for field, value in values.items():
+			doc_ids = self.__indexes[field].get(value)
+			if doc_ids is None:
+				continue
+
+			doc_ids.discard(doc_id)
+			if not doc_ids:
+				del self.__indexes[field][value]
+
+		return values
+
+
+	def __violates_unique(self, fields, doc_ids=()):
+		'''
+		Verifica se os valores passados já pertencem a algum documento diferente dos documentos passados
+		  em algum dos campos com índice único.
+
+		* fields  : dicionário com os campos e valores a serem verificados
+		* doc_ids : doc_ids dos documentos que podem manter o valor
+		'''
+		for field in self.__unique:
+			if field not in fields:
+				continue
+
+			owners = self.__indexes[field].get(fields[field], set()) if _hashable(fields[field]) else set()
+			if owners - set(doc_ids):
+				return True
+
+			# Um mesmo valor atribuído a vários documentos também viola o índice
+			if len(doc_ids) > 1:
+				return True
+
+		return False
+
+
+	def __indexed_doc_ids(self, field_name, field_value):
+		'''
+		Retorna os doc_ids que correspondam à consulta através dos índices em memória,
+		  ou None caso a consulta não possa ser respondida pelos índices.
+
+		* field_name  : campo a ser utilizado na consulta
+		* field_value : valor desejado para o campo da consulta
+		'''
+		if not _hashable(field_value):
+			return None
+
+		if field_name == self.__idfield:
+			doc_id = self.__ids.get(field_value)
+
+			return [doc_id] if doc_id is not None else []
+
+		if field_name in self.__indexes:
+			return sorted(self.__indexes[field_name].get(field_value, ()))
+
+		return None
+
+
+	def __search(self, field_name, field_value):
+		'''
+		Retorna os documentos que correspondam à consulta.
+		Consultas por campos indexados utilizam os índices em memória, as demais percorrem o banco.
+
+		* field_name  : campo a ser utilizado na consulta
+		* field_value : valor desejado para o campo da consulta
+		'''
+		self.__refresh()
+
+		doc_ids = self.__indexed_doc_ids(field_name, field_value)
+		if doc_ids is None:
+			return self.__db.search(field_name, field_value)
+
+		if len(doc_ids) == 1:
+			documents = [self.__db.get(doc_ids[0])]
+
+		else:
+			documents = self.__db.get_many(doc_ids) if doc_ids else []
+
+		# No modo multiprocesso, o documento pode ter sido alterado por outro processo depois da atualização dos índices
+		return [document for document in documents if document is not None and document.get(field_name) == field_value]
 
 
 	def create_element(self, element):
@@ -34,20 +476,39 @@ class DBInterface():
 		Adiciona um novo elemento no banco
 
 		* element : elemento a ser inserido. Deve ser um dicionário
+
+		Caso o elemento repita o valor de algum campo com índice único, retorna DUPLICATE_ERROR.
 		'''
+		started = time.perf_counter()
+		matched = 0
 		try:
 			new_element = {}
 			new_element[self.__idfield] = str(uuid.uuid4())
 			for field in self.__fields:
 				new_element[field] = element.get(field, '')
 
-			tinydb_id = self.__db.insert(new_element)
+			with self.__writing():
+				if self.__violates_unique(new_element):
+					return DUPLICATE_ERROR
+
+				tinydb_id = self.__db.insert(new_element)
+				self.__ids[new_element[self.__idfield]] = tinydb_id
+				self.__index_document(tinydb_id, new_element)
+				insort(self.__ordered_ids, new_element[self.__idfield])
+
+				created = self.__db.get(tinydb_id)
+				self.__changed({new_element[self.__idfield]: created})
+
+			matched = 1
 
-			return self.__db.get(doc_id=tinydb_id)
+			return created
 
 		except Exception:
 			return -1
 
+		finally:
+			self.__emit('create_element', None, matched, False, started)
+
 
 	def delete_element(self, field_name, field_value):
 		'''
@@ -56,20 +517,124 @@ class DBInterface():
 		* field_name  : campo a ser utilizado na consulta
 		* field_value : valor desejado para o campo da consulta
 		'''
+		started = time.perf_counter()
+		matched = 0
 		try:
-			self.__db.remove(Query()[field_name] == field_value)
+			with self.__writing():
+				documents = self.__search(field_name, field_value)
+				matched = len(documents)
+				if documents:
+					self.__db.remove([document.doc_id for document in documents])
+
+				for document in documents:
+					self.__ids.pop(document[self.__idfield], None)
+					self.__versions.pop(document[self.__idfield], None)
+					self.__unindex_document(document.doc_id)
+					self.__remove_ordered(document[self.__idfield])
 
-			return 0 
+				self.__changed({document[self.__idfield]: None for document in documents})
+
+			return 0
 
 		except Exception:
 			return -1
 
+		finally:
+			self.__emit('delete_element', field_name, matched, self.__scans(field_name, field_value), started)
+
+
+	def flush(self):
+		'''
+		Grava no disco as alterações ainda pendentes
+		'''
+		self.__db.flush()
+
+
+	def close(self):
+		'''
+		Grava as alterações pendentes e fecha o banco
+		'''
+		self.__db.close()
+
+
+	def get_version(self, element_id=None):
+		'''
+		Retorna a versão atual do elemento com o ID passado, ou do cadastro inteiro caso nenhum ID seja passado.
+		A versão muda a cada alteração e pode ser utilizada como ETag das respostas da API.
+
+		Retorna None caso o elemento não exista.
+
+		* element_id : ID do elemento
+		'''
+		self.__refresh()
+
+		with self.__lock:
+			if element_id is None:
+				return f'{self.__generation}-{self.__version}'
+
+			if not _hashable(element_id) or element_id not in self.__ids:
+				return None
+
+			return f'{self.__generation}-{self.__versions.get(element_id, 0)}'
+
 
 	def get_all_elements(self):
 		'''
 		Retorna todos elementos do banco
 		'''
-		return self.__db.all()
+		started = time.perf_counter()
+		self.__refresh()
+
+		documents = self.__db.all()
+		self.__emit('get_all_elements', None, len(documents), True, started)
+
+		return documents
+
+
+	def iter_elements(self):
+		'''
+		Retorna um gerador que percorre todos os elementos do banco, sem carregar a lista completa de elementos
+		'''
+		self.__refresh()
+
+		return self.__db.iterate()
+
+
+	def get_page(self, limit=None, cursor=None, fields=None):
+		'''
+		Retorna uma página dos elementos do banco, ordenados pelo ID
+
+		* limit  : número máximo de elementos na página. Caso não seja passado, retorna todos os elementos a partir do cursor
+		* cursor : ID do último elemento da página anterior. Caso não seja passado, a página começa no primeiro elemento
+		* fields : campos a serem retornados em cada elemento, além do ID. Caso não seja passado, retorna todos os campos
+
+		Retorna uma tupla (elementos, cursor da próxima página). O cursor da próxima página é None quando não há mais elementos.
+		'''
+		started = time.perf_counter()
+		matched = 0
+		try:
+			self.__refresh()
+
+			with self.__lock:
+				start = bisect_right(self.__ordered_ids, cursor) if cursor is not None else 0
+				stop = start + limit if limit is not None else len(self.__ordered_ids)
+				page_ids = self.__ordered_ids[start:stop]
+				next_cursor = page_ids[-1] if page_ids and stop < len(self.__ordered_ids) else None
+				doc_ids = [self.__ids[element_id] for element_id in page_ids]
+
+			if fields is not None:
+				fields = [self.__idfield] + [field for field in fields if field != self.__idfield]
+
+			documents = {document.doc_id: document for document in self.__db.get_many(doc_ids, fields)}
+			matched = len(documents)
+
+			return [documents[doc_id] for doc_id in doc_ids if doc_id in documents], next_cursor
+
+		except Exception:
+			return -1
+
+		finally:
+			self.__emit('get_page', None, matched, False, started)
 
 
 	def get_element(self, field_name, field_value):
@@ -79,12 +644,58 @@ class DBInterface():
 		* field_name  : campo a ser utilizado na consulta
 		* field_value : valor desejado para o campo da consulta
 		'''
+		started = time.perf_counter()
+		documents = []
+		try:
+			documents = self.__search(field_name, field_value)
+
+			return documents
+
+		except Exception:
+			return -1
+
+		finally:
+			self.__emit('get_element', field_name, len(documents), self.__scans(field_name, field_value), started)
+
+
+	def get_elements(self, field_name, field_values):
+		'''
+		Retorna os elementos que correspondam a qualquer um dos valores passados, consultando o banco uma única vez
+
+		* field_name   : campo a ser utilizado na consulta
+		* field_values : valores desejados para o campo da consulta
+		'''
+		started = time.perf_counter()
+		documents = []
+		scan = False
 		try:
-			return self.__db.search(Query()[field_name] == field_value)
+			self.__refresh()
+
+			doc_ids = []
+			for field_value in field_values:
+				indexed = self.__indexed_doc_ids(field_name, field_value)
+				if indexed is None:
+					break
+
+				doc_ids.extend(indexed)
+
+			else:
+				documents = self.__db.get_many(list(dict.fromkeys(doc_ids))) if doc_ids else []
+				documents = [document for document in documents if document.get(field_name) in field_values]
+
+				return documents
+
+			scan = True
+			documents = [document for document in self.__db.all() if field_name in document and document[field_name] in field_values]
+
+			return documents
 
 		except Exception:
 			return -1
 
+		finally:
+			self.__emit('get_elements', field_name, len(documents), scan, started)
+
 
 	def update_element(self, fields, field_name, field_value):
 		'''
@@ -93,23 +704,207 @@ class DBInterface():
 		* fields      : dicionário contendo os campos a serem atualizados e seus respectivos novos valores
 		* field_name  : campo a ser utilizado na consulta
 		* filed_value : valor desejado para o campo da consulta
+
+		Retorna os elementos atualizados, obtidos na mesma operação da atualização.
+		Caso a atualização repita o valor de algum campo com índice único, retorna DUPLICATE_ERROR.
 		'''
+		started = time.perf_counter()
+		matched = 0
 		try:
 			# O campoo ID do cadastro não pode ser alterado
 			if self.__idfield in fields:
 				return -1
 
-			self.__db.update(fields, Query()[field_name] == field_value)
+			with self.__writing():
+				# Os documentos só são lidos antes da atualização quando a consulta não pode ser respondida pelos índices
+				doc_ids = self.__indexed_doc_ids(field_name, field_value)
+				if doc_ids is None:
+					doc_ids = [document.doc_id for document in self.__db.search(field_name, field_value)]
+
+				matched = len(doc_ids)
+				if not doc_ids:
+					return []
+
+				if self.__violates_unique(fields, doc_ids):
+					return DUPLICATE_ERROR
 
-			return self.__db.search(Query()[field_name] == field_value)
+				updated = self.__db.update(fields, doc_ids)
+
+				# Os valores antigos dos campos indexados são mantidos em memória, então não precisam ser lidos do banco
+				if set(fields) & set(self.__indexes):
+					for doc_id in doc_ids:
+						self.__index_document(doc_id, {**self.__unindex_document(doc_id), **fields})
+
+				self.__changed({document[self.__idfield]: document for document in updated})
+
+			return updated
+
+		except Exception:
+			return -1
+
+		finally:
+			self.__emit('update_element', field_name, matched, self.__scans(field_name, field_value), started)
+
+
+	def update_elements(self, updates):
+		'''
+		Atualiza vários elementos, identificados pelo ID, em uma única gravação
+
+		* updates : dicionário ID do elemento -> dicionário com os campos a serem atualizados
+
+		A atualização é tudo ou nada: caso algum ID não exista, nenhum elemento é atualizado e retorna [].
+		Retorna os elementos atualizados.
+		Caso a atualização repita o valor de algum campo com índice único, retorna DUPLICATE_ERROR.
+		'''
+		started = time.perf_counter()
+		matched = 0
+		try:
+			with self.__writing():
+				doc_ids = self.__doc_ids(updates)
+				if doc_ids is None:
+					return []
+
+				matched = len(doc_ids)
+
+				return self.__update_documents(doc_ids, updates)
+
+		except Exception:
+			return -1
+
+		finally:
+			self.__emit('update_elements', self.__idfield, matched, False, started)
+
+
+	def update_element_with(self, field_name, field_value, merge):
+		'''
+		Atualiza todos os elementos que correspondam à consulta passada com campos calculados a partir do valor atual de cada um.
+
+		A leitura dos elementos, o cálculo dos campos e a gravação são feitos com as travas de escrita adquiridas, então
+		  atualizações concorrentes de um mesmo elemento, feitas por outras threads ou processos, não se sobrescrevem.
+
+		* field_name  : campo a ser utilizado na consulta
+		* field_value : valor desejado para o campo da consulta
+		* merge       : função que recebe o elemento atual e retorna o dicionário com os campos a serem atualizados.
+		                Não deve alterar o elemento recebido nem acessar o cadastro
+
+		Retorna os elementos atualizados.
+		Caso a atualização repita o valor de algum campo com índice único, retorna DUPLICATE_ERROR.
+		'''
+		started = time.perf_counter()
+		matched = 0
+		try:
+			with self.__writing():
+				documents = self.__search(field_name, field_value)
+				matched = len(documents)
+				if not documents:
+					return []
+
+				doc_ids = {document[self.__idfield]: document.doc_id for document in documents}
+
+				return self.__update_documents(doc_ids, {document[self.__idfield]: merge(document) for document in documents})
+
+		except Exception:
+			return -1
+
+		finally:
+			self.__emit('update_element_with', field_name, matched, self.__scans(field_name, field_value), started)
+
+
+	def update_elements_with(self, element_ids, merge):
+		'''
+		Atualiza vários elementos, identificados pelo ID, em uma única gravação, com campos calculados a partir do valor
+		  atual de cada um. Assim como em update_element_with, a leitura, o cálculo e a gravação são feitos com as travas
+		  de escrita adquiridas.
+
+		* element_ids : IDs dos elementos a serem atualizados
+		* merge       : função que recebe o elemento atual e retorna o dicionário com os campos a serem atualizados.
+		                Não deve alterar o elemento recebido nem acessar o cadastro
+
+		A atualização é tudo ou nada: caso algum ID não exista, nenhum elemento é atualizado e retorna [].
+		Retorna os elementos atualizados.
+		Caso a atualização repita o valor de algum campo com índice único, retorna DUPLICATE_ERROR.
+		'''
+		started = time.perf_counter()
+		matched = 0
+		try:
+			with self.__writing():
+				doc_ids = self.__doc_ids(element_ids)
+				if doc_ids is None:
+					return []
+
+				documents = self.__db.get_many(list(doc_ids.values()))
+				if len(documents) != len(doc_ids):
+					return []
+
+				matched = len(doc_ids)
+
+				return self.__update_documents(doc_ids, {document[self.__idfield]: merge(document) for document in documents})
 
 		except Exception:
 			return -1
 
+		finally:
+			self.__emit('update_elements_with', self.__idfield, matched, False, started)
+
+
+	def __doc_ids(self, element_ids):
+		'''
+		Retorna um dicionário ID do elemento -> doc_id com os IDs passados, ou None caso algum deles não exista.
+		'''
+		doc_ids = {}
+		for element_id in element_ids:
+			doc_id = self.__ids.get(element_id) if _hashable(element_id) else None
+			if doc_id is None:
+				return None
+
+			doc_ids[element_id] = doc_id
+
+		return doc_ids
+
+
+	def __update_documents(self, doc_ids, updates):
+		'''
+		Grava os campos de cada elemento em uma única atualização, mantendo os índices. Deve ser chamado com as travas de __writing adquiridas.
+
+		* doc_ids : dicionário ID do elemento -> doc_id
+		* updates : dicionário ID do elemento -> dicionário com os campos a serem atualizados
+
+		Retorna os elementos atualizados, -1 caso algum campo ID seja alterado ou DUPLICATE_ERROR caso algum índice único seja violado.
+		'''
+		# O campoo ID do cadastro não pode ser alterado
+		if any(self.__idfield in fields for fields in updates.values()):
+			return -1
+
+		assigned = {}
+		for element_id, fields in updates.items():
+			if self.__violates_unique(fields, [doc_ids[element_id]]):
+				return DUPLICATE_ERROR
+
+			for field in self.__unique & set(fields):
+				if not _hashable(fields[field]):
+					continue
+
+				if (field, fields[field]) in assigned:
+					return DUPLICATE_ERROR
+
+				assigned[(field, fields[field])] = element_id
+
+		updated = self.__db.update_many({doc_ids[element_id]: fields for element_id, fields in updates.items()})
+
+		# Os valores antigos dos campos indexados são mantidos em memória, então não precisam ser lidos do banco
+		for element_id, fields in updates.items():
+			if set(fields) & set(self.__indexes):
+				doc_id = doc_ids[element_id]
+				self.__index_document(doc_id, {**self.__unindex_document(doc_id), **fields})
+
+		self.__changed({document[self.__idfield]: document for document in updated})
+
+		return updated
+
 
 if __name__ == '__main__':
 	dbname = 'dbtest'
-	with open(f'{root_dir()}/database/{dbname}.json', 'wb') as f:
+	with open(f'{db_dir()}/{dbname}.json', 'wb') as f:
 		f.seek(0)
 		f.write(b'')
 
@@ -0,0 +1,930 @@
+# -*- coding:utf-8 -*-
+
+import os
+import json
+import atexit
+import sqlite3
+import threading
+from contextlib import nullcontext
+from tinydb import TinyDB
+from jsonprovider import StdlibJSONProvider
+
+
+class Document(dict):
+	'''
+	Documento retornado pelos motores de armazenamento.
+	Além dos campos do cadastro, guarda o doc_id utilizado internamente pelo motor.
+	'''
+
+	def __init__(self, value, doc_id):
+		super().__init__(value)
+		self.doc_id = doc_id
+
+
+def _project(document, fields):
+	'''
+	Retorna uma cópia do documento contendo apenas os campos passados.
+	Caso fields seja None, retorna o documento inteiro.
+	'''
+	if fields is None:
+		return Document(document, document.doc_id)
+
+	return Document({field: document[field] for field in fields if field in document}, document.doc_id)
+
+
+class TinyDBEngine():
+	'''
+	Motor de armazenamento que utiliza os armazenamentos do TinyDB, gravando o cadastro em um arquivo JSON.
+
+	A tabela do cadastro é mantida em memória, e as consultas são respondidas a partir dela, sem ler o arquivo.
+	  As alterações são aplicadas na tabela em memória e a tabela inteira é passada para o armazenamento, que a
+	  grava no arquivo (modo 'direct') ou agrupa as gravações (modo 'writebehind').
+
+	Os documentos da tabela nunca são alterados no lugar: uma atualização substitui o documento por uma cópia.
+
+	O TinyDB não pode ser utilizado por várias threads ao mesmo tempo (o JSONStorage, por exemplo, lê e grava
+	  sempre através do mesmo arquivo aberto), então todas as operações são feitas com uma trava adquirida.
+	  Caso o armazenamento possua uma trava própria (ver storages.WriteBehindMiddleware), ela é utilizada, de forma
+	  que a tabela nunca é gravada enquanto é alterada.
+	'''
+
+	TABLE = TinyDB.DEFAULT_TABLE
+
+	def __init__(self, path, storage):
+		'''
+		Construtor da classe
+
+		* path    : caminho do arquivo do banco
+		* storage : armazenamento do TinyDB a ser utilizado (ver storages.make_storage)
+		'''
+		self.__db = TinyDB(path, storage=storage)
+		self.__lock = getattr(self.__db.storage, 'lock', None) or threading.RLock()
+
+		with self.__lock:
+			self.__load()
+
+
+	def __load(self):
+		'''
+		Lê a tabela do cadastro do armazenamento.
+		'''
+		self.__tables = self.__db.storage.read() or {}
+		self.__table = self.__tables.setdefault(self.TABLE, {})
+		self.__last_id = max((int(doc_id) for doc_id in self.__table), default=0)
+
+
+	def __write(self):
+		'''
+		Passa a tabela alterada para o armazenamento. Deve ser chamado com self.__lock adquirido.
+		'''
+		self.__db.storage.write(self.__tables)
+
+
+	def all(self):
+		'''
+		Retorna todos os documentos do banco
+		'''
+		with self.__lock:
+			return [Document(document, int(doc_id)) for doc_id, document in self.__table.items()]
+
+
+	def iterate(self):
+		'''
+		Retorna um gerador que percorre todos os documentos do banco, copiando um documento por vez
+		'''
+		with self.__lock:
+			doc_ids = list(self.__table)
+
+		for doc_id in doc_ids:
+			document = self.__table.get(doc_id)
+			if document is not None:
+				yield Document(document, int(doc_id))
+
+
+	def get(self, doc_id):
+		'''
+		Retorna o documento com o doc_id passado, ou None caso ele não exista
+		'''
+		document = self.__table.get(str(doc_id))
+
+		return Document(document, doc_id) if document is not None else None
+
+
+	def get_many(self, doc_ids, fields=None):
+		'''
+		Retorna os documentos existentes entre os doc_ids passados.
+		Caso fields seja passado, os documentos contêm apenas estes campos.
+		'''
+		documents = ((doc_id, self.__table.get(str(doc_id))) for doc_id in doc_ids)
+
+		return [_project(Document(document, doc_id), fields) for doc_id, document in documents if document is not None]
+
+
+	def search(self, field_name, field_value):
+		'''
+		Retorna os documentos cujo campo passado possua o valor passado
+		'''
+		with self.__lock:
+			return [Document(document, int(doc_id)) for doc_id, document in self.__table.items()
+				if field_name in document and document[field_name] == field_value]
+
+
+	def insert(self, document):
+		'''
+		Insere o documento passado, retornando seu doc_id
+		'''
+		with self.__lock:
+			self.__last_id += 1
+			self.__table[str(self.__last_id)] = dict(document)
+			self.__write()
+
+			return self.__last_id
+
+
+	def update(self, fields, doc_ids):
+		'''
+		Atualiza os campos passados nos documentos com os doc_ids passados, retornando os documentos atualizados.
+		O banco é gravado uma única vez.
+		'''
+		return self.update_many({doc_id: fields for doc_id in doc_ids})
+
+
+	def update_many(self, updates):
+		'''
+		Atualiza vários documentos em uma única gravação, retornando os documentos atualizados.
+
+		* updates : dicionário doc_id -> campos a serem atualizados no documento
+		'''
+		updated = []
+
+		with self.__lock:
+			for doc_id, fields in updates.items():
+				document = self.__table.get(str(doc_id))
+				if document is not None:
+					document = self.__table[str(doc_id)] = {**document, **fields}
+					updated.append(Document(document, doc_id))
+
+			if updated:
+				self.__write()
+
+		return updated
+
+
+	def remove(self, doc_ids):
+		'''
+		Remove os documentos com os doc_ids passados
+		'''
+		with self.__lock:
+			removed = [self.__table.pop(str(doc_id), None) for doc_id in doc_ids]
+			if any(document is not None for document in removed):
+				self.__write()
+
+
+	def refresh(self):
+		'''
+		Descarta a tabela mantida em memória e a lê novamente, para que as alterações gravadas por outros processos sejam lidas
+		'''
+		with self.__lock:
+			storage = self.__db.storage
+			if hasattr(storage, 'reload'):
+				storage.reload()
+
+			self.__load()
+
+
+	def flush(self):
+		'''
+		Grava no disco as alterações ainda pendentes no armazenamento
+		'''
+		with self.__lock:
+			storage = self.__db.storage
+			if hasattr(storage, 'flush'):
+				storage.flush()
+
+
+	def close(self):
+		'''
+		Grava as alterações pendentes e fecha o banco
+		'''
+		with self.__lock:
+			self.__db.close()
+
+
+class JournalEngine():
+	'''
+	Motor de armazenamento baseado em log de escrita antecipada (write-ahead log).
+
+	O cadastro é mantido em memória. Cada alteração é acrescentada como um único registro JSON
+	  no final do arquivo de journal do cadastro, de forma que o custo de uma escrita não depende
+	  do tamanho do cadastro.
+
+	O snapshot do cadastro é gravado no mesmo formato do TinyDB (database/<dbname>.json).
+	Ao iniciar, o snapshot é carregado e o journal é reaplicado sobre ele. Quando o journal atinge
+	  compact_threshold registros, uma thread em segundo plano o incorpora a um novo snapshot.
+
+	Todos os registros do journal são idempotentes (inserção e atualização atribuem valores, remoção apaga),
+	  portanto reaplicar registros já incorporados ao snapshot não altera o resultado.
+
+	Vários processos podem utilizar o mesmo cadastro, desde que compartilhem uma trava entre processos (process_lock)
+	  e as escritas sejam feitas com ela adquirida, após refresh(). Cada processo reaplica os registros acrescentados
+	  ao journal pelos demais a partir da posição até a qual já leu.
+	'''
+
+	TABLE = '_default'
+
+	def __init__(self, path, durability='safe', compact_threshold=10000, json_provider=None, process_lock=None):
+		'''
+		Construtor da classe
+
+		* path              : caminho do arquivo de snapshot do banco (database/<dbname>.json)
+		* durability        : 'safe' sincroniza o journal com o disco a cada registro; 'fast' deixa a sincronização a cargo do sistema operacional
+		* compact_threshold : número de registros no journal que dispara a compactação
+		* json_provider     : provedor de serialização JSON do journal e do snapshot (ver jsonprovider.py). Padrão: módulo json
+		* process_lock      : trava entre processos (ver processes.FileLock), caso o cadastro seja utilizado por vários processos
+		'''
+		if durability not in ('safe', 'fast'):
+			raise ValueError(f'Invalid durability: {durability}')
+
+		self.__path = path
+		self.__journal_path = os.path.splitext(path)[0] + '.journal'
+		self.__old_journal_path = self.__journal_path + '.old'
+		self.__fsync = durability == 'safe'
+		self.__compact_threshold = compact_threshold
+		self.__json = json_provider or StdlibJSONProvider()
+		self.__process_lock = process_lock or nullcontext()
+		self.__shared = process_lock is not None
+
+		self.__lock = threading.RLock()
+		self.__compact_lock = threading.Lock()
+		self.__compact_requested = threading.Event()
+		self.__closed = False
+
+		with self.__process_lock:
+			self.__load()
+
+			# Incorpora os registros reaplicados antes de iniciar um novo journal,
+			#   descartando também um possível registro incompleto no final do journal
+			journal_paths = (self.__old_journal_path, self.__journal_path)
+			if any(os.path.exists(journal_path) and os.path.getsize(journal_path) > 0 for journal_path in journal_paths):
+				self.__write_snapshot(self.__data)
+				for journal_path in journal_paths:
+					if os.path.exists(journal_path):
+						os.remove(journal_path)
+
+			self.__journal = open(self.__journal_path, 'a', encoding='utf-8')
+			self.__offset = os.fstat(self.__journal.fileno()).st_size
+			self.__records = 0
+
+		threading.Thread(target=self.__compact_when_requested, daemon=True).start()
+		atexit.register(self.close)
+
+
+	def __load(self):
+		'''
+		Carrega o snapshot e reaplica os journals existentes sobre ele.
+		Retorna a posição, em bytes, até a qual o journal corrente foi lido.
+		'''
+		self.__data = {}
+		if os.path.exists(self.__path) and os.path.getsize(self.__path) > 0:
+			with open(self.__path, 'r', encoding='utf-8') as f:
+				table = self.__json.loads(f.read()).get(self.TABLE, {})
+
+			self.__data = {int(doc_id): document for doc_id, document in table.items()}
+
+		self.__last_id = max(self.__data, default=0)
+
+		# O journal antigo só existe caso uma compactação tenha sido interrompida
+		offset = 0
+		for journal_path in (self.__old_journal_path, self.__journal_path):
+			offset = 0
+			if os.path.exists(journal_path):
+				with open(journal_path, 'rb') as f:
+					offset = self.__replay(f, 0)[1]
+
+		return offset
+
+
+	def __replay(self, f, offset):
+		'''
+		Reaplica os registros do journal, aberto em modo binário, a partir da posição passada.
+		Retorna o número de registros reaplicados e a posição, em bytes, até a qual o journal foi lido.
+		'''
+		replayed = 0
+		f.seek(offset)
+		for line in f:
+			# Último registro incompleto, gravado durante uma queda ou ainda sendo gravado por outro processo
+			if not line.endswith(b'\n'):
+				break
+
+			offset += len(line)
+			try:
+				record = self.__json.loads(line)
+
+			except ValueError:
+				# Registro incompleto seguido de registros de outro processo
+				continue
+
+			self.__apply(record)
+			replayed += 1
+
+		return replayed, offset
+
+
+	def refresh(self):
+		'''
+		Reaplica os registros acrescentados ao journal por outros processos.
+		Caso o journal tenha sido compactado por outro processo, recarrega o snapshot e o novo journal.
+		'''
+		with self.__lock:
+			try:
+				f = open(self.__journal_path, 'rb')
+
+			except FileNotFoundError:
+				f = None
+
+			# O journal aberto é comparado com o journal em uso, já que ele pode ter sido compactado e substituído
+			#   a qualquer momento por outro processo
+			with f or nullcontext():
+				if f is not None and os.fstat(f.fileno()).st_ino == os.fstat(self.__journal.fileno()).st_ino:
+					if os.fstat(f.fileno()).st_size > self.__offset:
+						replayed, self.__offset = self.__replay(f, self.__offset)
+						self.__records += replayed
+
+					return
+
+		# O snapshot e os journals não podem ser compactados por outro processo durante a leitura
+		with self.__process_lock, self.__lock:
+			self.__journal.close()
+			self.__offset = self.__load()
+			self.__journal = open(self.__journal_path, 'a', encoding='utf-8')
+
+
+	def __refresh_shared(self):
+		'''
+		Antes de uma escrita, caso o cadastro seja compartilhado, reaplica os registros dos outros processos
+		  e reabre o journal caso ele tenha sido compactado, para que a escrita não seja feita em um journal já incorporado.
+		'''
+		if self.__shared:
+			self.refresh()
+
+
+	def __apply(self, record):
+		'''
+		Aplica um registro do journal sobre o cadastro em memória.
+		'''
+		op = record['op']
+		if op == 'insert':
+			self.__data[record['doc_id']] = record['document']
+			self.__last_id = max(self.__last_id, record['doc_id'])
+
+		elif op == 'update':
+			for doc_id in record['doc_ids']:
+				if doc_id in self.__data:
+					self.__data[doc_id] = {**self.__data[doc_id], **record['fields']}
+
+		elif op == 'update_many':
+			for doc_id, fields in record['updates']:
+				if doc_id in self.__data:
+					self.__data[doc_id] = {**self.__data[doc_id], **fields}
+
+		elif op == 'remove':
+			for doc_id in record['doc_ids']:
+				self.__data.pop(doc_id, None)
+
+
+	def __append(self, record):
+		'''
+		Acrescenta o registro no journal e o aplica sobre o cadastro em memória.
+		Deve ser chamado com self.__lock adquirido.
+		'''
+		# Termina um registro incompleto deixado por um processo que caiu durante a gravação
+		if os.fstat(self.__journal.fileno()).st_size > self.__offset:
+			self.__journal.write('\n')
+			self.__journal.flush()
+			self.__offset = os.fstat(self.__journal.fileno()).st_size
+
+		line = self.__json.dumps(record) + '\n'
+		self.__journal.write(line)
+		self.__journal.flush()
+		if self.__fsync:
+			os.fsync(self.__journal.fileno())
+
+		self.__offset += len(line.encode('utf-8'))
+
+		self.__apply(record)
+
+		self.__records += 1
+		if self.__records >= self.__compact_threshold:
+			self.__compact_requested.set()
+
+
+	def __compact_when_requested(self):
+		'''
+		Executa a compactação sempre que ela for solicitada, até o banco ser fechado.
+		'''
+		while True:
+			self.__compact_requested.wait()
+			self.__compact_requested.clear()
+
+			if self.__closed:
+				return
+
+			self.compact()
+
+
+	def compact(self):
+		'''
+		Incorpora o journal a um novo snapshot do cadastro.
+
+		O journal corrente é renomeado e um novo journal é aberto, de forma que as escritas possam
+		  continuar enquanto o snapshot é gravado.
+		'''
+		with self.__compact_lock, self.__process_lock:
+			self.refresh()
+
+			with self.__lock:
+				if self.__records == 0:
+					return
+
+				self.__journal.close()
+				os.replace(self.__journal_path, self.__old_journal_path)
+				self.__journal = open(self.__journal_path, 'a', encoding='utf-8')
+				self.__offset = 0
+				self.__records = 0
+
+				# Os documentos nunca são alterados no lugar, então uma cópia rasa basta
+				snapshot = dict(self.__data)
+
+			self.__write_snapshot(snapshot)
+			os.remove(self.__old_journal_path)
+
+
+	def __write_snapshot(self, data):
+		'''
+		Grava o snapshot do cadastro no formato do TinyDB.
+		'''
+		tmp_path = self.__path + '.tmp'
+		with open(tmp_path, 'w', encoding='utf-8') as f:
+			f.write(self.__json.dumps({self.TABLE: {str(doc_id): document for doc_id, document in data.items()}}))
+			f.flush()
+			os.fsync(f.fileno())
+
+		os.replace(tmp_path, self.__path)
+
+
+	def all(self):
+		'''
+		Retorna todos os documentos do banco
+		'''
+		with self.__lock:
+			return [Document(document, doc_id) for doc_id, document in self.__data.items()]
+
+
+	def iterate(self):
+		'''
+		Retorna um gerador que percorre todos os documentos do banco, copiando um documento por vez
+		'''
+		with self.__lock:
+			doc_ids = list(self.__data)
+
+		for doc_id in doc_ids:
+			document = self.get(doc_id)
+			if document is not None:
+				yield document
+
+
+	def get(self, doc_id):
+		'''
+		Retorna o documento com o doc_id passado, ou None caso ele não exista
+		'''
+		document = self.__data.get(doc_id)
+
+		return Document(document, doc_id) if document is not None else None
+
+
+	def get_many(self, doc_ids, fields=None):
+		'''
+		Retorna os documentos existentes entre os doc_ids passados.
+		Caso fields seja passado, os documentos contêm apenas estes campos.
+		'''
+		documents = ((doc_id, self.__data.get(doc_id)) for doc_id in doc_ids)
+
+		return [_project(Document(document, doc_id), fields) for doc_id, document in documents if document is not None]
+
+
+	def search(self, field_name, field_value):
+		'''
+		Retorna os documentos cujo campo passado possua o valor passado
+		'''
+		return [document for document in self.all() if field_name in document and document[field_name] == field_value]
+
+
+	def insert(self, document):
+		'''
+		Insere o documento passado, retornando seu doc_id
+		'''
+		self.__refresh_shared()
+
+		with self.__lock:
+			self.__last_id += 1
+			self.__append({'op': 'insert', 'doc_id': self.__last_id, 'document': dict(document)})
+
+			return self.__last_id
+
+
+	def update(self, fields, doc_ids):
+		'''
+		Atualiza os campos passados nos documentos com os doc_ids passados, retornando os documentos atualizados
+		'''
+		self.__refresh_shared()
+
+		with self.__lock:
+			doc_ids = [doc_id for doc_id in doc_ids if doc_id in self.__data]
+			self.__append({'op': 'update', 'doc_ids': doc_ids, 'fields': dict(fields)})
+
+			return [Document(self.__data[doc_id], doc_id) for doc_id in doc_ids]
+
+
+	def update_many(self, updates):
+		'''
+		Atualiza vários documentos com um único registro no journal, retornando os documentos atualizados.
+		Um registro incompleto é descartado ao reaplicar o journal, portanto a atualização é tudo ou nada.
+
+		* updates : dicionário doc_id -> campos a serem atualizados no documento
+		'''
+		self.__refresh_shared()
+
+		with self.__lock:
+			updates = [[doc_id, dict(fields)] for doc_id, fields in updates.items() if doc_id in self.__data]
+			self.__append({'op': 'update_many', 'updates': updates})
+
+			return [Document(self.__data[doc_id], doc_id) for doc_id, fields in updates]
+
+
+	def remove(self, doc_ids):
+		'''
+		Remove os documentos com os doc_ids passados
+		'''
+		self.__refresh_shared()
+
+		with self.__lock:
+			self.__append({'op': 'remove', 'doc_ids': list(doc_ids)})
+
+
+	def flush(self):
+		'''
+		Sincroniza o journal com o disco
+		'''
+		with self.__lock:
+			self.__journal.flush()
+			os.fsync(self.__journal.fileno())
+
+
+	def close(self):
+		'''
+		Incorpora o journal ao snapshot e fecha o banco
+		'''
+		with self.__lock:
+			if self.__closed:
+				return
+
+			self.__closed = True
+
+		self.compact()
+
+		# Outro processo pode ter acrescentado registros ao journal depois da compactação
+		with self.__process_lock, self.__lock:
+			self.__journal.close()
+			if os.path.exists(self.__journal_path) and os.path.getsize(self.__journal_path) == 0:
+				os.remove(self.__journal_path)
+
+		self.__compact_requested.set()
+
+
+def _quote(identifier):
+	'''
+	Retorna o identificador passado entre aspas para uso em comandos SQL.
+	'''
+	return '"' + identifier.replace('"', '""') + '"'
+
+
+class SQLiteEngine():
+	'''
+	Motor de armazenamento que utiliza o SQLite (módulo sqlite3 da biblioteca padrão).
+
+	Cada cadastro é armazenado em uma tabela própria, em seu próprio arquivo (database/<dbname>.sqlite3).
+	Cada campo do cadastro se torna uma coluna cujo valor é armazenado em JSON, preservando o tipo dos valores
+	  (strings, números, booleanos, listas e dicionários). Campos não declarados que apareçam em atualizações
+	  ganham novas colunas automaticamente.
+
+	O banco utiliza o modo WAL, permitindo que leituras sejam feitas enquanto uma escrita está em andamento.
+	Cada thread utiliza sua própria conexão com o banco.
+	'''
+
+	DOC_ID = '_doc_id'
+
+	def __init__(self, path, table, fields, indexes=(), unique=(), durability='safe', json_provider=None):
+		'''
+		Construtor da classe
+
+		* path          : caminho do arquivo do banco
+		* table         : nome da tabela do cadastro
+		* fields        : campos do cadastro, que se tornam colunas da tabela
+		* indexes       : campos que devem possuir índice na tabela
+		* unique        : campos que devem possuir índice único na tabela
+		* durability    : 'safe' sincroniza o banco com o disco a cada transação; 'fast' sincroniza apenas nos checkpoints do WAL
+		* json_provider : provedor utilizado na leitura dos valores das colunas (ver jsonprovider.py). Padrão: módulo json
+
+		Os valores são sempre gravados com o módulo json, pois as consultas comparam o JSON gravado com o JSON do valor
+		  buscado, e a representação precisa ser a mesma independente do provedor configurado.
+		'''
+		if durability not in ('safe', 'fast'):
+			raise ValueError(f'Invalid durability: {durability}')
+
+		self.__path = path
+		self.__table = _quote(table)
+		self.__synchronous = 'FULL' if durability == 'safe' else 'NORMAL'
+		self.__json = json_provider or StdlibJSONProvider()
+
+		self.__local = threading.local()
+		self.__connections = []
+		self.__connections_lock = threading.Lock()
+		self.__known_columns = set()
+
+		connection = self.__connection()
+		with connection:
+			connection.execute(f'CREATE TABLE IF NOT EXISTS {self.__table} ({self.DOC_ID} INTEGER PRIMARY KEY AUTOINCREMENT)')
+
+		self.__ensure_columns(fields)
+
+		with connection:
+			for field in indexes:
+				connection.execute(f'CREATE INDEX IF NOT EXISTS {_quote(table + "_" + field)} ON {self.__table} ({_quote(field)})')
+
+			for field in unique:
+				connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {_quote(table + "_" + field + "_unique")} ON {self.__table} ({_quote(field)})')
+
+
+	def refresh(self):
+		'''
+		Nada a fazer: o SQLite não mantém o cadastro em memória, e as alterações dos outros processos são lidas diretamente do banco.
+		'''
+		pass
+
+
+	def __connection(self):
+		'''
+		Retorna a conexão da thread corrente, criando-a caso necessário.
+		'''
+		connection = getattr(self.__local, 'connection', None)
+		if connection is None:
+			connection = sqlite3.connect(self.__path, timeout=30, check_same_thread=False)
+			connection.execute('PRAGMA journal_mode=WAL')
+			connection.execute(f'PRAGMA synchronous={self.__synchronous}')
+
+			self.__local.connection = connection
+			with self.__connections_lock:
+				self.__connections.append(connection)
+
+		return connection
+
+
+	def __has_column(self, field):
+		'''
+		Indica se a tabela possui a coluna do campo passado.
+		As colunas conhecidas são mantidas em memória e relidas do banco apenas quando um campo não é encontrado,
+		  já que outro processo pode ter criado a coluna.
+		'''
+		if field not in self.__known_columns:
+			rows = self.__connection().execute(f'PRAGMA table_info({self.__table})')
+			self.__known_columns = {row[1] for row in rows if row[1] != self.DOC_ID}
+
+		return field in self.__known_columns
+
+
+	def __ensure_columns(self, fields):
+		'''
+		Cria as colunas dos campos passados que ainda não existam na tabela.
+		'''
+		missing = [field for field in fields if not self.__has_column(field)]
+		if not missing:
+			return
+
+		connection = self.__connection()
+		with connection:
+			for field in missing:
+				try:
+					connection.execute(f'ALTER TABLE {self.__table} ADD COLUMN {_quote(field)} TEXT')
+
+				except sqlite3.OperationalError:
+					# A coluna pode ter sido criada por outro processo
+					if not self.__has_column(field):
+						raise
+
+				self.__known_columns.add(field)
+
+
+	def __documents(self, cursor):
+		'''
+		Converte as linhas do cursor passado em documentos.
+		'''
+		columns = [description[0] for description in cursor.description]
+
+		return [self.__document(columns, row) for row in cursor]
+
+
+	def __document(self, columns, row):
+		'''
+		Converte uma linha da tabela em documento.
+		Colunas nulas correspondem a campos ausentes no documento.
+		'''
+		document = {column: self.__json.loads(value) for column, value in zip(columns[1:], row[1:]) if value is not None}
+
+		return Document(document, row[0])
+
+
+	def all(self):
+		'''
+		Retorna todos os documentos do banco
+		'''
+		return self.__documents(self.__connection().execute(f'SELECT * FROM {self.__table} ORDER BY {self.DOC_ID}'))
+
+
+	def iterate(self, batch_size=100):
+		'''
+		Retorna um gerador que percorre todos os documentos do banco, lendo batch_size linhas por vez
+		'''
+		cursor = self.__connection().execute(f'SELECT * FROM {self.__table} ORDER BY {self.DOC_ID}')
+		columns = [description[0] for description in cursor.description]
+
+		while True:
+			rows = cursor.fetchmany(batch_size)
+			if not rows:
+				return
+
+			for row in rows:
+				yield self.__document(columns, row)
+
+
+	def get(self, doc_id):
+		'''
+		Retorna o documento com o doc_id passado, ou None caso ele não exista
+		'''
+		documents = self.__documents(self.__connection().execute(f'SELECT * FROM {self.__table} WHERE {self.DOC_ID} = ?', (doc_id,)))
+
+		return documents[0] if documents else None
+
+
+	def get_many(self, doc_ids, fields=None, connection=None):
+		'''
+		Retorna os documentos existentes entre os doc_ids passados.
+		Caso fields seja passado, apenas as colunas destes campos são lidas do banco.
+		'''
+		connection = connection or self.__connection()
+		doc_ids = list(doc_ids)
+
+		columns = '*'
+		if fields is not None:
+			columns = ', '.join([self.DOC_ID] + [_quote(field) for field in fields if self.__has_column(field)])
+
+		# Limita o número de parâmetros por consulta
+		documents = []
+		for i in range(0, len(doc_ids), 500):
+			chunk = doc_ids[i:i + 500]
+			placeholders = ', '.join('?' for doc_id in chunk)
+			cursor = connection.execute(f'SELECT {columns} FROM {self.__table} WHERE {self.DOC_ID} IN ({placeholders})', chunk)
+			documents.extend(self.__documents(cursor))
+
+		return documents
+
+
+	def search(self, field_name, field_value):
+		'''
+		Retorna os documentos cujo campo passado possua o valor passado
+		'''
+		if not self.__has_column(field_name):
+			return []
+
+		cursor = self.__connection().execute(f'SELECT * FROM {self.__table} WHERE {_quote(field_name)} = ?', (json.dumps(field_value),))
+
+		return self.__documents(cursor)
+
+
+	def insert(self, document):
+		'''
+		Insere o documento passado, retornando seu doc_id
+		'''
+		self.__ensure_columns(document)
+
+		columns = ', '.join(_quote(field) for field in document)
+		values = ', '.join('?' for field in document)
+
+		connection = self.__connection()
+		with connection:
+			cursor = connection.execute(
+				f'INSERT INTO {self.__table} ({columns}) VALUES ({values})',
+				[json.dumps(value) for value in document.values()]
+			)
+
+		return cursor.lastrowid
+
+
+	def import_documents(self, documents):
+		'''
+		Insere os documentos passados mantendo seus doc_ids. Utilizado na migração dos cadastros.
+
+		* documents : dicionário doc_id -> documento
+		'''
+		fields = []
+		for document in documents.values():
+			fields.extend(field for field in document if field not in fields)
+
+		self.__ensure_columns(fields)
+
+		connection = self.__connection()
+		with connection:
+			for doc_id, document in documents.items():
+				columns = ', '.join([self.DOC_ID] + [_quote(field) for field in document])
+				values = ', '.join('?' for i in range(len(document) + 1))
+				connection.execute(
+					f'INSERT INTO {self.__table} ({columns}) VALUES ({values})',
+					[int(doc_id)] + [json.dumps(value) for value in document.values()]
+				)
+
+
+	def update(self, fields, doc_ids):
+		'''
+		Atualiza os campos passados nos documentos com os doc_ids passados, retornando os documentos atualizados.
+		A atualização e a leitura dos documentos são feitas na mesma transação.
+		'''
+		if not doc_ids:
+			return []
+
+		self.__ensure_columns(fields)
+
+		connection = self.__connection()
+		with connection:
+			if fields:
+				assignments = ', '.join(f'{_quote(field)} = ?' for field in fields)
+				values = [json.dumps(value) for value in fields.values()]
+				connection.executemany(
+					f'UPDATE {self.__table} SET {assignments} WHERE {self.DOC_ID} = ?',
+					[values + [doc_id] for doc_id in doc_ids]
+				)
+
+			return self.get_many(doc_ids, connection=connection)
+
+
+	def update_many(self, updates):
+		'''
+		Atualiza vários documentos em uma única transação, retornando os documentos atualizados.
+
+		* updates : dicionário doc_id -> campos a serem atualizados no documento
+		'''
+		if not updates:
+			return []
+
+		self.__ensure_columns({field for fields in updates.values() for field in fields})
+
+		connection = self.__connection()
+		with connection:
+			for doc_id, fields in updates.items():
+				if not fields:
+					continue
+
+				assignments = ', '.join(f'{_quote(field)} = ?' for field in fields)
+				connection.execute(
+					f'UPDATE {self.__table} SET {assignments} WHERE {self.DOC_ID} = ?',
+					[json.dumps(value) for value in fields.values()] + [doc_id]
+				)
+
+			return self.get_many(updates, connection=connection)
+
+
+	def remove(self, doc_ids):
+		'''
+		Remove os documentos com os doc_ids passados
+		'''
+		connection = self.__connection()
+		with connection:
+			connection.executemany(f'DELETE FROM {self.__table} WHERE {self.DOC_ID} = ?', [(doc_id,) for doc_id in doc_ids])
+
+
+	def flush(self):
+		'''
+		Incorpora o WAL ao arquivo principal do banco
+		'''
+		self.__connection().execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+
+	def close(self):
+		'''
+		Fecha todas as conexões com o banco
+		'''
+		with self.__connections_lock:
+			for connection in self.__connections:
+				connection.close()
+
+			self.__connections = []
+
+		self.__local = threading.local()
@@ -0,0 +1,34 @@
+# -*- coding:utf-8 -*-
+
+'''
+Configuração do gunicorn para os serviços da API.
+
+Uso (a partir do diretório services):
+
+gunicorn --config gunicorn.conf.py --bind 0.0.0.0:5001 medicines:api
+
+O número de workers e de threads pode ser passado na linha de comando (--workers, --threads) ou pelas
+  variáveis de ambiente GESTOR_WORKERS e GESTOR_THREADS.
+'''
+
+import os
+
+workers = int(os.environ.get('GESTOR_WORKERS', '1'))
+threads = int(os.environ.get('GESTOR_THREADS', '8'))
+worker_class = 'gthread'
+
+# Os cadastros, as threads de gravação e o pool de hash das senhas são criados ao importar o serviço,
+#   e não sobrevivem ao fork. Cada worker deve importar o serviço depois de criado
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+
+
+def on_starting(server):
+	'''
+	Habilita o modo multiprocesso dos cadastros quando há mais de um worker. Executado antes da criação dos workers,
+	  que herdam as variáveis de ambiente do processo principal.
+	'''
+	if server.cfg.workers > 1:
+		os.environ['GESTOR_DB_MULTIPROCESS'] = '1'
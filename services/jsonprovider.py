@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+
+import json
+
+try:
+	import orjson
+
+except ImportError:
+	orjson = None
+
+
+class StdlibJSONProvider():
+	'''
+	Serialização JSON com o módulo json da biblioteca padrão.
+	'''
+
+	name = 'stdlib'
+
+	def dumps(self, obj, sort_keys=False):
+		'''
+		Retorna o objeto serializado como string JSON.
+
+		* obj       : objeto a ser serializado
+		* sort_keys : se verdadeiro, ordena as chaves dos dicionários
+		'''
+		return json.dumps(obj, sort_keys=sort_keys)
+
+
+	def loads(self, data):
+		'''
+		Retorna o objeto contido na string (ou bytes) JSON passada.
+
+		* data : JSON a ser lido
+		'''
+		return json.loads(data)
+
+
+class OrjsonProvider():
+	'''
+	Serialização JSON com o pacote orjson, implementado em Rust e consideravelmente mais rápido que o módulo json.
+
+	Ao contrário do módulo json, os caracteres não ASCII são gravados em UTF-8 ao invés de escapados, e a saída não possui
+	  espaços após os separadores. Objetos não suportados pelo orjson são serializados com o módulo json.
+	'''
+
+	name = 'orjson'
+
+	def dumps(self, obj, sort_keys=False):
+		'''
+		Retorna o objeto serializado como string JSON.
+
+		* obj       : objeto a ser serializado
+		* sort_keys : se verdadeiro, ordena as chaves dos dicionários
+		'''
+		# O TinyDB grava os elementos com doc_ids inteiros como chaves
+		option = orjson.OPT_NON_STR_KEYS
+		if sort_keys:
+			option |= orjson.OPT_SORT_KEYS
+
+		try:
+			return orjson.dumps(obj, option=option).decode('utf-8')
+
+		except TypeError:
+			return json.dumps(obj, sort_keys=sort_keys)
+
+
+	def loads(self, data):
+		'''
+		Retorna o objeto contido na string (ou bytes) JSON passada.
+
+		* data : JSON a ser lido
+		'''
+		return orjson.loads(data)
+
+
+def make_provider(name='auto'):
+	'''
+	Retorna o provedor de serialização JSON de acordo com a configuração.
+
+	* name : 'auto' utiliza o orjson caso esteja instalado, e o módulo json caso contrário; 'orjson' ou 'stdlib' forçam o provedor
+	'''
+	if name == 'auto':
+		name = 'orjson' if orjson is not None else 'stdlib'
+
+	if name == 'stdlib':
+		return StdlibJSONProvider()
+
+	if name == 'orjson':
+		if orjson is None:
+			raise ValueError('JSON provider orjson is not installed')
+
+		return OrjsonProvider()
+
+	raise ValueError(f'Invalid JSON provider: {name}')
@@ -2,11 +2,17 @@
 
 import re
 import csv
-from io import StringIO
-from flask import Flask, jsonify, url_for, make_response, abort, request
+import heapq
+from io import StringIO, TextIOWrapper
+from flask import Flask, make_response, abort, request
 from werkzeug.utils import secure_filename
 from dbinterface import DBInterface
-from utils import API_MEDICINES_ROUTE, API_MEDICINES_PORT, token_required
+from salesaggregate import SalesAggregate
+from cache import LRUCache
+from server import serve
+from profiler import enable_profiling
+from metrics import instrument, cache_collector
+from utils import API_MEDICINES_ROUTE, API_MEDICINES_PORT, CACHE_SIZE, token_cache, token_required, jsonify, uri_builder, get_list_args, not_modified, stream_export
 
 
 api = Flask(__name__)
@@ -18,10 +24,50 @@ medicines = DBInterface('medicines', [
 	'price',
 	'manufacturer', 
 	'sales'
-])
+], indexes=['name', 'manufacturer'])
+
+# Agregado das vendas utilizado no relatório dos remédios mais consumidos
+# É atualizado por _update_sales a cada alteração dos remédios, dentro da mesma escrita no cadastro
+sales_aggregate = SalesAggregate()
+sales_aggregate.load(medicines.get_all_elements())
+
+# Cache das respostas das consultas por ID, invalidado a cada alteração dos remédios
+medicine_cache = LRUCache(CACHE_SIZE)
+medicines.subscribe(medicine_cache.invalidate)
+
+# Métricas das requisições e das operações no cadastro, disponíveis em GET /gestor/metrics
+instrument(api, cache_collector({'medicines': medicine_cache, 'tokens': token_cache}), databases=[medicines])
+
+# Profiling das requisições solicitado por administradores ou por amostragem, disponível em GET /gestor/profiles
+enable_profiling(api, 'medicines')
+
+
+def _update_sales(changed):
+	'''
+	Atualiza o agregado das vendas com os remédios criados, alterados ou removidos, por este ou por outros processos.
+	'''
+	for medicine_id, medicine in changed.items():
+		if medicine is None:
+			sales_aggregate.remove(medicine_id)
+
+		else:
+			sales_aggregate.set_sales(medicine_id, medicine['sales'])
+
+
+medicines.subscribe_elements(_update_sales)
+
+# Número de linhas dos arquivos CSV processadas por vez
+CSV_CHUNK_SIZE = 500
+
+# Número máximo de erros de linha listados na resposta das importações via CSV
+CSV_MAX_ROW_ERRORS = 100
 
 # Funções auxiliares
 
+# Monta a URI externa de um remédio a partir do seu ID
+medicine_uri = uri_builder('get_medicine', 'medicine_id')
+
+
 def make_public_medicine(medicine):
 	'''
 	Altera a forma de exibição de um elemento do cadastro.
@@ -31,7 +77,7 @@ def make_public_medicine(medicine):
 	new_medicine = {}
 	for field in medicine:
 		if field == 'id':
-			new_medicine['uri'] = url_for('get_medicine', medicine_id=medicine['id'], _external=True)
+			new_medicine['uri'] = medicine_uri(medicine['id'])
 
 		else:
 			new_medicine[field] = medicine[field]
@@ -39,6 +85,44 @@ def make_public_medicine(medicine):
 	return new_medicine
 
 
+def merge_sales(sales, new_sales):
+	'''
+	Retorna o registro de vendas resultante da combinação das vendas atuais com as novas.
+	As datas com quantidade 0 são apagadas do registro.
+
+	* sales     : registro de vendas atual do remédio
+	* new_sales : novas quantidades de vendas, por data
+	'''
+	return {date: quantity for date, quantity in {**sales, **new_sales}.items() if quantity != 0}
+
+
+def read_csv_chunks(csvfile, chunk_size=CSV_CHUNK_SIZE):
+	'''
+	Lê de forma incremental um arquivo CSV enviado na requisição, sem carregá-lo inteiro em memória.
+
+	* csvfile    : arquivo recebido em request.files
+	* chunk_size : número máximo de linhas em cada bloco
+
+	Retorna o cabeçalho do arquivo e um gerador de blocos de linhas. Cada linha é um par
+	  (número da linha no arquivo, dicionário cabeçalho -> valor).
+	'''
+	reader = csv.reader(TextIOWrapper(csvfile.stream, encoding='utf-8', newline=''))
+	keys = next(reader, [])
+
+	def chunks():
+		chunk = []
+		for values in reader:
+			chunk.append((reader.line_num, {k: v for k, v in zip(keys, values)}))
+			if len(chunk) == chunk_size:
+				yield chunk
+				chunk = []
+
+		if chunk:
+			yield chunk
+
+	return keys, chunks()
+
+
 # Tratamento dos erros
 
 @api.errorhandler(400)
@@ -172,15 +256,91 @@ def get_all_medicines(current_user):
 	'''
 	Retorna todos os remédios cadastrados.
 
+	A listagem pode ser paginada e restrita a alguns campos através dos argumentos da query string:
+
+	* limit  : número máximo de remédios na resposta. Quando passado, a resposta contém o campo 'next'.
+	* cursor : valor do campo 'next' da página anterior, para obter a página seguinte. 'next' é nulo na última página.
+	* fields : campos a serem retornados, separados por vírgula. A URI do remédio é sempre retornada.
+
 	Exemplo de requisição:
 
 	curl -i -X GET http://localhost:5001/gestor/medicines
+	curl -i -X GET 'http://localhost:5001/gestor/medicines?limit=50&fields=name,price'
 	'''
 	global medicines
 
-	public_medicines = [make_public_medicine(medicine) for medicine in medicines.get_all_elements()]
+	limit, cursor, fields = get_list_args(['name', 'type', 'dosage', 'price', 'manufacturer', 'sales'])
 
-	return jsonify({'medicines': public_medicines})
+	etag = medicines.get_version()
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	if limit is None and cursor is None and fields is None:
+		page, next_cursor = medicines.get_all_elements(), None
+
+	else:
+		page = medicines.get_page(limit, cursor, fields)
+		if page == -1:
+			abort(500)
+
+		page, next_cursor = page
+
+	public_medicines = [make_public_medicine(medicine) for medicine in page]
+
+	if limit is None:
+		response = jsonify({'medicines': public_medicines})
+
+	else:
+		response = jsonify({'medicines': public_medicines, 'next': next_cursor})
+
+	response.set_etag(etag)
+
+	return response
+
+
+@api.route(API_MEDICINES_ROUTE + '/export', methods=['GET'])
+@token_required
+def export_medicines(current_user):
+	'''
+	Exporta todos os remédios cadastrados, incluindo os registros de vendas.
+
+	Os remédios são lidos do banco e enviados um a um, mantendo o uso de memória limitado mesmo para cadastros grandes.
+
+	* format : argumento da query string. 'json' (padrão) retorna o mesmo formato da listagem; 'ndjson' retorna um remédio JSON por linha.
+
+	Exemplo de requisição:
+
+	curl -i -X GET 'http://localhost:5001/gestor/medicines/export?format=ndjson'
+	'''
+	global medicines
+
+	etag = medicines.get_version()
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	response = stream_export('medicines', medicines.iter_elements(), make_public_medicine)
+	response.set_etag(etag)
+
+	return response
+
+
+@api.route(API_MEDICINES_ROUTE + '/cache', methods=['GET'])
+@token_required
+def get_medicine_cache_stats(current_user):
+	'''
+	Retorna os contadores do cache das consultas de remédios por ID ('cache') e do cache de tokens verificados do serviço ('tokens'):
+	  número de elementos, tamanho máximo, acertos, falhas e descartes.
+
+	Exemplo de requisição:
+
+	curl -i -X GET http://localhost:5001/gestor/medicines/cache
+	'''
+	if not current_user['admin']:
+		abort(403)
+
+	return jsonify({'cache': medicine_cache.stats(), 'tokens': token_cache.stats()})
 
 
 @api.route(API_MEDICINES_ROUTE + '/<medicine_id>', methods=['GET'])
@@ -197,6 +357,23 @@ def get_medicine(current_user, medicine_id):
 	'''
 	global medicines
 
+	etag = medicines.get_version(medicine_id)
+	if etag is None:
+		abort(404)
+
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	# A resposta depende do host da requisição, devido às uris dos remédios
+	cached = medicine_cache.get(medicine_id, variant=request.host_url)
+	if cached is not None:
+		response = api.response_class(cached, mimetype='application/json')
+		response.set_etag(etag)
+
+		return response
+
+	token = medicine_cache.token()
 	medicine = medicines.get_element('id', medicine_id)
 
 	if medicine == []:
@@ -205,7 +382,11 @@ def get_medicine(current_user, medicine_id):
 	if medicine == -1:
 		abort(500)
 
-	return jsonify({'medicine': make_public_medicine(medicine[0])})
+	response = jsonify({'medicine': make_public_medicine(medicine[0])})
+	medicine_cache.put(medicine_id, response.get_data(), token, variant=request.host_url)
+	response.set_etag(etag)
+
+	return response
 
 
 @api.route(API_MEDICINES_ROUTE + '/mostconsumed', methods=['GET'])
@@ -247,38 +428,40 @@ def get_most_consumed_medicines():
 	begin = int(request_json.get('begin', '0'))
 	end = int(request_json.get('end', '99999999'))
 
-	minor_date = 99999999
-	major_date = 0
-	for medicine in medicines.get_all_elements():
-		sales = medicine['sales']
-		minor = min((int(date) for date in sales), default=minor_date)
-		minor_date = min(minor_date, minor)
-		major = max((int(date) for date in sales), default=major_date)
-		major_date = max(major_date, major)
-
-	# Uma vez descobertas as datas mais recente e mais remota entre todos os remédios, calcula-se o intervalo final de consulta
+	# As datas mais recente e mais remota entre todos os remédios limitam o intervalo final de consulta
+	minor_date, major_date = sales_aggregate.bounds()
 	begin = max(begin, minor_date)
 	end = min(end, major_date)
 
-	mostconsumed = []
-	for medicine in medicines.get_all_elements():
-		sales = medicine['sales']
-		if sales == {}:
-			continue
+	# Os totais de cada remédio no intervalo são obtidos do agregado de vendas, sem percorrer o cadastro
+	totals = sales_aggregate.totals(begin, end) if begin <= end else []
+
+	# Um valor negativo mantém o comportamento do corte da lista ordenada ([:most]): todos os remédios exceto os
+	#   'most' menos consumidos
+	if most < 0:
+		most = max(0, len(totals) + most)
+
+	# Seleciona os 'most' remédios mais consumidos com um heap limitado de pares (quantidade, ID),
+	#   de forma que apenas os vencedores sejam consultados no cadastro e convertidos para o formato público
+	winners = heapq.nlargest(most, ((quantity, medicine_id) for medicine_id, quantity in totals))
+
+	found = medicines.get_elements('id', [medicine_id for quantity, medicine_id in winners]) if winners else []
+	if found == -1:
+		abort(500)
+
+	names = {medicine['id']: medicine['name'] for medicine in found}
 
-		sales_in_interval = [quantity for date, quantity in sales.items() if begin <= int(date) <= end]
-		quantity = sum(sales_in_interval, start=0)
-		if quantity == 0:
+	mostconsumed = []
+	for quantity, medicine_id in winners:
+		if medicine_id not in names:
 			continue
 
 		d = {}
-		d['id'] = medicine['id']
-		d['name'] = medicine['name']
+		d['id'] = medicine_id
+		d['name'] = names[medicine_id]
 		d['quantity'] = quantity
 		mostconsumed.append(make_public_medicine(d))
 
-	mostconsumed = sorted(mostconsumed, key=lambda medicine : medicine['quantity'], reverse=True)[:most]
-
 	if 'csv' not in request_json or request_json['csv'] == 0:
 		return jsonify({'medicines': mostconsumed})
 
@@ -380,14 +563,6 @@ def update_medicine_sales(current_user, medicine_id):
 	'''
 	global medicines
 
-	medicine = medicines.get_element('id', medicine_id)
-
-	if medicine == []:
-		abort(404)
-
-	if medicine == -1:
-		abort(500)
-
 	request_json = request.json
 	if not request_json:
 		abort(400)
@@ -401,10 +576,12 @@ def update_medicine_sales(current_user, medicine_id):
 	if any(type(value) != int for value in request_json.values()):
 		abort(400)
 
-	new_sales = {**medicine[0]['sales'], **request_json}
-	new_sales = {k: v for k, v in new_sales.items() if v != 0}
+	# As vendas atuais são lidas e combinadas com as novas dentro da mesma escrita, para que requisições concorrentes
+	#   sobre o mesmo remédio não descartem as vendas umas das outras
+	medicine = medicines.update_element_with('id', medicine_id, lambda medicine: {'sales': merge_sales(medicine['sales'], request_json)})
+	if medicine == []:
+		abort(404)
 
-	medicine = medicines.update_element({'sales': new_sales}, 'id', medicine_id)
 	if medicine == -1:
 		abort(500)
 
@@ -428,51 +605,85 @@ def update_medicines_sales_with_csv(current_user):
 	* aaaa : dígitos do ano.
 	* mm   : dígitos do mês.
 	* dd   : dígitos do dia.
+
+	A importação é tudo ou nada: todas as linhas são validadas antes de qualquer alteração, e as vendas de todos os remédios são gravadas de uma única vez.
+	Caso alguma linha seja inválida, nenhum remédio é alterado e a resposta lista os erros de cada linha no campo 'rows'.
 	'''
 	global medicines
 
-	csvfile = request.files['file']
-	with StringIO(csvfile.read().decode()) as sio:
-		content = list(csv.reader(sio))
-
-	keys = content[0]
+	keys, chunks = read_csv_chunks(request.files['file'])
 	if 'id' not in keys:
 		abort(400)
 
 	if any(re.search('^\d{8}$', key) == None for key in keys[1:]):
 		abort(400)
 
-	updatelist = [{k: v for k, v in zip(keys, values)} for values in content[1:]]
-	new_medicines = []
-	for update in updatelist:
-		medicine_id = update.pop('id', '')
-		medicine = medicines.get_element('id', medicine_id)
+	# Apenas os IDs dos remédios referenciados no arquivo e as vendas do arquivo são mantidos em memória,
+	#   independentemente do número de linhas do arquivo
+	found_ids = set()
+	new_sales = {}
+	errors = []
+	error_count = 0
+	only_not_found = True
+	for chunk in chunks:
+		# Os remédios referenciados em cada bloco são obtidos em uma única consulta
+		chunk_ids = {update.get('id', '') for line, update in chunk} - found_ids
+		found = medicines.get_elements('id', list(chunk_ids)) if chunk_ids else []
+		if found == -1:
+			abort(500)
 
-		if medicine == []:
-			abort(404)
+		found_ids.update(medicine['id'] for medicine in found)
 
-		if medicine == -1:
-			abort(500)
+		for line, update in chunk:
+			row_errors = []
 
-		for date, quantity in update.items():
-			if quantity == '':
-				update[date] = medicine[0]['sales'].get(date, 0)
+			medicine_id = update.pop('id', '')
+			if medicine_id not in found_ids:
+				row_errors.append({'line': line, 'id': medicine_id, 'error': 'Not found'})
 
 			else:
-				try:
-					update[date] = int(quantity)
+				# Datas com o campo vazio mantêm o valor de venda atual
+				sales = {}
+				for date, quantity in update.items():
+					if quantity == '':
+						continue
 
-				except Exception:
-					abort(400)
+					try:
+						sales[date] = int(quantity)
 
-		new_sales = {**medicine[0]['sales'], **update}
-		new_sales = {k: v for k, v in new_sales.items() if v != 0}
+					except Exception:
+						row_errors.append({'line': line, 'id': medicine_id, 'error': f'Invalid quantity for {date}'})
 
-		medicine = medicines.update_element({'sales': new_sales}, 'id', medicine_id)
-		if medicine == -1:
-			abort(500)
+				# Um mesmo remédio pode aparecer em várias linhas do arquivo. As quantidades 0 são mantidas até a gravação,
+				#   para que apaguem as vendas atuais destas datas
+				new_sales[medicine_id] = {**new_sales.get(medicine_id, {}), **sales}
+
+			for error in row_errors:
+				error_count += 1
+				only_not_found = only_not_found and error['error'] == 'Not found'
+				if len(errors) < CSV_MAX_ROW_ERRORS:
+					errors.append(error)
+
+	if error_count:
+		if only_not_found:
+			return make_response(jsonify({'error': 'Not found', 'rows': errors, 'total': error_count}), 404)
 
-		new_medicines.append(make_public_medicine(medicine[0]))
+		return make_response(jsonify({'error': 'Bad request', 'rows': errors, 'total': error_count}), 400)
+
+	if not new_sales:
+		return jsonify({'medicines' : []})
+
+	# As vendas atuais são lidas e combinadas com as do arquivo dentro da mesma escrita, para que requisições
+	#   concorrentes não descartem as vendas umas das outras
+	updated = medicines.update_elements_with(list(new_sales), lambda medicine: {'sales': merge_sales(medicine['sales'], new_sales[medicine['id']])})
+	if updated == -1:
+		abort(500)
+
+	if updated == []:
+		abort(404)
+
+	updated = {medicine['id']: medicine for medicine in updated}
+	new_medicines = [make_public_medicine(updated[medicine_id]) for medicine_id in new_sales]
 
 	return jsonify({'medicines' : new_medicines})
 
@@ -492,58 +703,67 @@ def update_medicines_with_csv(current_user):
 	* 'dosage'		 : dosagem do remédio. Valor deve ser uma string.
 	* 'price'		 : preço do remédio. Valor deve ser um float.
 	* 'manufacturer' : fabricante do remédio. Valor deve ser uma string.
+
+	O campo 'sales' não é atualizado via este método. Para tal, o método update_medicines_sales_with_csv é utilizado.
+
+	A importação é tudo ou nada: todas as linhas são validadas antes de qualquer alteração, e os remédios são gravados de uma única vez.
+	Caso alguma linha seja inválida ou algum remédio não exista, nenhum remédio é alterado.
 	'''
 	global medicines
 
-	csvfile = request.files['file']
-	with StringIO(csvfile.read().decode()) as sio:
-		content = list(csv.reader(sio))
-
-	keys = content[0]
+	keys, chunks = read_csv_chunks(request.files['file'])
 	if 'id' not in keys:
 		abort(400)
 
-	updatelist = [{k: v for k, v in zip(keys, values)} for values in content[1:]]
-	new_medicines = []
-	for update in updatelist:
-		medicine_id = update.pop('id', '')
-		medicine = medicines.get_element('id', medicine_id)
-		if medicine == []:
-			abort(404)
+	# O registro de vendas é um dicionário, e não pode ser substituído pelo texto de uma coluna
+	if 'sales' in keys:
+		abort(400)
 
-		if medicine == -1:
-			abort(500)
+	# O arquivo é lido em blocos, mas apenas as alterações de cada remédio, já combinadas, são mantidas em memória
+	updates = {}
+	for chunk in chunks:
+		for line, update in chunk:
+			medicine_id = update.pop('id', '')
 
-		if 'name' in update and type(update['name']) != str:
-			abort(400)
+			if 'name' in update and type(update['name']) != str:
+				abort(400)
 
-		if 'type' in update and type(update['type']) != str:
-			abort(400)
+			if 'type' in update and type(update['type']) != str:
+				abort(400)
 
-		if 'dosage' in update and type(update['dosage']) != str:
-			abort(400)
+			if 'dosage' in update and type(update['dosage']) != str:
+				abort(400)
 
-		if 'price' in update and update['price'] != '':
-			try:
-				update['price'] = float(update['price'])
+			if 'price' in update and update['price'] != '':
+				try:
+					update['price'] = float(update['price'])
 
-			except Exception:
+				except Exception:
+					abort(400)
+
+			if 'manufacturer' in update and type(update['manufacturer']) != str:
 				abort(400)
 
-		if 'manufacturer' in update and type(update['manufacturer']) != str:
-			abort(400)
+			update = {k: v for k, v in update.items() if v != ''}
 
-		update = {k: v for k, v in update.items() if v != ''}
+			# Um mesmo remédio pode aparecer em várias linhas do arquivo
+			updates[medicine_id] = {**updates.get(medicine_id, {}), **update}
 
-		medicine = medicines.update_element(update, 'id', medicine_id)
-		if medicine == -1:
-			abort(500)
+	if not updates:
+		return jsonify({'medicines' : []})
 
-		new_medicines.append(make_public_medicine(medicine[0]))
+	# Todas as linhas foram validadas, então os remédios são gravados de uma única vez.
+	# Caso algum dos remédios não exista, nenhum é alterado
+	updated = medicines.update_elements(updates)
+	if updated == -1:
+		abort(500)
 
-	return jsonify({'medicines' : new_medicines})
+	if updated == []:
+		abort(404)
+
+	return jsonify({'medicines' : [make_public_medicine(medicine) for medicine in updated]})
 
 
 if __name__ == '__main__':
-	api.run(port=API_MEDICINES_PORT, debug=True)
+	serve(api, 'medicines', API_MEDICINES_PORT)
 
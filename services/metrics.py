@@ -0,0 +1,347 @@
+# -*- coding:utf-8 -*-
+
+import time
+import threading
+from bisect import bisect_left
+from flask import request, g, Response, has_request_context
+from utils import API_ROUTE, METRICS
+
+
+# Tipo de conteúdo do formato texto do Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites, em segundos, das faixas dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Limites, em bytes, das faixas do histograma do tamanho das respostas
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Rótulo das requisições que não correspondem a nenhuma rota
+UNMATCHED_ENDPOINT = 'unmatched'
+
+# Rótulo das operações nos cadastros feitas fora de uma requisição (ex.: na inicialização do serviço)
+NO_ENDPOINT = 'none'
+
+
+def _format_value(value):
+	if isinstance(value, float):
+		if value == float('inf'):
+			return '+Inf'
+
+		return repr(value)
+
+	return str(int(value))
+
+
+def _format_labels(labels):
+	if not labels:
+		return ''
+
+	escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+
+	return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Histogram():
+	'''
+	Histograma com faixas fixas, no formato do Prometheus. Não é thread-safe: deve ser utilizado com a trava de Metrics.
+	'''
+
+	def __init__(self, buckets):
+		'''
+		Construtor da classe
+
+		* buckets : limites superiores das faixas, em ordem crescente
+		'''
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+
+	def samples(self, name, labels):
+		'''
+		Retorna as amostras (nome, rótulos, valor) do histograma, com as contagens acumuladas de cada faixa.
+		'''
+		samples = []
+		cumulative = 0
+		for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+			cumulative += count
+			samples.append((name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+
+		samples.append((name + '_sum', labels, self.sum))
+		samples.append((name + '_count', labels, self.count))
+
+		return samples
+
+
+class Metrics():
+	'''
+	Métricas de um serviço: número de requisições por rota, método e código de resposta, histogramas da latência e do
+	  tamanho das respostas de cada rota, histograma da duração da validação dos tokens por token_required, e número,
+	  duração e elementos encontrados das operações nos cadastros (ver DBInterface.subscribe_operations()).
+
+	Outras métricas (ex.: contadores dos caches) podem ser adicionadas com register(). Elas são obtidas apenas quando
+	  as métricas são consultadas.
+
+	As métricas são mantidas em memória por processo. Com vários workers, cada consulta retorna as métricas de um deles.
+	'''
+
+	def __init__(self):
+		self.__lock = threading.Lock()
+		self.__started = time.time()
+
+		# (método, rota, código) -> número de requisições
+		self.__requests = {}
+
+		# (método, rota) -> histograma
+		self.__latencies = {}
+		self.__sizes = {}
+
+		# resultado da validação -> histograma
+		self.__tokens = {}
+
+		# (cadastro, operação, rota, percorreu o cadastro) -> [número de operações, elementos encontrados]
+		self.__operations = {}
+
+		# (cadastro, operação) -> histograma
+		self.__operation_latencies = {}
+
+		self.__collectors = []
+
+
+	def observe_request(self, method, endpoint, status, seconds, size=None):
+		'''
+		Registra uma requisição atendida.
+
+		* method   : método HTTP da requisição
+		* endpoint : regra da rota (ex.: '/gestor/medicines/<medicine_id>')
+		* status   : código da resposta
+		* seconds  : duração do atendimento da requisição, em segundos
+		* size     : tamanho do corpo da resposta, em bytes. Respostas enviadas em partes não têm tamanho conhecido e devem passar None
+		'''
+		key = (method, endpoint)
+
+		with self.__lock:
+			self.__requests[key + (status,)] = self.__requests.get(key + (status,), 0) + 1
+
+			latencies = self.__latencies.get(key)
+			if latencies is None:
+				latencies = self.__latencies[key] = Histogram(LATENCY_BUCKETS)
+
+			latencies.observe(seconds)
+
+			if size is not None:
+				sizes = self.__sizes.get(key)
+				if sizes is None:
+					sizes = self.__sizes[key] = Histogram(SIZE_BUCKETS)
+
+				sizes.observe(size)
+
+
+	def observe_token(self, result, seconds):
+		'''
+		Registra uma validação de token feita por token_required.
+
+		* result  : resultado da validação ('cached', 'verified', 'missing', 'invalid' ou 'inactive')
+		* seconds : duração da validação, em segundos
+		'''
+		with self.__lock:
+			histogram = self.__tokens.get(result)
+			if histogram is None:
+				histogram = self.__tokens[result] = Histogram(LATENCY_BUCKETS)
+
+			histogram.observe(seconds)
+
+
+	def observe_operation(self, event):
+		'''
+		Registra uma operação em um cadastro, associada à rota da requisição corrente.
+		Deve ser registrada com DBInterface.subscribe_operations().
+
+		* event : dicionário com os dados da operação, no formato de DBInterface.subscribe_operations()
+		'''
+		endpoint = NO_ENDPOINT
+		if has_request_context():
+			endpoint = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ENDPOINT
+
+		key = (event['table'], event['operation'])
+
+		with self.__lock:
+			counters = self.__operations.get(key + (endpoint, event['scan']))
+			if counters is None:
+				counters = self.__operations[key + (endpoint, event['scan'])] = [0, 0]
+
+			counters[0] += 1
+			counters[1] += event['matched']
+
+			latencies = self.__operation_latencies.get(key)
+			if latencies is None:
+				latencies = self.__operation_latencies[key] = Histogram(LATENCY_BUCKETS)
+
+			latencies.observe(event['seconds'])
+
+
+	def register(self, collector):
+		'''
+		Adiciona métricas obtidas no momento da consulta.
+
+		* collector : função sem argumentos que retorna uma lista de tuplas (nome, tipo, descrição, amostras), em que
+		              amostras é uma lista de tuplas (rótulos, valor) e rótulos é um dicionário
+		'''
+		self.__collectors.append(collector)
+
+
+	def render(self):
+		'''
+		Retorna as métricas no formato texto do Prometheus.
+		'''
+		with self.__lock:
+			requests = [({'method': method, 'endpoint': endpoint, 'status': status}, count)
+				for (method, endpoint, status), count in sorted(self.__requests.items())]
+
+			latencies = [sample for (method, endpoint), histogram in sorted(self.__latencies.items())
+				for sample in histogram.samples('gestor_http_request_duration_seconds', {'method': method, 'endpoint': endpoint})]
+
+			sizes = [sample for (method, endpoint), histogram in sorted(self.__sizes.items())
+				for sample in histogram.samples('gestor_http_response_size_bytes', {'method': method, 'endpoint': endpoint})]
+
+			tokens = [sample for result, histogram in sorted(self.__tokens.items())
+				for sample in histogram.samples('gestor_token_check_duration_seconds', {'result': result})]
+
+			operations = [({'table': table, 'operation': operation, 'endpoint': endpoint, 'scan': str(scan).lower()}, counters[:])
+				for (table, operation, endpoint, scan), counters in sorted(self.__operations.items())]
+
+			operation_latencies = [sample for (table, operation), histogram in sorted(self.__operation_latencies.items())
+				for sample in histogram.samples('gestor_db_operation_duration_seconds', {'table': table, 'operation': operation})]
+
+		lines = []
+
+		def family(name, metric_type, description, samples):
+			lines.append(f'# HELP {name} {description}')
+			lines.append(f'# TYPE {name} {metric_type}')
+			for sample_name, labels, value in samples:
+				lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+
+		family('gestor_process_start_time_seconds', 'gauge', 'Start time of the process since unix epoch in seconds.',
+			[('gestor_process_start_time_seconds', {}, self.__started)])
+		family('gestor_http_requests_total', 'counter', 'Requests handled, by endpoint, method and status code.',
+			[('gestor_http_requests_total', labels, count) for labels, count in requests])
+		family('gestor_http_request_duration_seconds', 'histogram', 'Request handling time in seconds.', latencies)
+		family('gestor_http_response_size_bytes', 'histogram', 'Response body size in bytes. Streamed responses are not included.', sizes)
+		family('gestor_token_check_duration_seconds', 'histogram', 'Token validation time in seconds, by result.', tokens)
+		family('gestor_db_operations_total', 'counter', 'Storage operations, by table, operation, endpoint and whether they scanned the table.',
+			[('gestor_db_operations_total', labels, counters[0]) for labels, counters in operations])
+		family('gestor_db_matched_documents_total', 'counter', 'Documents matched by storage operations.',
+			[('gestor_db_matched_documents_total', labels, counters[1]) for labels, counters in operations])
+		family('gestor_db_operation_duration_seconds', 'histogram', 'Storage operation time in seconds.', operation_latencies)
+
+		for collector in self.__collectors:
+			for name, metric_type, description, samples in collector():
+				family(name, metric_type, description, [(name, labels, value) for labels, value in samples])
+
+		return '\n'.join(lines) + '\n'
+
+
+def cache_collector(caches):
+	'''
+	Retorna um coletor dos contadores dos caches passados (LRUCache ou TokenCache), para uso com Metrics.register().
+
+	* caches : dicionário nome do cache -> cache
+	'''
+	def collect():
+		stats = {name: cache.stats() for name, cache in caches.items()}
+
+		return [
+			('gestor_cache_entries', 'gauge', 'Entries currently in the cache.',
+				[({'cache': name}, values['size']) for name, values in stats.items()]),
+			('gestor_cache_max_entries', 'gauge', 'Maximum number of entries in the cache.',
+				[({'cache': name}, values['maxsize']) for name, values in stats.items()]),
+			('gestor_cache_hits_total', 'counter', 'Cache lookups that found an entry.',
+				[({'cache': name}, values['hits']) for name, values in stats.items()]),
+			('gestor_cache_misses_total', 'counter', 'Cache lookups that found no entry.',
+				[({'cache': name}, values['misses']) for name, values in stats.items()]),
+			('gestor_cache_evictions_total', 'counter', 'Entries discarded to make room for new ones.',
+				[({'cache': name}, values['evictions']) for name, values in stats.items()])
+		]
+
+	return collect
+
+
+def password_collector(stats):
+	'''
+	Retorna um coletor dos contadores do pool de hashes das senhas, para uso com Metrics.register().
+
+	* stats : função que retorna os contadores do pool (passwords.stats)
+	'''
+	def collect():
+		values = stats()
+
+		return [
+			('gestor_password_workers', 'gauge', 'Threads that hash and verify passwords.', [({}, values['workers'])]),
+			('gestor_password_max_pending', 'gauge', 'Maximum number of pending password operations.', [({}, values['max_pending'])]),
+			('gestor_password_operations_total', 'counter', 'Password operations, by result.',
+				[({'result': 'completed'}, values['completed']), ({'result': 'rejected'}, values['rejected'])]),
+			('gestor_password_operation_mean_seconds', 'gauge', 'Mean time of a password operation, including the wait for a worker.',
+				[({}, values['mean_seconds'])])
+		]
+
+	return collect
+
+
+def instrument(api, *collectors, databases=()):
+	'''
+	Registra as métricas das requisições do aplicativo Flask e das operações nos cadastros do serviço, e disponibiliza
+	  a rota GET /gestor/metrics, que retorna as métricas no formato texto do Prometheus.
+
+	Retorna o objeto Metrics do aplicativo, também disponível em api.extensions['metrics'], ou None caso as métricas
+	  estejam desativadas (GESTOR_METRICS diferente de 1, o padrão).
+
+	* api        : aplicativo Flask do serviço
+	* collectors : coletores de métricas adicionais (ver Metrics.register())
+	* databases  : cadastros (DBInterface) cujas operações são registradas
+	'''
+	if not METRICS:
+		return None
+
+	metrics = Metrics()
+	for collector in collectors:
+		metrics.register(collector)
+
+	api.extensions['metrics'] = metrics
+
+	for database in databases:
+		database.subscribe_operations(metrics.observe_operation)
+
+	@api.before_request
+	def start_request_timer():
+		g.metrics_start = time.perf_counter()
+
+	@api.after_request
+	def observe_request(response):
+		start = g.pop('metrics_start', None)
+		if start is not None:
+			endpoint = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ENDPOINT
+			metrics.observe_request(request.method, endpoint, response.status_code, time.perf_counter() - start, response.content_length)
+
+		return response
+
+	def get_metrics():
+		'''
+		Retorna as métricas do serviço no formato texto do Prometheus.
+
+		Exemplo de requisição:
+
+		curl -i -X GET http://localhost:5001/gestor/metrics
+		'''
+		return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+	api.add_url_rule(API_ROUTE + '/metrics', 'get_metrics', get_metrics, methods=['GET'])
+
+	return metrics
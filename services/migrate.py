@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import json
+from engines import SQLiteEngine
+from utils import db_dir
+
+
+DBNAMES = ['medicines', 'clients', 'users']
+
+
+def migrate(dbname):
+	'''
+	Importa o cadastro do arquivo do TinyDB (<dbname>.json) para o banco SQLite (<dbname>.sqlite3), no diretório dos cadastros.
+	Os doc_ids e IDs dos elementos são mantidos.
+
+	Retorna o número de elementos importados, ou -1 caso o banco SQLite do cadastro já possua elementos.
+
+	* dbname : nome do cadastro a ser migrado
+	'''
+	json_path = f'{db_dir()}/{dbname}.json'
+	sqlite_path = f'{db_dir()}/{dbname}.sqlite3'
+
+	documents = {}
+	if os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+		with open(json_path, 'r', encoding='utf-8') as f:
+			documents = json.load(f).get('_default', {})
+
+	engine = SQLiteEngine(sqlite_path, dbname, [])
+	try:
+		if engine.all() != []:
+			return -1
+
+		engine.import_documents(documents)
+
+	finally:
+		engine.close()
+
+	return len(documents)
+
+
+if __name__ == '__main__':
+	# Uso: python migrate.py [cadastro ...]
+	# Caso nenhum cadastro seja passado, migra todos os cadastros da API
+	for dbname in sys.argv[1:] or DBNAMES:
+		count = migrate(dbname)
+		if count == -1:
+			print(f'{dbname}: banco SQLite já possui elementos, migração ignorada')
+
+		else:
+			print(f'{dbname}: {count} elementos migrados')
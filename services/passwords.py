@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils import PASSWORD_ITERATIONS, PASSWORD_WORKERS, PASSWORD_MAX_PENDING
+
+
+# Método de hash utilizado nas senhas novas e nas senhas cujo hash utiliza parâmetros diferentes
+PASSWORD_METHOD = f'pbkdf2:sha256:{PASSWORD_ITERATIONS}'
+
+# Valor retornado quando o pool de verificação está sobrecarregado
+BUSY_ERROR = -1
+
+
+# O cálculo do PBKDF2 libera o GIL, de forma que os workers do pool executam em paralelo.
+# O número de operações pendentes é limitado para que uma rajada de logins seja recusada
+#   rapidamente, ao invés de acumular requisições aguardando indefinidamente.
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix='passwords')
+_pending = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+
+_stats_lock = threading.Lock()
+_stats = {
+	'completed'	: 0,
+	'rejected'	: 0,
+	'seconds'	: 0.0
+}
+
+
+def needs_rehash(pwhash):
+	'''
+	Retorna verdadeiro caso o hash passado não utilize o método e o custo configurados atualmente.
+
+	* pwhash : hash da senha armazenado no cadastro
+	'''
+	return pwhash.split('$', 1)[0] != PASSWORD_METHOD
+
+
+def _verify(pwhash, password):
+	'''
+	Verifica a senha e calcula o novo hash caso necessário. Executado nos workers do pool.
+	'''
+	if not check_password_hash(pwhash, password):
+		return False, None
+
+	if needs_rehash(pwhash):
+		return True, generate_password_hash(password, method=PASSWORD_METHOD)
+
+	return True, None
+
+
+def _submit(func, *args):
+	'''
+	Executa a função passada em um worker do pool e retorna seu resultado, ou BUSY_ERROR caso o limite de operações pendentes tenha sido atingido.
+	'''
+	if not _pending.acquire(blocking=False):
+		with _stats_lock:
+			_stats['rejected'] += 1
+
+		return BUSY_ERROR
+
+	start = time.perf_counter()
+	try:
+		return _executor.submit(func, *args).result()
+
+	finally:
+		_pending.release()
+
+		with _stats_lock:
+			_stats['completed'] += 1
+			_stats['seconds'] += time.perf_counter() - start
+
+
+def hash_password(password):
+	'''
+	Retorna o hash da senha passada, calculado com o método e o custo configurados.
+	Retorna BUSY_ERROR caso o pool esteja sobrecarregado.
+
+	* password : senha em texto puro
+	'''
+	return _submit(generate_password_hash, password, PASSWORD_METHOD)
+
+
+def verify_password(pwhash, password):
+	'''
+	Verifica se a senha corresponde ao hash armazenado.
+
+	Retorna uma tupla (senha válida, novo hash). O novo hash é diferente de None quando a senha é válida e o
+	  hash armazenado utiliza parâmetros diferentes dos atuais, e deve substituir o hash armazenado.
+	Retorna BUSY_ERROR caso o pool esteja sobrecarregado.
+
+	* pwhash   : hash da senha armazenado no cadastro
+	* password : senha em texto puro
+	'''
+	return _submit(_verify, pwhash, password)
+
+
+def stats():
+	'''
+	Retorna os contadores do pool: operações concluídas, operações recusadas por sobrecarga e tempo médio, em segundos,
+	  de cada operação (incluindo a espera por um worker livre).
+	'''
+	with _stats_lock:
+		completed = _stats['completed']
+
+		return {
+			'workers'		: PASSWORD_WORKERS,
+			'max_pending'	: PASSWORD_MAX_PENDING,
+			'completed'		: completed,
+			'rejected'		: _stats['rejected'],
+			'mean_seconds'	: _stats['seconds'] / completed if completed else 0.0
+		}
@@ -0,0 +1,233 @@
+# -*- coding:utf-8 -*-
+
+import os
+import json
+import threading
+from contextlib import nullcontext
+
+try:
+	import fcntl
+
+except ImportError:
+	fcntl = None
+	import msvcrt
+
+
+class FileLock():
+	'''
+	Trava exclusiva entre processos, baseada na trava de um arquivo (advisory lock).
+
+	A trava também exclui as demais threads do processo, e pode ser adquirida novamente pela thread que já a possui.
+	'''
+
+	def __init__(self, path):
+		'''
+		Construtor da classe
+
+		* path : caminho do arquivo utilizado como trava. É criado caso não exista
+		'''
+		self.__path = path
+		self.__file = open(path, 'a+b')
+		self.__lock = threading.RLock()
+		self.__depth = 0
+
+		# Um processo filho criado com fork compartilharia a trava do arquivo com o processo pai
+		if hasattr(os, 'register_at_fork'):
+			os.register_at_fork(after_in_child=self.__reopen)
+
+
+	def __reopen(self):
+		'''
+		Reabre o arquivo da trava no processo filho, sem a trava adquirida.
+		'''
+		self.__file = open(self.__path, 'a+b')
+		self.__lock = threading.RLock()
+		self.__depth = 0
+
+
+	def acquire(self):
+		'''
+		Adquire a trava, aguardando caso ela esteja com outra thread ou outro processo.
+		'''
+		self.__lock.acquire()
+		if self.__depth == 0:
+			try:
+				self.__lock_file()
+
+			except Exception:
+				self.__lock.release()
+				raise
+
+		self.__depth += 1
+
+
+	def release(self):
+		'''
+		Libera a trava.
+		'''
+		self.__depth -= 1
+		if self.__depth == 0:
+			self.__unlock_file()
+
+		self.__lock.release()
+
+
+	def __enter__(self):
+		self.acquire()
+
+		return self
+
+
+	def __exit__(self, *args):
+		self.release()
+
+
+	def __lock_file(self):
+		if fcntl is not None:
+			fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX)
+			return
+
+		# No Windows, LK_LOCK desiste após 10 tentativas, então tenta novamente até conseguir
+		self.__file.seek(0)
+		while True:
+			try:
+				msvcrt.locking(self.__file.fileno(), msvcrt.LK_LOCK, 1)
+				return
+
+			except OSError:
+				continue
+
+
+	def __unlock_file(self):
+		if fcntl is not None:
+			fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+			return
+
+		self.__file.seek(0)
+		msvcrt.locking(self.__file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ChangeLog():
+	'''
+	Registro, compartilhado entre os processos, das alterações feitas em um cadastro.
+
+	Cada linha do arquivo corresponde a uma escrita, e contém os pares [ID do elemento, doc_id] alterados por ela.
+	O doc_id é nulo para elementos removidos. Cada processo guarda a posição do arquivo até a qual já leu, de forma
+	  que apenas os elementos alterados pelos outros processos precisam ser recarregados.
+
+	Quando o arquivo atinge max_size bytes, ele é substituído por um arquivo vazio. Os processos percebem a troca
+	  do arquivo e recarregam o cadastro inteiro.
+
+	As escritas no registro devem ser feitas com a trava do cadastro adquirida.
+	'''
+
+	def __init__(self, path, max_size=1 << 20):
+		'''
+		Construtor da classe
+
+		* path     : caminho do arquivo do registro. É criado caso não exista
+		* max_size : tamanho, em bytes, a partir do qual o arquivo é reiniciado
+		'''
+		self.__path = path
+		self.__max_size = max_size
+
+		self.__open()
+
+
+	def __open(self):
+		'''
+		Abre o arquivo corrente do registro, considerando as alterações registradas até o momento como já lidas.
+		'''
+		# O arquivo é mantido aberto para que seu inode não seja reaproveitado por um novo arquivo do registro,
+		#   o que impediria a detecção da troca do arquivo
+		self.__file = open(self.__path, 'ab')
+		self.__inode = os.fstat(self.__file.fileno()).st_ino
+		self.__offset = os.fstat(self.__file.fileno()).st_size
+
+
+	def __reopen(self):
+		'''
+		Passa a utilizar o arquivo corrente do registro, após ele ter sido reiniciado.
+		'''
+		self.__file.close()
+		self.__open()
+
+
+	def read(self):
+		'''
+		Retorna as alterações registradas desde a última leitura, como um dicionário ID do elemento -> doc_id.
+
+		Retorna None caso o arquivo tenha sido reiniciado, situação em que o cadastro deve ser recarregado por inteiro.
+		'''
+		try:
+			stat = os.stat(self.__path)
+
+		except FileNotFoundError:
+			stat = None
+
+		if stat is not None and stat.st_ino == self.__inode and stat.st_size <= self.__offset:
+			return {}
+
+		try:
+			f = open(self.__path, 'rb')
+
+		except FileNotFoundError:
+			f = None
+
+		with f or nullcontext():
+			# O arquivo pode ter sido reiniciado depois da consulta acima
+			if f is None or os.fstat(f.fileno()).st_ino != self.__inode:
+				self.__reopen()
+
+				return None
+
+			size = os.fstat(f.fileno()).st_size
+			if size <= self.__offset:
+				return {}
+
+			f.seek(self.__offset)
+			data = f.read(size - self.__offset)
+
+		# Uma linha sem quebra de linha ainda está sendo gravada, e é lida na próxima vez
+		data = data[:data.rfind(b'\n') + 1]
+		self.__offset += len(data)
+
+		changes = {}
+		for line in data.splitlines():
+			try:
+				changes.update(json.loads(line))
+
+			except ValueError:
+				# Linha incompleta deixada por um processo que caiu durante a gravação
+				return None
+
+		return changes
+
+
+	def append(self, changes):
+		'''
+		Registra as alterações feitas pelo processo corrente. O processo deve ter lido todas as alterações anteriores.
+
+		* changes : dicionário ID do elemento -> doc_id, ou None para elementos removidos
+		'''
+		line = (json.dumps(list(changes.items())) + '\n').encode('utf-8')
+
+		if self.__offset + len(line) > self.__max_size:
+			tmp_path = self.__path + '.tmp'
+			with open(tmp_path, 'wb'):
+				pass
+
+			os.replace(tmp_path, self.__path)
+			self.__reopen()
+			return
+
+		# Termina uma linha incompleta deixada por um processo que caiu durante a gravação
+		size = os.fstat(self.__file.fileno()).st_size
+		if size > self.__offset:
+			line = b'\n' + line
+			self.__offset = size
+
+		self.__file.write(line)
+		self.__file.flush()
+
+		self.__offset += len(line)
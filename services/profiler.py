@@ -0,0 +1,262 @@
+# -*- coding:utf-8 -*-
+
+import io
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import itertools
+import threading
+from flask import request, g, abort, send_file, Response
+from utils import API_ROUTE, PROFILE, PROFILE_SAMPLE, PROFILE_KEEP, profile_dir, authenticate, token_required, jsonify
+
+
+# Cabeçalho com o qual um administrador solicita o profiling de uma requisição
+PROFILE_HEADER = 'X-Gestor-Profile'
+
+# Cabeçalho da resposta com o ID do profile gravado
+PROFILE_ID_HEADER = 'X-Gestor-Profile-Id'
+
+# Formato dos IDs dos profiles: instante da gravação em nanossegundos e PID do processo
+PROFILE_ID = re.compile(r'^\d+-\d+$')
+
+
+class RequestProfiler():
+	'''
+	Profiling das requisições de um serviço com o cProfile, solicitado por um administrador através do cabeçalho
+	  X-Gestor-Profile: 1 (caso header seja verdadeiro) ou feito por amostragem em 1 a cada N requisições.
+
+	Os profiles são gravados no formato do módulo pstats (<ID>.prof), junto aos dados da requisição (<ID>.json), e apenas
+	  os keep profiles mais recentes são mantidos no diretório.
+
+	Apenas uma requisição de cada processo é medida por vez; as requisições que chegam durante um profiling não são medidas.
+	'''
+
+	def __init__(self, directory, sample=0, keep=50, header=True):
+		'''
+		Construtor da classe
+
+		* directory : diretório onde os profiles são gravados. É criado na gravação do primeiro profile
+		* sample    : profiling de 1 a cada sample requisições. 0 desativa a amostragem
+		* keep      : número máximo de profiles mantidos no diretório
+		* header    : se verdadeiro, administradores podem solicitar o profiling com o cabeçalho X-Gestor-Profile
+		'''
+		self.__directory = directory
+		self.__sample = sample
+		self.__keep = keep
+		self.__header = header
+
+		self.__lock = threading.Lock()
+		self.__counter = itertools.count(1)
+
+
+	def __trigger(self):
+		'''
+		Retorna o motivo do profiling da requisição corrente ('header' ou 'sample'), ou None caso ela não deva ser medida.
+		'''
+		if self.__header and request.headers.get(PROFILE_HEADER) == '1':
+			_, current_user = authenticate()
+			if current_user is not None and current_user['admin']:
+				return 'header'
+
+		if self.__sample and next(self.__counter) % self.__sample == 0:
+			return 'sample'
+
+		return None
+
+
+	def start(self):
+		'''
+		Inicia o profiling da requisição corrente, caso ela tenha sido solicitada ou sorteada. Executado antes de cada requisição.
+		'''
+		trigger = self.__trigger()
+		if trigger is None or not self.__lock.acquire(blocking=False):
+			return
+
+		profile = cProfile.Profile()
+		g.profile = {
+			'profile'	: profile,
+			'id'		: f'{time.time_ns()}-{os.getpid()}',
+			'trigger'	: trigger,
+			'started'	: time.perf_counter(),
+			'status'	: None
+		}
+
+		profile.enable()
+
+
+	def tag(self, response):
+		'''
+		Adiciona o ID do profile à resposta da requisição medida. Executado depois de cada requisição.
+		'''
+		current = g.get('profile')
+		if current is not None:
+			current['status'] = response.status_code
+			response.headers[PROFILE_ID_HEADER] = current['id']
+
+		return response
+
+
+	def finish(self, exception=None):
+		'''
+		Encerra o profiling da requisição corrente e grava o profile. Executado ao final de cada requisição,
+		  inclusive depois do envio das respostas em partes.
+		'''
+		current = g.pop('profile', None)
+		if current is None:
+			return
+
+		try:
+			current['profile'].disable()
+			seconds = time.perf_counter() - current['started']
+
+			os.makedirs(self.__directory, exist_ok=True)
+			path = os.path.join(self.__directory, current['id'])
+			current['profile'].dump_stats(path + '.prof')
+
+			with open(path + '.json', 'w', encoding='utf-8') as f:
+				json.dump({
+					'id'		: current['id'],
+					'method'	: request.method,
+					'path'		: request.path,
+					'endpoint'	: request.url_rule.rule if request.url_rule is not None else None,
+					'status'	: current['status'],
+					'trigger'	: current['trigger'],
+					'seconds'	: seconds,
+					'timestamp'	: time.strftime('%Y-%m-%dT%H:%M:%S')
+				}, f)
+
+			self.__trim()
+
+		finally:
+			self.__lock.release()
+
+
+	def __trim(self):
+		'''
+		Remove os profiles mais antigos, mantendo apenas os keep mais recentes.
+		'''
+		ids = sorted((name[:-len('.prof')] for name in os.listdir(self.__directory) if name.endswith('.prof')),
+			key=lambda profile_id: int(profile_id.split('-')[0]))
+
+		for profile_id in ids[:max(0, len(ids) - self.__keep)]:
+			for extension in ('.prof', '.json'):
+				try:
+					os.remove(os.path.join(self.__directory, profile_id + extension))
+
+				except FileNotFoundError:
+					# Removido por outro processo
+					pass
+
+
+	def list(self):
+		'''
+		Retorna os dados das requisições dos profiles gravados, do mais recente para o mais antigo.
+		'''
+		if not os.path.isdir(self.__directory):
+			return []
+
+		profiles = []
+		for name in os.listdir(self.__directory):
+			if not name.endswith('.json'):
+				continue
+
+			try:
+				with open(os.path.join(self.__directory, name), 'r', encoding='utf-8') as f:
+					profiles.append(json.load(f))
+
+			except (OSError, ValueError):
+				# Removido ou ainda sendo gravado por outro processo
+				continue
+
+		return sorted(profiles, key=lambda profile: int(profile['id'].split('-')[0]), reverse=True)
+
+
+	def path(self, profile_id):
+		'''
+		Retorna o caminho do arquivo do profile com o ID passado, ou None caso ele não exista.
+		'''
+		if not PROFILE_ID.match(profile_id):
+			return None
+
+		path = os.path.join(self.__directory, profile_id + '.prof')
+
+		return path if os.path.exists(path) else None
+
+
+def enable_profiling(api, service):
+	'''
+	Habilita o profiling das requisições do aplicativo Flask e disponibiliza as rotas de consulta dos profiles:
+
+	* GET /gestor/profiles      : lista os profiles gravados
+	* GET /gestor/profiles/<id> : retorna o profile no formato do pstats, ou, com ?format=text, o relatório das funções
+	                              ordenadas pelo tempo acumulado
+
+	As rotas exigem o token de um administrador. Os profiles de cada serviço são gravados em <PROFILE_DIR>/<serviço>.
+
+	O cabeçalho X-Gestor-Profile só é atendido com GESTOR_PROFILE=1. Com GESTOR_PROFILE_SAMPLE=N, 1 a cada N requisições
+	  é medida independentemente do cabeçalho.
+
+	Retorna o objeto RequestProfiler do aplicativo, ou None caso o profiling esteja desativado (GESTOR_PROFILE=0 e
+	  GESTOR_PROFILE_SAMPLE=0, o padrão). Neste caso, as requisições não passam por nenhuma verificação adicional.
+
+	* api     : aplicativo Flask do serviço
+	* service : nome do serviço (ex.: 'medicines'), utilizado no diretório e nos nomes dos arquivos dos profiles
+	'''
+	if not PROFILE and not PROFILE_SAMPLE:
+		return None
+
+	profiler = RequestProfiler(os.path.join(profile_dir(), service), PROFILE_SAMPLE, PROFILE_KEEP, header=PROFILE)
+
+	api.before_request(profiler.start)
+	api.after_request(profiler.tag)
+	api.teardown_request(profiler.finish)
+
+	@token_required
+	def get_profiles(current_user):
+		'''
+		Retorna os profiles gravados, com o método, o caminho, a rota, o código de resposta, o motivo do profiling
+		  ('header' ou 'sample') e a duração de cada requisição medida.
+
+		Exemplo de requisição:
+
+		curl -i -X GET http://localhost:5001/gestor/profiles
+		'''
+		if not current_user['admin']:
+			abort(403)
+
+		return jsonify({'profiles': profiler.list()})
+
+	@token_required
+	def get_profile(current_user, profile_id):
+		'''
+		Retorna o profile com o ID passado. O arquivo pode ser aberto com o módulo pstats (python -m pstats <arquivo>).
+
+		Exemplo de requisição:
+
+		curl -i -X GET http://localhost:5001/gestor/profiles/<id>?format=text
+		'''
+		if not current_user['admin']:
+			abort(403)
+
+		if request.args.get('format', 'pstats') not in ('pstats', 'text'):
+			abort(400)
+
+		path = profiler.path(profile_id)
+		if path is None:
+			abort(404)
+
+		if request.args.get('format') == 'text':
+			report = io.StringIO()
+			pstats.Stats(path, stream=report).sort_stats('cumulative').print_stats(50)
+
+			return Response(report.getvalue(), mimetype='text/plain')
+
+		return send_file(path, mimetype='application/octet-stream', as_attachment=True, attachment_filename=f'{service}-{profile_id}.prof')
+
+	api.add_url_rule(API_ROUTE + '/profiles', 'get_profiles', get_profiles, methods=['GET'])
+	api.add_url_rule(API_ROUTE + '/profiles/<profile_id>', 'get_profile', get_profile, methods=['GET'])
+
+	return profiler
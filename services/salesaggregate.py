@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class SalesAggregate():
+	'''
+	Agregado em memória dos registros de vendas dos remédios.
+
+	Para cada remédio são mantidas as datas de venda ordenadas (como inteiros no formato aaaammdd)
+	  e as somas acumuladas das quantidades vendidas. Assim, o total vendido por um remédio em um
+	  intervalo de datas é obtido com duas buscas binárias.
+
+	O agregado deve ser atualizado sempre que o registro de vendas de um remédio for alterado.
+	'''
+
+	def __init__(self):
+		'''
+		Construtor da classe
+		'''
+		self.__dates = {}
+		self.__prefix = {}
+		self.__bounds = None
+		self.__lock = threading.Lock()
+
+
+	def load(self, medicines):
+		'''
+		Recria o agregado a partir dos remédios passados.
+
+		* medicines : remédios do cadastro, contendo os campos 'id' e 'sales'
+		'''
+		with self.__lock:
+			self.__dates = {}
+			self.__prefix = {}
+			self.__bounds = None
+
+		for medicine in medicines:
+			self.set_sales(medicine['id'], medicine['sales'])
+
+
+	def set_sales(self, medicine_id, sales):
+		'''
+		Substitui o registro de vendas do remédio passado.
+
+		* medicine_id : ID do remédio
+		* sales       : registro de vendas do remédio, no formato data -> quantidade
+		'''
+		dates = sorted((int(date), quantity) for date, quantity in sales.items())
+
+		prefix = [0]
+		for date, quantity in dates:
+			prefix.append(prefix[-1] + quantity)
+
+		with self.__lock:
+			if dates:
+				self.__dates[medicine_id] = [date for date, quantity in dates]
+				self.__prefix[medicine_id] = prefix
+
+			else:
+				self.__dates.pop(medicine_id, None)
+				self.__prefix.pop(medicine_id, None)
+
+			self.__bounds = None
+
+
+	def remove(self, medicine_id):
+		'''
+		Remove o registro de vendas do remédio passado.
+
+		* medicine_id : ID do remédio
+		'''
+		self.set_sales(medicine_id, {})
+
+
+	def bounds(self):
+		'''
+		Retorna as datas da venda mais antiga e da venda mais recente entre todos os remédios.
+		Caso não haja vendas, retorna (99999999, 0).
+		'''
+		with self.__lock:
+			if self.__bounds is None:
+				self.__bounds = (
+					min((dates[0] for dates in self.__dates.values()), default=99999999),
+					max((dates[-1] for dates in self.__dates.values()), default=0)
+				)
+
+			return self.__bounds
+
+
+	def totals(self, begin, end):
+		'''
+		Retorna uma lista de pares (ID do remédio, quantidade vendida) com o total vendido por cada remédio
+		  com vendas no intervalo passado.
+
+		* begin : data inicial do intervalo, como inteiro no formato aaaammdd
+		* end   : data final do intervalo, como inteiro no formato aaaammdd
+		'''
+		with self.__lock:
+			items = [(medicine_id, dates, self.__prefix[medicine_id]) for medicine_id, dates in self.__dates.items()]
+
+		totals = []
+		for medicine_id, dates, prefix in items:
+			quantity = prefix[bisect_right(dates, end)] - prefix[bisect_left(dates, begin)]
+			if quantity != 0:
+				totals.append((medicine_id, quantity))
+
+		return totals
@@ -0,0 +1,74 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import logging
+from werkzeug.serving import run_simple
+from utils import SERVER, SERVER_HOST, SERVER_WORKERS, SERVER_THREADS, DEBUG
+
+try:
+	import waitress
+
+except ImportError:
+	waitress = None
+
+try:
+	import gunicorn
+
+except ImportError:
+	gunicorn = None
+
+
+def serve(api, module, port):
+	'''
+	Executa o serviço com o servidor configurado em utils.py.
+
+	Com mais de um worker, o processo corrente é substituído pelo gunicorn (ver gunicorn.conf.py), que importa
+	  o serviço novamente em cada worker.
+
+	* api    : aplicativo WSGI do serviço
+	* module : nome do módulo do serviço (ex.: 'medicines'), utilizado pelo gunicorn para importar o aplicativo
+	* port   : porta do serviço
+	'''
+	if DEBUG:
+		api.run(host=SERVER_HOST, port=port, debug=True)
+		return
+
+	server = SERVER
+	if server == 'auto':
+		if SERVER_WORKERS > 1:
+			server = 'gunicorn'
+
+		else:
+			server = 'waitress'
+
+	if server == 'gunicorn':
+		if gunicorn is None:
+			raise ValueError('Server gunicorn is not installed. Install the requirements (gunicorn is not available on Windows)')
+
+		services_dir = os.path.dirname(os.path.abspath(__file__))
+		os.execv(sys.executable, [
+			sys.executable, '-m', 'gunicorn',
+			'--config', os.path.join(services_dir, 'gunicorn.conf.py'),
+			'--chdir', services_dir,
+			'--bind', f'{SERVER_HOST}:{port}',
+			'--workers', str(SERVER_WORKERS),
+			'--threads', str(SERVER_THREADS),
+			f'{module}:api'
+		])
+
+	if SERVER_WORKERS > 1:
+		raise ValueError(f'Server {server} does not support multiple workers')
+
+	if server == 'waitress':
+		if waitress is None:
+			raise ValueError('Server waitress is not installed. Install the requirements or set GESTOR_SERVER=werkzeug')
+
+		waitress.serve(api, host=SERVER_HOST, port=port, threads=SERVER_THREADS)
+
+	elif server == 'werkzeug':
+		logging.getLogger(__name__).warning('Using the Werkzeug server. Install waitress or gunicorn for production use')
+		run_simple(SERVER_HOST, port, api, threaded=True)
+
+	else:
+		raise ValueError(f'Invalid server: {server}')
@@ -0,0 +1,243 @@
+# -*- coding:utf-8 -*-
+
+import os
+import atexit
+import threading
+from functools import partial
+from tinydb.storages import Storage, JSONStorage, touch
+from tinydb.middlewares import Middleware
+from jsonprovider import StdlibJSONProvider
+
+
+class ProviderJSONStorage(JSONStorage):
+	'''
+	JSONStorage do TinyDB que utiliza o provedor de serialização JSON configurado ao invés do módulo json.
+	'''
+
+	def __init__(self, path, json_provider=None, **kwargs):
+		'''
+		Construtor da classe
+
+		* path          : caminho do arquivo do banco
+		* json_provider : provedor de serialização JSON (ver jsonprovider.py). Padrão: módulo json
+		'''
+		super().__init__(path, encoding='utf-8', **kwargs)
+		self.__json = json_provider or StdlibJSONProvider()
+
+
+	def read(self):
+		'''
+		Lê o estado atual do banco.
+		'''
+		self._handle.seek(0)
+		content = self._handle.read()
+
+		return self.__json.loads(content) if content else None
+
+
+	def write(self, data):
+		'''
+		Grava o estado do banco passado, sobrescrevendo o arquivo.
+
+		* data : estado completo do banco
+		'''
+		self._handle.seek(0)
+		self._handle.write(self.__json.dumps(data))
+		self._handle.flush()
+		os.fsync(self._handle.fileno())
+		self._handle.truncate()
+
+
+class JSONFileStorage(Storage):
+	'''
+	Armazenamento dos cadastros em arquivo JSON, compatível com o JSONStorage do TinyDB.
+
+	A gravação é feita em um arquivo temporário que depois substitui o original,
+	  de forma que uma falha no meio da gravação não corrompa o banco.
+	'''
+
+	def __init__(self, path, fsync=True, json_provider=None, **kwargs):
+		'''
+		Construtor da classe
+
+		* path          : caminho do arquivo do banco
+		* fsync         : se verdadeiro, força a sincronização do arquivo com o disco a cada gravação
+		* json_provider : provedor de serialização JSON (ver jsonprovider.py). Padrão: módulo json
+		'''
+		super().__init__()
+		touch(path, create_dirs=False)
+
+		self.__path = path
+		self.__fsync = fsync
+		self.__json = json_provider or StdlibJSONProvider()
+
+
+	def read(self):
+		'''
+		Lê o estado atual do banco.
+		'''
+		with open(self.__path, 'r', encoding='utf-8') as f:
+			content = f.read()
+
+		return self.__json.loads(content) if content else None
+
+
+	def write(self, data):
+		'''
+		Grava o estado do banco passado.
+
+		* data : estado completo do banco
+		'''
+		tmp_path = self.__path + '.tmp'
+		with open(tmp_path, 'w', encoding='utf-8') as f:
+			f.write(self.__json.dumps(data))
+			f.flush()
+			if self.__fsync:
+				os.fsync(f.fileno())
+
+		os.replace(tmp_path, self.__path)
+
+
+class WriteBehindMiddleware(Middleware):
+	'''
+	Middleware do TinyDB que mantém o banco em memória e agrupa as alterações antes de gravá-las.
+
+	As leituras são sempre feitas da memória. As alterações são gravadas em lote quando:
+
+	* o número de alterações pendentes atinge flush_threshold;
+	* se passam flush_interval segundos desde a última gravação;
+	* o banco é fechado ou a aplicação é encerrada.
+
+	O estado passado para write() é mantido por referência e gravado mais tarde. Quem o altera no lugar depois de
+	  passá-lo deve fazê-lo com a trava lock adquirida, para que ele não seja gravado no meio de uma alteração.
+	'''
+
+	def __init__(self, storage_cls=JSONFileStorage, flush_interval=1.0, flush_threshold=100):
+		'''
+		Construtor da classe
+
+		* storage_cls     : classe do armazenamento real utilizado para as gravações
+		* flush_interval  : intervalo máximo, em segundos, entre gravações. 0 desativa a gravação periódica
+		* flush_threshold : número de alterações pendentes que força uma gravação
+		'''
+		super().__init__(storage_cls)
+
+		self.cache = None
+		self.dirty = 0
+		self.flush_interval = flush_interval
+		self.flush_threshold = flush_threshold
+
+		self.lock = threading.RLock()
+		self.__closed = threading.Event()
+
+
+	def __call__(self, *args, **kwargs):
+		'''
+		Cria o armazenamento real e inicia a gravação periódica.
+		'''
+		super().__call__(*args, **kwargs)
+
+		if self.flush_interval:
+			threading.Thread(target=self.__flush_periodically, daemon=True).start()
+
+		atexit.register(self.close)
+
+		return self
+
+
+	def __flush_periodically(self):
+		'''
+		Grava as alterações pendentes a cada flush_interval segundos até o banco ser fechado.
+		'''
+		while not self.__closed.wait(self.flush_interval):
+			self.flush()
+
+
+	def read(self):
+		'''
+		Retorna o estado do banco mantido em memória.
+		'''
+		with self.lock:
+			if self.cache is None:
+				self.cache = self.storage.read()
+
+			return self.cache
+
+
+	def write(self, data):
+		'''
+		Atualiza o estado do banco em memória, gravando-o caso o limite de alterações pendentes seja atingido.
+
+		* data : estado completo do banco
+		'''
+		with self.lock:
+			self.cache = data
+			self.dirty += 1
+
+			if self.dirty >= self.flush_threshold:
+				self.flush()
+
+
+	def reload(self):
+		'''
+		Grava as alterações pendentes e descarta o estado do banco em memória, que é lido novamente do arquivo na próxima leitura.
+		'''
+		with self.lock:
+			self.flush()
+			self.cache = None
+
+
+	def flush(self):
+		'''
+		Grava as alterações pendentes.
+		'''
+		with self.lock:
+			if self.dirty > 0:
+				self.storage.write(self.cache)
+				self.dirty = 0
+
+
+	def close(self):
+		'''
+		Grava as alterações pendentes e fecha o armazenamento real.
+		'''
+		with self.lock:
+			if self.__closed.is_set():
+				return
+
+			self.__closed.set()
+			self.flush()
+			self.storage.close()
+
+
+def make_storage(mode, durability='safe', flush_interval=1.0, flush_threshold=100, json_provider=None, multiprocess=False):
+	'''
+	Retorna o armazenamento a ser passado para o TinyDB de acordo com a configuração.
+
+	* mode            : 'direct' grava o arquivo a cada alteração; 'writebehind' agrupa as alterações em memória
+	* durability      : 'safe' sincroniza o arquivo com o disco a cada gravação; 'fast' deixa a sincronização a cargo do sistema operacional
+	* flush_interval  : intervalo máximo, em segundos, entre gravações no modo 'writebehind'
+	* flush_threshold : número de alterações pendentes que força uma gravação no modo 'writebehind'
+	* json_provider   : provedor de serialização JSON (ver jsonprovider.py). Caso não seja passado, utiliza o módulo json
+	* multiprocess    : se verdadeiro, o arquivo é compartilhado entre processos
+	'''
+	if mode == 'direct':
+		# O JSONStorage mantém o arquivo aberto e o sobrescreve no mesmo lugar, de forma que outro processo poderia
+		#   ler um arquivo gravado pela metade
+		if multiprocess:
+			return partial(JSONFileStorage, fsync=durability == 'safe', json_provider=json_provider)
+
+		if json_provider is None or json_provider.name == 'stdlib':
+			return JSONStorage
+
+		return partial(ProviderJSONStorage, json_provider=json_provider)
+
+	if mode == 'writebehind':
+		if durability not in ('safe', 'fast'):
+			raise ValueError(f'Invalid durability: {durability}')
+
+		storage_cls = partial(JSONFileStorage, fsync=durability == 'safe', json_provider=json_provider)
+
+		return WriteBehindMiddleware(storage_cls, flush_interval=flush_interval, flush_threshold=flush_threshold)
+
+	raise ValueError(f'Invalid storage mode: {mode}')
@@ -2,13 +2,19 @@
 
 import re
 import csv
+import time
 import datetime
 import jwt
 from io import StringIO
-from flask import Flask, jsonify, url_for, make_response, abort, request
-from werkzeug.security import generate_password_hash, check_password_hash
-from dbinterface import DBInterface
-from utils import API_ROUTE, API_USERS_ROUTE, API_USERS_PORT, SECRET_KEY, token_required
+from flask import Flask, make_response, abort, request
+from dbinterface import DBInterface, DUPLICATE_ERROR
+import passwords
+from passwords import hash_password, verify_password, BUSY_ERROR
+from cache import LRUCache
+from server import serve
+from profiler import enable_profiling
+from metrics import instrument, cache_collector, password_collector
+from utils import API_ROUTE, API_USERS_ROUTE, API_USERS_PORT, SECRET_KEY, TOKEN_LIFETIME, CACHE_SIZE, PASSWORD_RETRY_AFTER, token_cache, token_required, jsonify, uri_builder, get_list_args, not_modified
 
 
 api = Flask(__name__)
@@ -19,11 +25,37 @@ users = DBInterface('users', [
 	'password',
 	'status',
 	'admin'
-])
+], unique=['username'])
+
+# Cache das respostas das consultas por ID, invalidado a cada alteração dos usuários
+user_cache = LRUCache(CACHE_SIZE)
+users.subscribe(user_cache.invalidate)
+
+# Métricas das requisições e das operações no cadastro, disponíveis em GET /gestor/metrics
+instrument(api, cache_collector({'users': user_cache, 'tokens': token_cache}), password_collector(passwords.stats), databases=[users])
+
+# Profiling das requisições solicitado por administradores ou por amostragem, disponível em GET /gestor/profiles
+enable_profiling(api, 'users')
+
+
+def _revoke_external(changed):
+	'''
+	Revoga os tokens dos usuários desativados ou deletados por outros processos.
+	'''
+	for user_id, user in changed.items():
+		if user is None or user['status'] != 'active':
+			token_cache.revoke(user_id)
+
+
+users.subscribe_external(_revoke_external)
 
 
 # Funções auxiliares
 
+# Monta a URI externa de um usuário a partir do seu ID
+user_uri = uri_builder('get_user', 'user_id')
+
+
 def make_public_user(user):
 	'''
 	Altera a forma de exibição de um elemento do cadastro.
@@ -33,7 +65,7 @@ def make_public_user(user):
 	new_user = {}
 	for field in user:
 		if field == 'id':
-			new_user['uri'] = url_for('get_user', user_id=user['id'], _external=True)
+			new_user['uri'] = user_uri(user['id'])
 
 		else:
 			new_user[field] = user[field]
@@ -83,6 +115,18 @@ def not_implemented(error):
 	return make_response(jsonify({'error': 'Not implemented'}), 501)
 
 
+@api.errorhandler(503)
+def service_unavailable(error):
+	'''
+	Altera o retorno para erros tipo 503 para o formato JSON. Retornado quando o conjunto de threads
+	  dos hashes das senhas está saturado, indicando ao cliente quando tentar novamente.
+	'''
+	response = make_response(jsonify({'error': 'Service Unavailable'}), 503)
+	response.headers['Retry-After'] = str(PASSWORD_RETRY_AFTER)
+
+	return response
+
+
 # Métodos da API
 
 @api.route(API_USERS_ROUTE + '/<user_id>/activate', methods=['PUT'])
@@ -98,20 +142,13 @@ def activate_user(current_user, user_id):
 	if not current_user['admin']:
 		abort(403)
 
-	user = users.get_element('id', user_id)
+	user = users.update_element({'status': 'active'}, 'id', user_id)
 	if user == []:
 		abort(404)
 
 	if user == -1:
 		abort(500)
 
-	if users.update_element({'status': 'active'}, 'id', user_id) == -1:
-		abort(500)
-
-	user = users.get_element('id', user_id)
-	if user == -1:
-		abort(500)
-
 	user[0].pop('password', None)
 
 	return jsonify({'user': make_public_user(user[0])})
@@ -140,13 +177,16 @@ def deactivate_user(current_user, user_id):
 	if user[0]['admin']:
 		abort(400)
 
-	if users.update_element({'status': 'inactive'}, 'id', user_id) == -1:
-		abort(500)
+	user = users.update_element({'status': 'inactive'}, 'id', user_id)
+	if user == []:
+		abort(404)
 
-	user = users.get_element('id', user_id)
 	if user == -1:
 		abort(500)
 
+	# Os tokens emitidos enquanto o usuário estava ativo deixam de ser aceitos
+	token_cache.revoke(user_id)
+
 	user[0].pop('password', None)
 
 	return jsonify({'user': make_public_user(user[0])})
@@ -178,6 +218,8 @@ def delete_user(current_user, user_id):
 	if users.delete_element('id', user_id) == -1:
 		abort(500)
 
+	token_cache.revoke(user_id)
+
 	return jsonify({'message': 'User deleted sucessfully!'})
 
 
@@ -186,18 +228,83 @@ def delete_user(current_user, user_id):
 def get_all_users(current_user):
 	'''
 	Obtém a lista de todos os usuários.
+
+	A listagem pode ser paginada e restrita a alguns campos através dos argumentos da query string:
+
+	* limit  : número máximo de usuários na resposta. Quando passado, a resposta contém o campo 'next'.
+	* cursor : valor do campo 'next' da página anterior, para obter a página seguinte. 'next' é nulo na última página.
+	* fields : campos a serem retornados, separados por vírgula. A URI do usuário é sempre retornada.
 	'''
 	global users
 
 	if not current_user['admin']:
 		abort(403)
 
+	limit, cursor, fields = get_list_args(['username', 'status', 'admin'])
+
+	etag = users.get_version()
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	if limit is None and cursor is None and fields is None:
+		page, next_cursor = users.get_all_elements(), None
+
+	else:
+		page = users.get_page(limit, cursor, fields or ['username', 'status', 'admin'])
+		if page == -1:
+			abort(500)
+
+		page, next_cursor = page
+
 	public_users = []
-	for user in users.get_all_elements():
+	for user in page:
 		user.pop('password', None)
 		public_users.append(make_public_user(user))
 
-	return jsonify({'users': public_users})
+	if limit is None:
+		response = jsonify({'users': public_users})
+
+	else:
+		response = jsonify({'users': public_users, 'next': next_cursor})
+
+	response.set_etag(etag)
+
+	return response
+
+
+@api.route(API_USERS_ROUTE + '/cache', methods=['GET'])
+@token_required
+def get_user_cache_stats(current_user):
+	'''
+	Retorna os contadores do cache das consultas de usuários por ID ('cache') e do cache de tokens verificados do serviço ('tokens'):
+	  número de elementos, tamanho máximo, acertos, falhas e descartes.
+
+	Exemplo de requisição:
+
+	curl -i -X GET http://localhost:5000/gestor/users/cache
+	'''
+	if not current_user['admin']:
+		abort(403)
+
+	return jsonify({'cache': user_cache.stats(), 'tokens': token_cache.stats()})
+
+
+@api.route(API_USERS_ROUTE + '/passwords', methods=['GET'])
+@token_required
+def get_password_stats(current_user):
+	'''
+	Retorna os contadores do pool de cálculo e verificação dos hashes das senhas: número de workers, limite de operações
+	  pendentes, operações concluídas, operações recusadas por sobrecarga e tempo médio de cada operação.
+
+	Exemplo de requisição:
+
+	curl -i -X GET http://localhost:5000/gestor/users/passwords
+	'''
+	if not current_user['admin']:
+		abort(403)
+
+	return jsonify({'passwords': passwords.stats()})
 
 
 @api.route(API_USERS_ROUTE + '/<user_id>', methods=['GET'])
@@ -213,6 +320,23 @@ def get_user(current_user, user_id):
 	if not current_user['admin']:
 		abort(403)
 
+	etag = users.get_version(user_id)
+	if etag is None:
+		abort(404)
+
+	response = not_modified(etag)
+	if response is not None:
+		return response
+
+	# A resposta depende do host da requisição, devido às uris dos usuários
+	cached = user_cache.get(user_id, variant=request.host_url)
+	if cached is not None:
+		response = api.response_class(cached, mimetype='application/json')
+		response.set_etag(etag)
+
+		return response
+
+	token = user_cache.token()
 	user = users.get_element('id', user_id)
 	if user == []:
 		abort(404)
@@ -222,7 +346,11 @@ def get_user(current_user, user_id):
 
 	user[0].pop('password', None)
 
-	return jsonify({'user': make_public_user(user[0])})
+	response = jsonify({'user': make_public_user(user[0])})
+	user_cache.put(user_id, response.get_data(), token, variant=request.host_url)
+	response.set_etag(etag)
+
+	return response
 
 
 @api.route(API_ROUTE + '/login', methods=['POST'])
@@ -249,14 +377,25 @@ def login():
 		abort(404)
 
 	user = user[0]
-	if not check_password_hash(user['password'], auth.password):
+	result = verify_password(user['password'], auth.password)
+	if result == BUSY_ERROR:
+		abort(503)
+
+	valid, new_hash = result
+	if not valid:
 		abort(400)
 
+	# O hash da senha é atualizado caso tenha sido gerado com parâmetros diferentes dos atuais
+	# Uma falha nesta atualização não impede o login, e o hash é atualizado no próximo login
+	if new_hash is not None:
+		users.update_element({'password': new_hash}, 'id', user['id'])
+
 	payload = {
 			'id'		: user['id'],
 			'status'	: user['status'],
 			'admin'		: user['admin'],
-			'exp'		: datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
+			'iat'		: time.time(),
+			'exp'		: datetime.datetime.utcnow() + datetime.timedelta(seconds=TOKEN_LIFETIME)
 	}
 	key = api.config['SECRET_KEY']
 	token = jwt.encode(payload, key)
@@ -277,20 +416,13 @@ def promote_user(current_user, user_id):
 	if not current_user['admin']:
 		abort(403)
 
-	user = users.get_element('id', user_id)
+	user = users.update_element({'admin': True}, 'id', user_id)
 	if user == []:
 		abort(404)
 
 	if user == -1:
 		abort(500)
 
-	if users.update_element({'admin': True}, 'id', user_id) == -1:
-		abort(500)
-
-	user = users.get_element('id', user_id)
-	if user == -1:
-		abort(500)
-
 	return jsonify({'user': make_public_user(user[0])})
 
 
@@ -314,16 +446,21 @@ def register():
 	if password == '' or type(password) != str:
 		abort(400)
 
-	if users.get_element('username', username) != []:
-		return make_response({'message': 'Username already exists'}, 400)
+	pwhash = hash_password(password)
+	if pwhash == BUSY_ERROR:
+		abort(503)
 
+	# A unicidade do nome de usuário é garantida pelo índice único do banco
 	user = users.create_element({
 		'username'	: username,
-		'password'	: generate_password_hash(password, method='sha256'),
+		'password'	: pwhash,
 		'status'	: 'active',
 		'admin'		: True if users.get_all_elements() == [] else False
 	})
 
+	if user == DUPLICATE_ERROR:
+		return make_response({'message': 'Username already exists'}, 400)
+
 	if user == -1:
 		abort(500)
 
@@ -358,14 +495,18 @@ def self_update(current_user):
 		abort(500)
 
 	user = user[0]
-	if username != user['username'] and users.get_element('username', username) != []:
-		return make_response({'message': 'Username already exists'}, 400)
+	pwhash = hash_password(password) if password else user['password']
+	if pwhash == BUSY_ERROR:
+		abort(503)
 
 	new_values = {
 		'username'	: username if username else user['username'],
-		'password'	: generate_password_hash(password, method='sha256') if password else user['password']
+		'password'	: pwhash
 	}
 	user = users.update_element(new_values, 'id', current_user['id'])
+	if user == DUPLICATE_ERROR:
+		return make_response({'message': 'Username already exists'}, 400)
+
 	if user == -1:
 		abort(500)
 
@@ -373,5 +514,5 @@ def self_update(current_user):
 
 
 if __name__ == '__main__':
-	api.run(port=API_USERS_PORT, debug=True)
+	serve(api, 'users', API_USERS_PORT)
 
@@ -2,8 +2,12 @@
 
 import os
 import jwt
+import time
 from functools import wraps
-from flask import request, jsonify
+from flask import current_app, request, abort, g, url_for, Response, stream_with_context
+from flask import jsonify as flask_jsonify
+from cache import TokenCache
+from jsonprovider import make_provider
 
 
 API_ROUTE = '/gestor'
@@ -17,6 +21,84 @@ API_CLIENTS_PORT = 5002
 
 SECRET_KEY = 'secretkey'
 
+# Tempo de vida, em segundos, dos tokens emitidos no login
+TOKEN_LIFETIME = 600
+
+# Diretório dos arquivos dos cadastros. Caso não seja definido, utiliza o diretório database na raiz do projeto
+DB_DIR = os.environ.get('GESTOR_DB_DIR')
+
+# Configuração do armazenamento dos cadastros. Pode ser alterada por variáveis de ambiente.
+# * DB_STORAGE_MODE    : 'direct' grava o arquivo a cada alteração; 'writebehind' agrupa as alterações em memória;
+#                        'journal' acrescenta cada alteração em um log e compacta o log periodicamente;
+#                        'sqlite' armazena os cadastros em bancos SQLite (ver migrate.py)
+# * DB_DURABILITY      : 'safe' sincroniza o arquivo com o disco a cada gravação; 'fast' deixa a sincronização a cargo do sistema operacional
+# * DB_FLUSH_INTERVAL  : intervalo máximo, em segundos, entre gravações no modo 'writebehind'
+# * DB_FLUSH_THRESHOLD : número de alterações pendentes que força uma gravação no modo 'writebehind'
+# * DB_COMPACT_THRESHOLD : número de registros no log que dispara sua compactação no modo 'journal'
+DB_STORAGE_MODE = os.environ.get('GESTOR_DB_STORAGE_MODE', 'direct')
+DB_DURABILITY = os.environ.get('GESTOR_DB_DURABILITY', 'safe')
+DB_FLUSH_INTERVAL = float(os.environ.get('GESTOR_DB_FLUSH_INTERVAL', '1.0'))
+DB_FLUSH_THRESHOLD = int(os.environ.get('GESTOR_DB_FLUSH_THRESHOLD', '100'))
+DB_COMPACT_THRESHOLD = int(os.environ.get('GESTOR_DB_COMPACT_THRESHOLD', '10000'))
+
+# Se '1', os cadastros podem ser utilizados ao mesmo tempo por vários processos (ex.: servidor com vários workers).
+#   As escritas utilizam uma trava entre processos, e cada processo recarrega apenas os elementos alterados pelos outros.
+#   No modo 'writebehind', cada alteração passa a ser gravada imediatamente
+DB_MULTIPROCESS = os.environ.get('GESTOR_DB_MULTIPROCESS', '0') == '1'
+
+# Duração, em segundos, a partir da qual uma operação nos cadastros é registrada no log como lenta. '0' desativa o registro
+DB_SLOW_OPERATION = float(os.environ.get('GESTOR_DB_SLOW_OPERATION', '0.1'))
+
+# Provedor de serialização JSON das respostas da API e dos arquivos dos cadastros:
+#   'auto' utiliza o orjson caso esteja instalado; 'orjson' ou 'stdlib' forçam o provedor
+JSON_PROVIDER = os.environ.get('GESTOR_JSON_PROVIDER', 'auto')
+
+json_provider = make_provider(JSON_PROVIDER)
+
+# Número máximo de elementos mantidos no cache das consultas por ID de cada serviço
+CACHE_SIZE = int(os.environ.get('GESTOR_CACHE_SIZE', '1024'))
+
+# Configuração do hash das senhas dos usuários
+# * PASSWORD_ITERATIONS  : número de iterações do PBKDF2. Senhas com hash de custo diferente são atualizadas no próximo login
+# * PASSWORD_WORKERS     : número de threads que calculam e verificam os hashes
+# * PASSWORD_MAX_PENDING : número máximo de operações em execução ou aguardando um worker. Acima disso, a API responde 503
+# * PASSWORD_RETRY_AFTER : segundos indicados no cabeçalho Retry-After das respostas 503, para o cliente tentar novamente
+PASSWORD_ITERATIONS = int(os.environ.get('GESTOR_PASSWORD_ITERATIONS', '150000'))
+PASSWORD_WORKERS = int(os.environ.get('GESTOR_PASSWORD_WORKERS', str(os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.environ.get('GESTOR_PASSWORD_MAX_PENDING', str(8 * PASSWORD_WORKERS)))
+PASSWORD_RETRY_AFTER = int(os.environ.get('GESTOR_PASSWORD_RETRY_AFTER', '1'))
+
+# Configuração do servidor utilizado ao executar os serviços diretamente (ex.: python medicines.py). Ver server.py
+# * SERVER         : 'auto' utiliza o gunicorn quando há mais de um worker e o waitress caso contrário, falhando caso o
+#                    servidor não esteja instalado; 'gunicorn', 'waitress' ou 'werkzeug' forçam o servidor
+# * SERVER_HOST    : endereço em que os serviços aguardam conexões
+# * SERVER_WORKERS : número de processos de cada serviço (apenas com o gunicorn)
+# * SERVER_THREADS : número de threads que atendem requisições em cada processo
+# * DEBUG          : se '1', utiliza o servidor de desenvolvimento do Werkzeug com o depurador. Não deve ser utilizado em produção
+SERVER = os.environ.get('GESTOR_SERVER', 'auto')
+SERVER_HOST = os.environ.get('GESTOR_HOST', '127.0.0.1')
+SERVER_WORKERS = int(os.environ.get('GESTOR_WORKERS', '1'))
+SERVER_THREADS = int(os.environ.get('GESTOR_THREADS', '8'))
+DEBUG = os.environ.get('GESTOR_DEBUG', '0') == '1'
+
+# Se '1', os serviços registram as métricas das requisições e as disponibilizam em GET /gestor/metrics (ver metrics.py).
+# Desativado por padrão, já que a rota não exige token
+METRICS = os.environ.get('GESTOR_METRICS', '0') == '1'
+
+# Configuração do profiling das requisições com o cProfile (ver profiler.py)
+# * PROFILE        : se '1', administradores podem solicitar o profiling de uma requisição com o cabeçalho X-Gestor-Profile: 1
+# * PROFILE_SAMPLE : profiling de 1 a cada N requisições. '0' desativa a amostragem
+# * PROFILE_DIR    : diretório onde os profiles são gravados, em um subdiretório por serviço. Caso não seja definido,
+#                    utiliza o diretório profiles na raiz do projeto
+# * PROFILE_KEEP   : número de profiles mantidos por serviço. Os mais antigos são removidos
+PROFILE = os.environ.get('GESTOR_PROFILE', '0') == '1'
+PROFILE_SAMPLE = int(os.environ.get('GESTOR_PROFILE_SAMPLE', '0'))
+PROFILE_DIR = os.environ.get('GESTOR_PROFILE_DIR')
+PROFILE_KEEP = int(os.environ.get('GESTOR_PROFILE_KEEP', '50'))
+
+# Número máximo de tokens já verificados mantidos em cache por token_required
+TOKEN_CACHE_SIZE = int(os.environ.get('GESTOR_TOKEN_CACHE_SIZE', '4096'))
+
 
 def root_dir():
 	'''
@@ -25,40 +107,238 @@ def root_dir():
 	return os.path.dirname(os.path.realpath(__file__ + '/..'))
 
 
-def token_required(func):
+def db_dir():
 	'''
-	Força a validação via token JWT no método passado.
+	Retorna o diretório dos arquivos dos cadastros.
+	'''
+	return DB_DIR or f'{root_dir()}/database'
 
-	* func : método a receber a validação via token.
 
-	O método deve possuir como primeiro argumento, o usuário corrente (current_user).
+# Tokens já verificados. As revogações são compartilhadas entre os serviços pelo arquivo tokens.revoked, no diretório dos cadastros
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_LIFETIME, f'{db_dir()}/tokens.revoked')
 
-	O token deve ser passado para a URI através da chave 'x-access-token' no cabeçalho da requisição.
+
+def profile_dir():
 	'''
-	@wraps(func)
-	def decorated(*args, **kwargs):
-		token = None
+	Retorna o diretório dos profiles das requisições.
+	'''
+	return PROFILE_DIR or f'{root_dir()}/profiles'
+
+
+def get_list_args(fields):
+	'''
+	Lê os argumentos de paginação e projeção passados na query string das listagens.
 
-		if 'x-access-token' in request.headers:
-			token = request.headers.get('x-access-token', None)
+	* fields : campos do cadastro que podem ser solicitados através do argumento 'fields'.
 
-		if not token:
-			return jsonify({'message': 'Token is missing!'}), 403
+	Argumentos aceitos:
 
+	* limit  : número máximo de elementos na resposta. Valor deve ser um inteiro positivo.
+	* cursor : valor do campo 'next' retornado na página anterior.
+	* fields : campos a serem retornados em cada elemento, separados por vírgula.
+
+	Retorna uma tupla (limit, cursor, fields), com None para os argumentos não passados.
+	Caso algum argumento seja inválido, a requisição é abortada com erro 400.
+	'''
+	limit = request.args.get('limit', None)
+	if limit is not None:
+		# str.isdigit() aceita caracteres como '²', que o int() não converte
+		try:
+			limit = int(limit)
+
+		except ValueError:
+			abort(400)
+
+		if limit <= 0:
+			abort(400)
+
+	cursor = request.args.get('cursor', None)
+
+	requested_fields = request.args.get('fields', None)
+	if requested_fields is not None:
+		requested_fields = [field for field in requested_fields.split(',') if field]
+		if any(field not in fields for field in requested_fields):
+			abort(400)
+
+	return limit, cursor, requested_fields
+
+
+def jsonify(*args, **kwargs):
+	'''
+	Equivalente ao jsonify do Flask, mas utilizando o provedor de serialização JSON configurado.
+
+	Quando a formatação legível das respostas está ativa (modo debug ou JSONIFY_PRETTYPRINT_REGULAR),
+	  utiliza o jsonify do Flask.
+	'''
+	if json_provider.name == 'stdlib' or current_app.debug or current_app.config['JSONIFY_PRETTYPRINT_REGULAR']:
+		return flask_jsonify(*args, **kwargs)
+
+	if args and kwargs:
+		raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+
+	data = args[0] if len(args) == 1 else args or kwargs
+
+	return current_app.response_class(
+		json_provider.dumps(data, sort_keys=current_app.config['JSON_SORT_KEYS']) + '\n',
+		mimetype=current_app.config['JSONIFY_MIMETYPE']
+	)
+
+
+def uri_builder(endpoint, argument):
+	'''
+	Retorna uma função que monta a URI externa de um elemento a partir do seu ID, com o mesmo resultado de
+	  url_for(endpoint, <argument>=ID, _external=True).
+
+	A URI base é montada com url_for apenas uma vez por requisição, e a URI de cada elemento é obtida por
+	  concatenação. Os IDs do cadastro são UUIDs, que não precisam ser codificados na URI.
+
+	* endpoint : nome da função da rota do elemento (ex.: 'get_medicine')
+	* argument : nome do argumento da rota que recebe o ID (ex.: 'medicine_id')
+	'''
+	placeholder = '__id__'
+	key = '_uri_template_' + endpoint
+
+	def build(element_id):
+		template = g.get(key)
+		if template is None:
+			template = url_for(endpoint, _external=True, **{argument: placeholder}).split(placeholder, 1)
+			setattr(g, key, template)
+
+		return template[0] + str(element_id) + template[1]
+
+	return build
+
+
+def not_modified(etag):
+	'''
+	Retorna uma resposta 304 (Not Modified) caso o ETag passado esteja no cabeçalho If-None-Match da requisição.
+	Caso contrário, retorna None e a resposta deve ser montada normalmente, com o mesmo ETag.
+
+	O ETag deve ser obtido antes da leitura dos elementos: assim, uma alteração concorrente no máximo faz com que
+	  o cliente baixe novamente uma resposta que já possui, mas nunca que ele mantenha uma resposta desatualizada.
+
+	* etag : ETag da versão atual do recurso. Caso seja None, a requisição nunca é considerada condicional
+	'''
+	if etag is None or not request.if_none_match.contains_weak(etag):
+		return None
+
+	response = Response(status=304)
+	response.set_etag(etag)
+
+	return response
+
+
+def stream_export(name, elements, make_public):
+	'''
+	Retorna uma resposta que envia os elementos passados conforme são gerados, sem montar a resposta inteira em memória.
+
+	* name        : nome da lista de elementos na resposta JSON (ex.: 'medicines')
+	* elements    : gerador dos elementos do cadastro
+	* make_public : função que converte um elemento para o formato exibido na API
+
+	O formato da resposta é escolhido pelo argumento 'format' da query string:
+
+	* json   : objeto JSON no mesmo formato da listagem, enviado em partes. Formato padrão.
+	* ndjson : um elemento JSON por linha.
+	'''
+	export_format = request.args.get('format', 'json')
+	if export_format not in ('json', 'ndjson'):
+		abort(400)
+
+	def generate_ndjson():
+		for element in elements:
+			yield json_provider.dumps(make_public(element)) + '\n'
+
+	def generate_json():
+		yield '{"' + name + '": ['
+		separator = ''
+		for element in elements:
+			yield separator + json_provider.dumps(make_public(element))
+			separator = ', '
+
+		yield ']}\n'
+
+	if export_format == 'ndjson':
+		return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+	return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+
+# Mensagens das respostas às requisições recusadas por token_required, de acordo com o resultado da validação
+TOKEN_ERRORS = {
+	'missing'	: 'Token is missing!',
+	'invalid'	: 'Token is invalid!',
+	'inactive'	: 'You are inactive!'
+}
+
+
+def authenticate():
+	'''
+	Valida o token JWT da requisição corrente.
+
+	Retorna uma tupla (resultado, usuário corrente). O resultado é 'cached' ou 'verified' quando o token é aceito
+	  (obtido do cache ou com a assinatura verificada), e 'missing', 'invalid' ou 'inactive' caso contrário, situação
+	  em que o usuário corrente é None.
+	'''
+	token = None
+
+	if 'x-access-token' in request.headers:
+		token = request.headers.get('x-access-token', None)
+
+	if not token:
+		return 'missing', None
+
+	result = 'cached'
+	data = token_cache.get(token)
+	if data is None:
+		result = 'verified'
 		try:
 			data = jwt.decode(token, SECRET_KEY)
 
 		except Exception:
-			return jsonify({'message': 'Token is invalid!'}), 403
+			return 'invalid', None
+
+		if not token_cache.put(token, data):
+			return 'invalid', None
+
+	current_user = {
+			'id'		: data['id'],
+			'status'	: data['status'],
+			'admin'		: data['admin']
+	}
+
+	if not current_user['admin'] and current_user['status'] == 'inactive':
+		return 'inactive', None
+
+	return result, current_user
+
+
+def token_required(func):
+	'''
+	Força a validação via token JWT no método passado.
+
+	* func : método a receber a validação via token.
+
+	O método deve possuir como primeiro argumento, o usuário corrente (current_user).
+
+	O token deve ser passado para a URI através da chave 'x-access-token' no cabeçalho da requisição.
+
+	Os tokens já verificados são mantidos em token_cache até expirarem, de forma que requisições
+	  repetidas com o mesmo token não verificam a assinatura novamente.
+
+	A duração de cada validação é registrada nas métricas do serviço, caso estejam ativas (ver metrics.py).
+	'''
+	@wraps(func)
+	def decorated(*args, **kwargs):
+		start = time.perf_counter()
+		result, current_user = authenticate()
 
-		current_user = {
-				'id'		: data['id'],
-				'status'	: data['status'],
-				'admin'		: data['admin']
-		}
+		metrics = current_app.extensions.get('metrics')
+		if metrics is not None:
+			metrics.observe_token(result, time.perf_counter() - start)
 
-		if not current_user['admin'] and current_user['status'] == 'inactive':
-			return jsonify({'message': 'You are inactive!'}), 403
+		if current_user is None:
+			return jsonify({'message': TOKEN_ERRORS[result]}), 403
 
 		return func(current_user, *args, **kwargs)
 
@@ -0,0 +1,96 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import uuid
+import atexit
+import base64
+import shutil
+import tempfile
+import pytest
+
+# Os módulos dos serviços importam uns aos outros pelo nome, como ao serem executados do diretório services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services'))
+
+# Os cadastros dos serviços são criados ao importá-los, então a configuração precisa ser definida antes.
+# O diretório é removido depois que os serviços gravam as alterações pendentes ao serem encerrados (atexit é LIFO)
+DB_DIR = tempfile.mkdtemp(prefix='gestor-tests-')
+atexit.register(shutil.rmtree, DB_DIR, True)
+
+os.environ['GESTOR_DB_DIR'] = DB_DIR
+os.environ['GESTOR_PROFILE_DIR'] = os.path.join(DB_DIR, 'profiles')
+os.environ['GESTOR_PASSWORD_ITERATIONS'] = '1000'
+os.environ['GESTOR_METRICS'] = '1'
+os.environ['GESTOR_PROFILE'] = '1'
+
+
+def basic_auth(username, password):
+	'''
+	Retorna o cabeçalho de autenticação básica utilizado no login e no cadastro de usuários.
+	'''
+	credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+
+	return {'Authorization': 'Basic ' + credentials}
+
+
+def login(client, username, password='senha'):
+	'''
+	Faz o login do usuário e retorna o cabeçalho com o token.
+	'''
+	response = client.post('/gestor/login', headers=basic_auth(username, password))
+	assert response.status_code == 200
+
+	return {'x-access-token': response.get_json()['token']}
+
+
+@pytest.fixture(scope='session')
+def users_client():
+	import users
+
+	return users.api.test_client()
+
+
+@pytest.fixture(scope='session')
+def medicines_client():
+	import medicines
+
+	return medicines.api.test_client()
+
+
+@pytest.fixture(scope='session')
+def clients_client():
+	import clients
+
+	return clients.api.test_client()
+
+
+@pytest.fixture(scope='session')
+def admin(users_client):
+	'''
+	Cabeçalho com o token do administrador: o primeiro usuário cadastrado se torna administrador.
+	'''
+	assert users_client.post('/gestor/register', headers=basic_auth('admin', 'senha')).status_code == 200
+
+	return login(users_client, 'admin')
+
+
+@pytest.fixture
+def new_user(users_client, admin):
+	'''
+	Retorna uma função que cadastra um usuário comum com nome único e retorna seu nome e o cabeçalho com o token.
+	'''
+	def new_user():
+		username = f'user-{uuid.uuid4().hex[:8]}'
+		assert users_client.post('/gestor/register', headers=basic_auth(username, 'senha')).status_code == 200
+
+		return username, login(users_client, username)
+
+	return new_user
+
+
+@pytest.fixture
+def user(new_user):
+	'''
+	Cabeçalho com o token de um usuário comum cadastrado para o teste.
+	'''
+	return new_user()[1]
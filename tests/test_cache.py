@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes dos caches dos serviços (ver services/cache.py).
+'''
+
+import jwt
+import time
+import utils
+from cache import LRUCache, TokenCache
+
+
+def test_revocation_is_shared_through_the_file(tmp_path):
+	'''
+	Um token revogado em um cache deixa de ser aceito pelos demais caches que utilizam o mesmo arquivo das revogações,
+	  mesmo que já estivesse armazenado neles.
+	'''
+	path = str(tmp_path / 'tokens.revoked')
+	users_cache = TokenCache(16, 60, path)
+	medicines_cache = TokenCache(16, 60, path)
+
+	data = {'id': 'u1', 'iat': int(time.time()) - 1, 'exp': int(time.time()) + 60}
+	assert medicines_cache.put('token', data)
+	assert medicines_cache.get('token') == data
+
+	users_cache.revoke('u1')
+
+	assert medicines_cache.get('token') is None
+	assert not medicines_cache.put('token', data)
+	assert not TokenCache(16, 60, path).put('token', data)
+
+
+def test_deactivated_user_is_rejected_by_another_service(users_client, medicines_client, admin, new_user, monkeypatch):
+	'''
+	O token de um usuário desativado no serviço de usuários é recusado pelo serviço de remédios, que o tinha em cache.
+	'''
+	username, headers = new_user()
+	user_id = jwt.decode(headers['x-access-token'], utils.SECRET_KEY)['id']
+
+	# O serviço de remédios é simulado com um cache próprio, como se estivesse em outro processo
+	medicines_cache = TokenCache(utils.TOKEN_CACHE_SIZE, utils.TOKEN_LIFETIME, f'{utils.db_dir()}/tokens.revoked')
+	monkeypatch.setattr(utils, 'token_cache', medicines_cache)
+
+	assert medicines_client.get('/gestor/medicines', headers=headers).status_code == 200
+	assert medicines_cache.stats()['size'] >= 1
+
+	assert users_client.put(f'/gestor/users/{user_id}/deactivate', headers=admin).status_code == 200
+
+	assert medicines_client.get('/gestor/medicines', headers=headers).status_code == 403
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+	'''
+	O cache descarta o elemento menos utilizado recentemente, e não armazena valores lidos antes de uma invalidação.
+	'''
+	cache = LRUCache(2)
+
+	cache.put('a', 1, cache.token())
+	cache.put('b', 2, cache.token())
+	assert cache.get('a') == 1
+
+	cache.put('c', 3, cache.token())
+	assert cache.get('b') is None
+	assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+	token = cache.token()
+	cache.invalidate(['a'])
+	cache.put('a', 'lido antes da alteração', token)
+	assert cache.get('a') is None
+
+	assert cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 3, 'misses': 2, 'evictions': 1}
+
+
+def test_medicine_cache_and_token_cache(medicines_client, admin, user):
+	'''
+	A segunda consulta de um remédio é respondida pelo cache, que é invalidado quando o remédio é alterado.
+	  O token já verificado também é obtido do cache nas requisições seguintes.
+	'''
+	response = medicines_client.post('/gestor/medicines', json={'name': 'Remédio do cache', 'dosage': '1mg', 'manufacturer': 'X'}, headers=user)
+	medicine_uri = response.get_json()['medicine']['uri']
+	path = medicine_uri[medicine_uri.index('/gestor'):]
+
+	def stats():
+		return medicines_client.get('/gestor/medicines/cache', headers=admin).get_json()
+
+	before = stats()
+	assert medicines_client.get(path, headers=user).get_json()['medicine']['dosage'] == '1mg'
+	assert medicines_client.get(path, headers=user).get_json()['medicine']['dosage'] == '1mg'
+	after = stats()
+
+	assert after['cache']['misses'] - before['cache']['misses'] == 1
+	assert after['cache']['hits'] - before['cache']['hits'] == 1
+	assert after['tokens']['hits'] - before['tokens']['hits'] >= 3
+
+	assert medicines_client.put(f'{path}/sales', json={'20190101': 2}, headers=user).status_code == 200
+	assert medicines_client.get(path, headers=user).get_json()['medicine']['sales'] == {'20190101': 2}
+
+	assert medicines_client.get('/gestor/medicines/cache', headers=user).status_code == 403
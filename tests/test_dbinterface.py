@@ -0,0 +1,91 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes da classe DBInterface (ver services/dbinterface.py).
+'''
+
+import pytest
+import threading
+import utils
+from dbinterface import DBInterface
+
+
+@pytest.fixture
+def open_db(tmp_path, monkeypatch):
+	'''
+	Retorna uma função que abre o cadastro de teste em um diretório temporário. Os cadastros abertos são fechados ao final do teste.
+	'''
+	monkeypatch.setattr(utils, 'DB_DIR', str(tmp_path))
+	databases = []
+
+	def open_db(**kwargs):
+		db = DBInterface('items', ['name', 'owner'], indexes=['owner'], **kwargs)
+		databases.append(db)
+
+		return db
+
+	yield open_db
+
+	for db in databases:
+		db.close()
+
+
+def test_failing_subscriber_does_not_fail_the_write(open_db):
+	'''
+	Uma função registrada que lança uma exceção não altera o resultado da escrita já gravada, e não impede que as
+	  demais funções sejam avisadas nem que a alteração seja registrada para os outros processos.
+	'''
+	db = open_db(storage_mode='direct', multiprocess=True)
+	other = open_db(storage_mode='direct', multiprocess=True)
+
+	def failing(argument):
+		raise TypeError('subscriber failure')
+
+	notified = []
+	for subscribe in (db.subscribe, db.subscribe_elements, db.subscribe_operations):
+		subscribe(failing)
+
+	db.subscribe(notified.append)
+	db.subscribe_elements(notified.append)
+
+	created = db.create_element({'name': 'a', 'owner': 'x'})
+	assert created != -1
+
+	updated = db.update_element({'owner': 'y'}, 'id', created['id'])
+	assert [element['owner'] for element in updated] == ['y']
+
+	assert notified == [[created['id']], {created['id']: created}, [created['id']], {created['id']: updated[0]}]
+
+	# O outro cadastro lê a alteração do registro compartilhado
+	assert [element['id'] for element in other.get_element('owner', 'y')] == [created['id']]
+
+
+def test_update_with_merges_inside_the_write(open_db):
+	'''
+	update_element_with e update_elements_with calculam os campos a partir do valor gravado no momento da escrita,
+	  então atualizações concorrentes de um mesmo elemento não se sobrescrevem.
+	'''
+	db = open_db(storage_mode='direct')
+	created = db.create_element({'name': 'a', 'owner': []})
+
+	def append(value):
+		return lambda element: {'owner': element['owner'] + [value]}
+
+	def update(worker):
+		for value in range(50):
+			if worker % 2:
+				assert db.update_element_with('id', created['id'], append((worker, value))) != -1
+
+			else:
+				assert db.update_elements_with([created['id']], append((worker, value))) != -1
+
+	threads = [threading.Thread(target=update, args=(worker,)) for worker in range(4)]
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	assert len(db.get_element('id', created['id'])[0]['owner']) == 200
+	assert db.update_element_with('id', 'inexistente', append(0)) == []
+	assert db.update_elements_with([created['id'], 'inexistente'], append(0)) == []
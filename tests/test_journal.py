@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes da reaplicação e da compactação do journal do JournalEngine (ver services/engines.py).
+'''
+
+import os
+import shutil
+from engines import JournalEngine
+
+
+def contents(engine):
+	'''
+	Retorna os documentos do motor como um dicionário doc_id -> documento.
+	'''
+	return {document.doc_id: dict(document) for document in engine.all()}
+
+
+def crash_copy(source_dir, target_dir):
+	'''
+	Copia os arquivos de um cadastro ainda aberto, simulando o estado do disco após uma queda do processo.
+	'''
+	shutil.copytree(source_dir, target_dir)
+
+	return os.path.join(target_dir, 'items.json')
+
+
+def test_replay_discards_truncated_last_record(tmp_path):
+	'''
+	Um registro incompleto no final do journal é descartado, e os registros anteriores são reaplicados.
+	'''
+	os.makedirs(tmp_path / 'db')
+
+	engine = JournalEngine(str(tmp_path / 'db' / 'items.json'), compact_threshold=1000)
+	first = engine.insert({'name': 'a', 'quantity': 1})
+	second = engine.insert({'name': 'b', 'quantity': 2})
+	engine.update({'quantity': 3}, [first])
+	expected = contents(engine)
+
+	engine.update({'quantity': 4}, [second])
+
+	path = crash_copy(tmp_path / 'db', tmp_path / 'crash')
+	journal_path = os.path.splitext(path)[0] + '.journal'
+
+	with open(journal_path, 'rb') as f:
+		lines = f.readlines()
+
+	assert len(lines) == 4
+
+	# Metade do último registro, sem a quebra de linha, como em uma gravação interrompida
+	with open(journal_path, 'wb') as f:
+		f.writelines(lines[:-1])
+		f.write(lines[-1][:len(lines[-1]) // 2])
+
+	reopened = JournalEngine(path, compact_threshold=1000)
+	try:
+		assert contents(reopened) == expected
+		assert reopened.insert({'name': 'c', 'quantity': 5}) == second + 1
+
+	finally:
+		reopened.close()
+		engine.close()
+
+	# O journal reaplicado é incorporado ao snapshot na abertura, então o registro incompleto não volta
+	reopened = JournalEngine(path, compact_threshold=1000)
+	try:
+		assert contents(reopened) == {**expected, second + 1: {'name': 'c', 'quantity': 5}}
+
+	finally:
+		reopened.close()
+
+
+def test_compact_then_reopen(tmp_path):
+	'''
+	Os documentos são mantidos após a compactação, tanto ao reabrir o cadastro fechado quanto após uma queda
+	  com registros gravados no novo journal.
+	'''
+	os.makedirs(tmp_path / 'db')
+	path = str(tmp_path / 'db' / 'items.json')
+	journal_path = os.path.splitext(path)[0] + '.journal'
+
+	engine = JournalEngine(path, compact_threshold=1000)
+	doc_ids = [engine.insert({'name': name, 'tags': [name], 'stock': {'min': 1}}) for name in 'abcd']
+	engine.update({'stock': {'min': 2}}, doc_ids[:2])
+	engine.remove([doc_ids[3]])
+
+	engine.compact()
+	assert os.path.getsize(journal_path) == 0
+
+	# Registros gravados no journal depois da compactação
+	engine.update_many({doc_ids[0]: {'name': 'a2'}, doc_ids[2]: {'tags': []}})
+	engine.insert({'name': 'e', 'tags': [], 'stock': {}})
+	expected = contents(engine)
+
+	path_after_crash = crash_copy(tmp_path / 'db', tmp_path / 'crash')
+	reopened = JournalEngine(path_after_crash, compact_threshold=1000)
+	try:
+		assert contents(reopened) == expected
+
+	finally:
+		reopened.close()
+
+	# O fechamento incorpora o journal ao snapshot e remove o journal vazio
+	engine.close()
+	assert not os.path.exists(journal_path)
+
+	reopened = JournalEngine(path, compact_threshold=1000)
+	try:
+		assert contents(reopened) == expected
+		assert reopened.insert({'name': 'f'}) == max(expected) + 1
+
+	finally:
+		reopened.close()
@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes das rotas do serviço de remédios.
+'''
+
+import io
+import threading
+import uuid
+from medicines import CSV_CHUNK_SIZE
+
+
+def create_medicine(client, headers, **fields):
+	'''
+	Cadastra um remédio com nome único e retorna seu ID.
+	'''
+	medicine = {'name': f'Remédio {uuid.uuid4().hex[:8]}', 'dosage': '10mg', 'manufacturer': 'Fabricante', 'price': 1.0, **fields}
+	response = client.post('/gestor/medicines', json=medicine, headers=headers)
+	assert response.status_code == 200
+
+	return response.get_json()['medicine']['uri'].rsplit('/', 1)[1]
+
+
+def post_csv(client, path, headers, text):
+	'''
+	Envia o texto passado como o arquivo CSV do formulário da rota.
+	'''
+	data = {'file': (io.BytesIO(text.encode('utf-8')), 'arquivo.csv')}
+
+	return client.post(path, data=data, headers=headers, content_type='multipart/form-data')
+
+
+def get_medicine(client, headers, medicine_id):
+	'''
+	Retorna o remédio com o ID passado, no formato público.
+	'''
+	response = client.get(f'/gestor/medicines/{medicine_id}', headers=headers)
+	assert response.status_code == 200
+
+	return response.get_json()['medicine']
+
+
+def test_csv_update_rejects_sales_column(medicines_client, user):
+	'''
+	O registro de vendas não pode ser substituído pela importação CSV dos dados dos remédios.
+	'''
+	medicine_id = create_medicine(medicines_client, user)
+
+	response = post_csv(medicines_client, '/gestor/medicines/update', user, f'id,sales\n{medicine_id},muitas\n')
+
+	assert response.status_code == 400
+	assert get_medicine(medicines_client, user, medicine_id)['sales'] == {}
+
+
+def test_concurrent_sales_updates_are_not_lost(medicines_client, user):
+	'''
+	Atualizações concorrentes das vendas de um mesmo remédio, pela rota JSON e pela importação CSV, não descartam as vendas umas das outras.
+	'''
+	medicine_id = create_medicine(medicines_client, user)
+	failures = []
+
+	def put_sales(worker):
+		for day in range(20):
+			response = medicines_client.put(f'/gestor/medicines/{medicine_id}/sales', json={f'2019{worker:02d}{day + 1:02d}': 1}, headers=user)
+			if response.status_code != 200:
+				failures.append(response.status_code)
+
+	def post_sales(worker):
+		for day in range(20):
+			response = post_csv(medicines_client, '/gestor/medicines/sales', user, f'id,2019{worker:02d}{day + 1:02d}\n{medicine_id},1\n')
+			if response.status_code != 200:
+				failures.append(response.status_code)
+
+	threads = [threading.Thread(target=target, args=(worker,)) for worker, target in enumerate([put_sales, post_sales] * 4, 1)]
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	assert failures == []
+	assert len(get_medicine(medicines_client, user, medicine_id)['sales']) == 160
+
+
+def test_csv_update_is_all_or_nothing(medicines_client, user):
+	'''
+	Uma linha inválida ou um remédio inexistente em um bloco posterior do arquivo não deixa os blocos anteriores gravados.
+	'''
+	medicine_id = create_medicine(medicines_client, user, dosage='10mg')
+	rows = ''.join(f'{medicine_id},{dose}mg,\n' for dose in range(CSV_CHUNK_SIZE + 1))
+
+	response = post_csv(medicines_client, '/gestor/medicines/update', user, f'id,dosage,price\n{rows}{medicine_id},20mg,caro\n')
+	assert response.status_code == 400
+
+	response = post_csv(medicines_client, '/gestor/medicines/update', user, f'id,dosage,price\n{rows}inexistente,20mg,\n')
+	assert response.status_code == 404
+
+	assert get_medicine(medicines_client, user, medicine_id)['dosage'] == '10mg'
+
+	response = post_csv(medicines_client, '/gestor/medicines/update', user, f'id,dosage,price\n{rows}{medicine_id},,2.5\n')
+	assert response.status_code == 200
+	assert [(medicine['dosage'], medicine['price']) for medicine in response.get_json()['medicines']] == [(f'{CSV_CHUNK_SIZE}mg', 2.5)]
+
+
+def test_etag_returns_304_until_the_medicine_changes(medicines_client, user):
+	'''
+	A consulta com o ETag da versão atual retorna 304, tanto por ID quanto na listagem, até que o remédio seja alterado.
+	'''
+	medicine_id = create_medicine(medicines_client, user)
+	path = f'/gestor/medicines/{medicine_id}'
+
+	for route in (path, '/gestor/medicines'):
+		etag = medicines_client.get(route, headers=user).headers['ETag']
+
+		response = medicines_client.get(route, headers={**user, 'If-None-Match': etag})
+		assert response.status_code == 304
+		assert response.headers['ETag'] == etag
+
+	etag = medicines_client.get(path, headers=user).headers['ETag']
+	assert medicines_client.put(f'{path}/sales', json={'20190101': 1}, headers=user).status_code == 200
+
+	response = medicines_client.get(path, headers={**user, 'If-None-Match': etag})
+	assert response.status_code == 200
+	assert response.headers['ETag'] != etag
+	assert response.get_json()['medicine']['sales'] == {'20190101': 1}
+
+
+def test_pagination_walks_every_medicine_once(medicines_client, user):
+	'''
+	As páginas, percorridas com o cursor 'next', contêm cada remédio da listagem completa uma única vez, na ordem dos IDs,
+	  apenas com os campos solicitados.
+	'''
+	for _ in range(5):
+		create_medicine(medicines_client, user)
+
+	everything = [medicine['uri'] for medicine in medicines_client.get('/gestor/medicines', headers=user).get_json()['medicines']]
+
+	pages = []
+	cursor = ''
+	while cursor is not None:
+		response = medicines_client.get(f'/gestor/medicines?limit=2&fields=name&cursor={cursor}' if cursor else '/gestor/medicines?limit=2&fields=name', headers=user)
+		assert response.status_code == 200
+
+		page = response.get_json()
+		assert len(page['medicines']) <= 2
+		assert all(set(medicine) == {'uri', 'name'} for medicine in page['medicines'])
+
+		pages.extend(medicine['uri'] for medicine in page['medicines'])
+		cursor = page['next']
+
+	assert sorted(pages) == sorted(everything)
+	assert pages == sorted(pages, key=lambda uri: uri.rsplit('/', 1)[1])
+
+	for query in ('limit=0', 'limit=dois', 'fields=senha'):
+		assert medicines_client.get(f'/gestor/medicines?{query}', headers=user).status_code == 400
+
+
+def test_csv_sales_import_spans_several_chunks(medicines_client, user):
+	'''
+	A importação de vendas com mais linhas que um bloco combina as linhas de um mesmo remédio em blocos diferentes,
+	  e uma linha inválida no último bloco não deixa nenhuma venda gravada.
+	'''
+	first = create_medicine(medicines_client, user)
+	second = create_medicine(medicines_client, user)
+	lines = [((first, second)[line % 2], line) for line in range(1, CSV_CHUNK_SIZE + 2)]
+	rows = ''.join(f'{medicine_id},{line},\n' for medicine_id, line in lines)
+
+	response = post_csv(medicines_client, '/gestor/medicines/sales', user, f'id,20190101,20190102\n{rows}{first},,muitas\n')
+	assert response.status_code == 400
+	assert response.get_json()['rows'] == [{'line': CSV_CHUNK_SIZE + 3, 'id': first, 'error': 'Invalid quantity for 20190102'}]
+	assert get_medicine(medicines_client, user, first)['sales'] == {}
+
+	response = post_csv(medicines_client, '/gestor/medicines/sales', user, f'id,20190101,20190102\n{rows}{first},,7\n')
+	assert response.status_code == 200
+	assert len(response.get_json()['medicines']) == 2
+
+	# A última linha de cada remédio prevalece
+	last = dict(lines)
+	assert get_medicine(medicines_client, user, first)['sales'] == {'20190101': last[first], '20190102': 7}
+	assert get_medicine(medicines_client, user, second)['sales'] == {'20190101': last[second]}
+
+
+def test_mostconsumed_top_k_and_negative_most(medicines_client, user):
+	'''
+	O relatório retorna os 'most' remédios mais consumidos no intervalo, em ordem decrescente. Um valor negativo
+	  retorna todos os remédios exceto os 'most' menos consumidos, como o corte [:most] da lista ordenada.
+	'''
+	quantities = {create_medicine(medicines_client, user): quantity for quantity in (5, 30, 10, 20)}
+	for medicine_id, quantity in quantities.items():
+		assert medicines_client.put(f'/gestor/medicines/{medicine_id}/sales', json={'20400101': quantity, '20400301': 1000}, headers=user).status_code == 200
+
+	ranking = sorted(quantities, key=quantities.get, reverse=True)
+
+	def mostconsumed(most):
+		response = medicines_client.get('/gestor/medicines/mostconsumed', json={'most': most, 'begin': '20400101', 'end': '20400131'})
+		assert response.status_code == 200
+
+		return [(medicine['uri'].rsplit('/', 1)[1], medicine['quantity']) for medicine in response.get_json()['medicines']]
+
+	expected = [(medicine_id, quantities[medicine_id]) for medicine_id in ranking]
+
+	assert mostconsumed(2) == expected[:2]
+	assert mostconsumed(10) == expected
+	assert mostconsumed(-1) == expected[:-1]
+	assert mostconsumed(-10) == []
+	assert mostconsumed(0) == []
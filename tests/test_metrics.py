@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes das métricas dos serviços (ver services/metrics.py).
+'''
+
+import re
+
+
+def samples(text):
+	'''
+	Retorna as amostras do texto no formato do Prometheus, como um dicionário (nome, rótulos) -> valor.
+	'''
+	result = {}
+	for line in text.splitlines():
+		if not line or line.startswith('#'):
+			continue
+
+		match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+		assert match is not None, line
+
+		labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match.group(2) or '')))
+		result[(match.group(1), labels)] = float(match.group(3))
+
+	return result
+
+
+def test_metrics_count_requests_cache_and_storage(medicines_client, user):
+	'''
+	As métricas registram as requisições por rota e código de resposta, os acertos do cache e as operações no cadastro.
+	'''
+	response = medicines_client.post('/gestor/medicines', json={'name': 'Remédio das métricas', 'dosage': '1mg', 'manufacturer': 'X'}, headers=user)
+	medicine_uri = response.get_json()['medicine']['uri']
+	path = medicine_uri[medicine_uri.index('/gestor'):]
+
+	before = samples(medicines_client.get('/gestor/metrics').get_data(as_text=True))
+	medicines_client.get(path, headers=user)
+	medicines_client.get(path, headers=user)
+	medicines_client.get('/gestor/medicines/inexistente', headers=user)
+
+	response = medicines_client.get('/gestor/metrics')
+	assert response.status_code == 200
+	assert response.mimetype == 'text/plain'
+	after = samples(response.get_data(as_text=True))
+
+	def delta(name, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		return after.get(key, 0) - before.get(key, 0)
+
+	assert delta('gestor_http_requests_total', method='GET', endpoint='/gestor/medicines/<medicine_id>', status='200') == 2
+	assert delta('gestor_http_requests_total', method='GET', endpoint='/gestor/medicines/<medicine_id>', status='404') == 1
+	assert delta('gestor_http_request_duration_seconds_count', method='GET', endpoint='/gestor/medicines/<medicine_id>') == 3
+	assert delta('gestor_cache_hits_total', cache='medicines') == 1
+	assert delta('gestor_token_check_duration_seconds_count', result='cached') == 3
+
+	# A primeira consulta, que não estava no cache, lê o remédio do cadastro
+	reads = [key for key in after if key[0] == 'gestor_db_operations_total' and {('table', 'medicines'), ('operation', 'get_element')} <= set(key[1])]
+	assert sum(after[key] - before.get(key, 0) for key in reads) == 1
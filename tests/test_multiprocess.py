@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes do modo multiprocesso da DBInterface: dois processos escrevendo no mesmo cadastro.
+'''
+
+import os
+import functools
+import multiprocessing
+import pytest
+import utils
+import processes
+import dbinterface
+from dbinterface import DBInterface
+
+
+# Elementos criados por cada processo
+COUNT = 40
+
+# Tamanho do registro de alterações que força sua reinicialização várias vezes durante o teste
+SMALL_CHANGELOG = 512
+
+OWNERS = ['a', 'b']
+
+
+def open_db(storage_mode):
+	'''
+	Abre o cadastro de teste no modo multiprocesso.
+	'''
+	return DBInterface('items', ['name', 'owner'], indexes=['owner'], unique=['name'], storage_mode=storage_mode, multiprocess=True)
+
+
+def writer(storage_mode, owner, barrier, results):
+	'''
+	Cria COUNT elementos e atualiza um deles, ao mesmo tempo que o outro processo, e depois informa os elementos vistos.
+	'''
+	db = open_db(storage_mode)
+	try:
+		barrier.wait()
+
+		created = [db.create_element({'name': f'{owner}-{i}', 'owner': owner})['id'] for i in range(COUNT)]
+		db.update_element({'name': f'{owner}-renamed'}, 'id', created[0])
+
+		# Os dois processos terminaram de escrever
+		barrier.wait()
+
+		results.put({
+			'owner'		: owner,
+			'created'	: created,
+			'seen'		: sorted(element['id'] for element in db.get_all_elements()),
+			'by_owner'	: {other: len(db.get_element('owner', other)) for other in OWNERS},
+			'renamed'	: sorted(element['owner'] for element in db.get_element('name', f'{OWNERS[0]}-renamed')) if owner == OWNERS[1] else None
+		})
+
+	finally:
+		db.close()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='os processos herdam a configuração do teste via fork')
+@pytest.mark.parametrize('rotate', [False, True], ids=['changelog', 'rotated-changelog'])
+@pytest.mark.parametrize('storage_mode', ['direct', 'writebehind', 'journal', 'sqlite'])
+def test_two_processes_see_all_ids(tmp_path, monkeypatch, storage_mode, rotate):
+	'''
+	Cada processo vê os elementos criados pelos dois, pelo ID e pelos índices, inclusive quando o registro de alterações
+	  é reiniciado durante as escritas e os processos precisam recarregar o cadastro inteiro.
+	'''
+	monkeypatch.setattr(utils, 'DB_DIR', str(tmp_path))
+	if rotate:
+		monkeypatch.setattr(dbinterface, 'ChangeLog', functools.partial(processes.ChangeLog, max_size=SMALL_CHANGELOG))
+
+	context = multiprocessing.get_context('fork')
+	barrier = context.Barrier(len(OWNERS))
+	results = context.Queue()
+
+	workers = [context.Process(target=writer, args=(storage_mode, owner, barrier, results)) for owner in OWNERS]
+	for worker in workers:
+		worker.start()
+
+	try:
+		reports = {report['owner']: report for report in (results.get(timeout=120) for worker in workers)}
+
+	finally:
+		for worker in workers:
+			worker.join(timeout=30)
+
+	assert all(worker.exitcode == 0 for worker in workers)
+
+	created = sorted(element_id for report in reports.values() for element_id in report['created'])
+	assert len(created) == len(set(created)) == COUNT * len(OWNERS)
+
+	for report in reports.values():
+		assert report['seen'] == created
+		assert report['by_owner'] == {owner: COUNT for owner in OWNERS}
+
+	assert reports[OWNERS[1]]['renamed'] == [OWNERS[0]]
+
+	if rotate:
+		# O registro foi reiniciado: as alterações dos dois processos não cabem em um único arquivo
+		assert os.path.getsize(tmp_path / 'items.changes') < SMALL_CHANGELOG
+
+	db = open_db(storage_mode)
+	try:
+		assert sorted(element['id'] for element in db.get_all_elements()) == created
+
+	finally:
+		db.close()
@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes do profiling das requisições (ver services/profiler.py).
+'''
+
+from flask import Flask
+from profiler import RequestProfiler, PROFILE_HEADER, PROFILE_ID_HEADER
+
+
+def profiled_app(directory, **kwargs):
+	'''
+	Retorna um aplicativo Flask com uma rota simples e o profiling das requisições habilitado.
+	'''
+	app = Flask(__name__)
+	profiler = RequestProfiler(str(directory), **kwargs)
+
+	app.before_request(profiler.start)
+	app.after_request(profiler.tag)
+	app.teardown_request(profiler.finish)
+	app.add_url_rule('/ping', 'ping', lambda: 'pong')
+
+	return app, profiler
+
+
+def test_header_is_ignored_unless_enabled(tmp_path, admin):
+	'''
+	Sem header=True (GESTOR_PROFILE=1), o cabeçalho de um administrador não dispara o profiling.
+	'''
+	app, profiler = profiled_app(tmp_path, header=False)
+
+	response = app.test_client().get('/ping', headers={**admin, PROFILE_HEADER: '1'})
+
+	assert response.status_code == 200
+	assert PROFILE_ID_HEADER not in response.headers
+	assert profiler.list() == []
+
+
+def test_header_of_admin_when_enabled(tmp_path, admin, user):
+	'''
+	Com header=True, apenas o cabeçalho enviado por um administrador dispara o profiling.
+	'''
+	app, profiler = profiled_app(tmp_path, header=True)
+	client = app.test_client()
+
+	assert PROFILE_ID_HEADER not in client.get('/ping', headers={**user, PROFILE_HEADER: '1'}).headers
+
+	response = client.get('/ping', headers={**admin, PROFILE_HEADER: '1'})
+	profiles = profiler.list()
+
+	assert [profile['id'] for profile in profiles] == [response.headers[PROFILE_ID_HEADER]]
+	assert profiles[0]['trigger'] == 'header'
+	assert profiles[0]['path'] == '/ping'
+
+
+def test_profile_routes_of_the_service(medicines_client, admin, user):
+	'''
+	O profiling solicitado por um administrador ao serviço de remédios é listado e pode ser obtido pelas rotas de consulta,
+	  que exigem o token de um administrador.
+	'''
+	response = medicines_client.get('/gestor/medicines', headers={**admin, PROFILE_HEADER: '1'})
+	assert response.status_code == 200
+	profile_id = response.headers[PROFILE_ID_HEADER]
+
+	profiles = medicines_client.get('/gestor/profiles', headers=admin).get_json()['profiles']
+	profile = next(profile for profile in profiles if profile['id'] == profile_id)
+	assert (profile['method'], profile['path'], profile['status'], profile['trigger']) == ('GET', '/gestor/medicines', 200, 'header')
+
+	report = medicines_client.get(f'/gestor/profiles/{profile_id}?format=text', headers=admin)
+	assert report.status_code == 200
+	assert 'get_all_medicines' in report.get_data(as_text=True)
+
+	stats = medicines_client.get(f'/gestor/profiles/{profile_id}', headers=admin)
+	assert stats.status_code == 200
+	assert stats.mimetype == 'application/octet-stream'
+
+	assert medicines_client.get(f'/gestor/profiles/{profile_id}?format=html', headers=admin).status_code == 400
+	assert medicines_client.get('/gestor/profiles/inexistente', headers=admin).status_code == 404
+	assert medicines_client.get('/gestor/profiles', headers=user).status_code == 403
+	assert medicines_client.get(f'/gestor/profiles/{profile_id}', headers=user).status_code == 403
@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes da preservação dos tipos dos valores no SQLiteEngine (ver services/engines.py).
+'''
+
+import pytest
+from engines import SQLiteEngine
+from jsonprovider import StdlibJSONProvider, OrjsonProvider, orjson
+
+
+# Valores de todos os tipos aceitos nos documentos, incluindo os que o SQLite converteria entre si
+VALUES = {
+	'text'		: 'Remédio ção',
+	'empty'		: '',
+	'numeric'	: '10',
+	'integer'	: 10,
+	'big'		: 2 ** 62,
+	'negative'	: -3,
+	'real'		: 2.5,
+	'whole'		: 1.0,
+	'true'		: True,
+	'false'		: False,
+	'null'		: None,
+	'list'		: [1, 'a', None, [2.5]],
+	'empty_list': [],
+	'dict'		: {'20191220': 3, 'nested': {'a': [True]}},
+	'empty_dict': {}
+}
+
+PROVIDERS = [StdlibJSONProvider] + ([OrjsonProvider] if orjson is not None else [])
+
+
+def assert_same(document, expected):
+	'''
+	Verifica que o documento possui os valores esperados, com os mesmos tipos (ex.: True e 1 são diferentes).
+	'''
+	assert dict(document) == expected
+	for field, value in expected.items():
+		assert type(document[field]) is type(value), field
+
+
+@pytest.fixture(params=PROVIDERS, ids=lambda provider: provider.__name__)
+def open_engine(request, tmp_path):
+	'''
+	Retorna uma função que abre o cadastro de teste com o provedor JSON do parâmetro. Os motores abertos são fechados ao final do teste.
+	'''
+	engines = []
+
+	def open_engine():
+		engine = SQLiteEngine(str(tmp_path / 'items.sqlite3'), 'items', list(VALUES), json_provider=request.param())
+		engines.append(engine)
+
+		return engine
+
+	yield open_engine
+
+	for engine in engines:
+		engine.close()
+
+
+def test_values_round_trip(open_engine):
+	'''
+	Os valores lidos são iguais aos gravados e do mesmo tipo, inclusive após reabrir o banco.
+	'''
+	engine = open_engine()
+	doc_id = engine.insert(VALUES)
+
+	assert_same(engine.get(doc_id), VALUES)
+	assert_same(engine.all()[0], VALUES)
+	assert_same(next(engine.iterate()), VALUES)
+	assert engine.get_many([doc_id], fields=['dict', 'true']) == [{'dict': VALUES['dict'], 'true': True}]
+
+	engine.close()
+	assert_same(open_engine().get(doc_id), VALUES)
+
+
+def test_updates_keep_types(open_engine):
+	'''
+	As atualizações podem trocar o tipo de um campo e criar campos não declarados, que também preservam o tipo.
+	'''
+	engine = open_engine()
+	doc_id = engine.insert(VALUES)
+
+	updated = engine.update({'integer': '10', 'text': 7, 'null': [None], 'extra': {'x': False}}, [doc_id])
+	expected = {**VALUES, 'integer': '10', 'text': 7, 'null': [None], 'extra': {'x': False}}
+
+	assert_same(updated[0], expected)
+	assert_same(engine.get(doc_id), expected)
+
+
+def test_search_distinguishes_types(open_engine):
+	'''
+	A busca compara o valor e o tipo: 1, 1.0, '1' e True não são considerados iguais.
+	'''
+	engine = open_engine()
+	doc_ids = {repr(value): engine.insert({'integer': value}) for value in (1, 1.0, '1', True, None, [1], {'a': 1})}
+
+	for value in (1, 1.0, '1', True, None, [1], {'a': 1}):
+		found = engine.search('integer', value)
+
+		assert [document.doc_id for document in found] == [doc_ids[repr(value)]]
+		assert_same(found[0], {'integer': value})
+
+	assert engine.search('integer', 2) == []
+	assert engine.search('missing', 1) == []
@@ -0,0 +1,31 @@
+# -*- coding:utf-8 -*-
+
+'''
+Testes das rotas do serviço de usuários.
+'''
+
+import passwords
+from conftest import basic_auth
+
+
+class FullSemaphore():
+	'''
+	Semáforo que nunca é adquirido, simulando o conjunto de threads das senhas saturado.
+	'''
+
+	def acquire(self, blocking=True):
+		return False
+
+
+def test_saturated_password_pool_returns_json_503(users_client, admin, monkeypatch):
+	'''
+	Com o conjunto de threads das senhas saturado, login e cadastro respondem 503 em JSON, com o cabeçalho Retry-After.
+	'''
+	monkeypatch.setattr(passwords, '_pending', FullSemaphore())
+
+	for path in ('/gestor/login', '/gestor/register'):
+		response = users_client.post(path, headers=basic_auth('admin', 'senha'))
+
+		assert response.status_code == 503
+		assert response.get_json() == {'error': 'Service Unavailable'}
+		assert int(response.headers['Retry-After']) >= 1